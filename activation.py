@@ -0,0 +1,336 @@
+# Copyright Menno Nijboer, 2015
+
+from __future__ import division
+
+import math
+
+import numpy as np
+
+# Array backed storage of the presentation history of all places, used to calculate
+# the activations of the spacing model in one go instead of place by place.
+# Every presentation is a row: the index of the place, the time it was presented and
+# the decay belonging to that presentation (nan until the decay is known).
+class ActivationEngine(object):
+	def __init__(self, numItems, capacity=256):
+		self.numItems = numItems
+		self.numRows = 0
+		self.times = np.zeros(capacity, dtype=np.float64)
+		self.decays = np.zeros(capacity, dtype=np.float64)
+		self.items = np.zeros(capacity, dtype=np.intp)
+		self.acts = np.zeros(numItems, dtype=np.float64)
+
+		# rows of each item, in order of presentation
+		self.itemRows = [[] for i in range(numItems)]
+		self.numDecays = [0]*numItems
+		# items whose decayed history changed since the last time a cache looked
+		self.changed = set()
+
+	# make sure there is room for at least rows more rows
+	def grow(self, rows=1):
+		if self.numRows + rows <= len(self.times):
+			return
+		capacity = max(2*len(self.times), self.numRows + rows)
+		for name in ('times', 'decays', 'items'):
+			old = getattr(self, name)
+			new = np.zeros(capacity, dtype=old.dtype)
+			new[:self.numRows] = old[:self.numRows]
+			setattr(self, name, new)
+
+	def addPresentation(self, item, t):
+		self.grow()
+		row = self.numRows
+		self.times[row] = t
+		self.decays[row] = np.nan
+		self.items[row] = item
+		self.itemRows[item].append(row)
+		self.numRows += 1
+		return row
+
+	# decays are assigned to the presentations of an item in the order they were shown
+	def addDecay(self, item, d):
+		row = self.itemRows[item][self.numDecays[item]]
+		self.decays[row] = d
+		self.numDecays[item] += 1
+		self.changed.add(item)
+		return row
+
+	# all presentations of an item that has none yet, the first len(decays) of them with a decay
+	def addHistory(self, item, times, decays):
+		n = len(times)
+		self.grow(n)
+		first = self.numRows
+		self.times[first:first+n] = times
+		self.decays[first:first+n] = np.nan
+		self.decays[first:first+len(decays)] = decays
+		self.items[first:first+n] = item
+		self.itemRows[item].extend(range(first, first+n))
+		self.numDecays[item] += len(decays)
+		self.numRows += n
+		if len(decays) > 0:
+			self.changed.add(item)
+
+	def numPresentations(self, item):
+		return len(self.itemRows[item])
+
+	# rows of an item that have a decay, oldest first
+	def decayedRows(self, item):
+		return self.itemRows[item][:self.numDecays[item]]
+
+	def takeChanged(self):
+		changed = self.changed
+		self.changed = set()
+		return changed
+
+	# sum of the decayed traces of every presentation that has a decay, per item. The sums are
+	# taken in order of presentation, as the old per place loops did, but np.power can be 1 ulp
+	# off math.pow, so activations match those loops to within floating-point rounding.
+	def traces(self, curTime):
+		n = self.numRows
+		decays = self.decays[:n]
+		valid = ~np.isnan(decays)
+		contrib = np.power(curTime - self.times[:n][valid], -decays[valid])
+		return np.bincount(self.items[:n][valid], weights=contrib, minlength=self.numItems)
+
+	# activation of the first count items, calculated in one batch
+	def activations(self, curTime, count):
+		traces = self.traces(curTime)
+		self.acts[:count] = np.log(traces[:count])
+		return self.acts[:count]
+
+	# activation of a single item
+	def activation(self, item, curTime):
+		rows = np.array(self.decayedRows(item), dtype=np.intp)
+		contrib = np.power(curTime - self.times[rows], -self.decays[rows])
+		return float(np.log(sum(contrib.tolist())))
+
+# Keeps the activations of the engine up to date between trials without going over the
+# whole presentation history every time. Per item the most recent presentations are kept
+# in a small fixed size window and are evaluated exactly. Older presentations are summed
+# into a tail, stored as a Taylor expansion (value and first two derivatives) around the
+# time it was last calculated. When only the clock has moved the tail is shifted with the
+# expansion, and only recalculated when the error bound of the expansion exceeds the
+# tolerance. Items that received a new decay move their oldest window entry into the tail.
+class ActivationCache(object):
+	def __init__(self, engine, window=32, tolerance=1e-6):
+		self.engine = engine
+		self.window = window
+		self.tolerance = tolerance
+		n = engine.numItems
+
+		# exact part, kept in order of presentation: padding has weight 0
+		self.recentTimes = np.zeros((n, window), dtype=np.float64)
+		self.recentDecays = np.zeros((n, window), dtype=np.float64)
+		self.recentWeights = np.zeros((n, window), dtype=np.float64)
+		self.recentCount = [0]*n
+
+		# approximated part, with its own copy of the presentations for recalculation
+		self.tailCount = [0]*n
+		self.tailTimes = [np.zeros(16, dtype=np.float64) for i in range(n)]
+		self.tailDecays = [np.zeros(16, dtype=np.float64) for i in range(n)]
+		self.tailRef = np.zeros(n, dtype=np.float64)   # time the tail was calculated
+		self.tailAge = np.ones(n, dtype=np.float64)    # age of the youngest tail presentation at tailRef
+		self.tailDecay = np.zeros(n, dtype=np.float64) # largest absolute decay in the tail
+		self.tailS0 = np.zeros(n, dtype=np.float64)
+		self.tailS1 = np.zeros(n, dtype=np.float64)
+		self.tailS2 = np.zeros(n, dtype=np.float64)
+
+		self.acts = np.zeros(n, dtype=np.float64)
+		self.numTailRefreshes = 0
+
+	# bring the items that received new decays up to date
+	def update(self, curTime):
+		for item in self.engine.takeChanged():
+			rows = self.engine.decayedRows(item)[self.tailCount[item] + self.recentCount[item]:]
+			if len(rows) > self.window:
+				# a whole history at once: everything before the last window goes to the tail
+				self.addTails(item, rows[:-self.window], curTime)
+				rows = rows[-self.window:]
+			for row in rows:
+				self.addRecent(item, row, curTime)
+
+	def addRecent(self, item, row, curTime):
+		k = self.recentCount[item]
+		if k == self.window:
+			# window is full, the oldest presentation moves to the tail
+			self.addTail(item, self.recentTimes[item, 0], self.recentDecays[item, 0], curTime)
+			self.recentTimes[item, :-1] = self.recentTimes[item, 1:]
+			self.recentDecays[item, :-1] = self.recentDecays[item, 1:]
+			k -= 1
+		self.recentTimes[item, k] = self.engine.times[row]
+		self.recentDecays[item, k] = self.engine.decays[row]
+		self.recentWeights[item, k] = 1
+		self.recentCount[item] = k + 1
+
+	def addTail(self, item, t, d, curTime):
+		n = self.tailCount[item]
+		if n == len(self.tailTimes[item]):
+			self.tailTimes[item] = np.concatenate((self.tailTimes[item], np.zeros(n, dtype=np.float64)))
+			self.tailDecays[item] = np.concatenate((self.tailDecays[item], np.zeros(n, dtype=np.float64)))
+		self.tailTimes[item][n] = t
+		self.tailDecays[item][n] = d
+		self.tailCount[item] = n + 1
+		if self.tailCount[item] > 1 and t < self.tailRef[item]:
+			# presented before the tail was calculated: add it to the expansion
+			a = self.tailRef[item] - t
+			f = pow(a, -d)
+			self.tailS0[item] += f
+			self.tailS1[item] += -d*f/a
+			self.tailS2[item] += d*(d+1)*f/(a*a)
+			self.tailAge[item] = min(self.tailAge[item], a)
+			self.tailDecay[item] = max(self.tailDecay[item], abs(d))
+		else:
+			self.refreshTail(item, curTime)
+
+	# move the window and the given rows to the tail, in one go
+	def addTails(self, item, rows, curTime):
+		k = self.recentCount[item]
+		times = np.concatenate((self.recentTimes[item, :k], self.engine.times[rows]))
+		decays = np.concatenate((self.recentDecays[item, :k], self.engine.decays[rows]))
+		self.recentWeights[item] = 0
+		self.recentCount[item] = 0
+		n = self.tailCount[item]
+		if n + len(times) > len(self.tailTimes[item]):
+			capacity = max(2*len(self.tailTimes[item]), n + len(times))
+			self.tailTimes[item] = np.concatenate((self.tailTimes[item][:n], np.zeros(capacity - n, dtype=np.float64)))
+			self.tailDecays[item] = np.concatenate((self.tailDecays[item][:n], np.zeros(capacity - n, dtype=np.float64)))
+		self.tailTimes[item][n:n+len(times)] = times
+		self.tailDecays[item][n:n+len(times)] = decays
+		self.tailCount[item] = n + len(times)
+		self.refreshTail(item, curTime)
+
+	# calculate the tail of an item exactly at the current time
+	def refreshTail(self, item, curTime):
+		n = self.tailCount[item]
+		ages = curTime - self.tailTimes[item][:n]
+		d = self.tailDecays[item][:n]
+		f = np.power(ages, -d)
+		self.tailRef[item] = curTime
+		self.tailS0[item] = f.sum()
+		self.tailS1[item] = (-d*f/ages).sum()
+		self.tailS2[item] = (d*(d+1)*f/(ages*ages)).sum()
+		self.tailAge[item] = ages.min()
+		self.tailDecay[item] = np.abs(d).max()
+		self.numTailRefreshes += 1
+
+	# refresh the tails of items where the expansion is no longer accurate enough, in either
+	# direction: a planned trial asks for activations ahead of the clock
+	def checkTails(self, items, curTime):
+		delta = curTime - self.tailRef[items]
+		d = self.tailDecay[items]
+		bound = d*(d+1)*(d+2)/6 * np.power(np.abs(delta)/self.tailAge[items], 3)
+		for i in np.nonzero(bound > self.tolerance)[0]:
+			self.refreshTail(items[i], curTime)
+
+	def traces(self, items, curTime):
+		delta = curTime - self.tailRef[items]
+		tail = self.tailS0[items] + delta*self.tailS1[items] + 0.5*delta*delta*self.tailS2[items]
+		recent = self.recentWeights[items]*np.power(curTime - self.recentTimes[items], -self.recentDecays[items])
+		return recent.sum(axis=-1) + tail
+
+	# activations of the first count items at the current time
+	def activations(self, curTime, count):
+		self.update(curTime)
+		items = np.arange(count)
+		self.checkTails(items, curTime)
+		self.acts[:count] = np.log(self.traces(items, curTime))
+		return self.acts[:count]
+
+	# activations of the given items at the current time
+	def activationsOf(self, items, curTime):
+		self.update(curTime)
+		items = np.array(items, dtype=np.intp)
+		self.checkTails(items, curTime)
+		return np.log(self.traces(items, curTime))
+
+	# activation of a single item
+	def activation(self, item, curTime):
+		self.update(curTime)
+		items = np.array([item])
+		self.checkTails(items, curTime)
+		return float(np.log(self.traces(items, curTime)[0]))
+
+# Time at which the activation of presentations (times and decays, in order of presentation)
+# falls to threshold. The activation only decreases after the last presentation, so there is
+# one such time. It is found with Newton's method on the log of the age since the last
+# presentation, in which the activation is close to a straight line, starting where the last
+# presentation alone would reach the threshold. A step that leaves the bracket is replaced by
+# bisection. Returns -inf without presentations and inf when the activation never gets that low.
+def crossingTime(times, decays, threshold, tolerance=1e-9):
+	if len(times) == 0:
+		return -np.inf
+	if np.any(np.diff(times) < 0):
+		raise ValueError('presentation times are not in order of presentation')
+	last = float(times[-1])
+	dLast = float(decays[-1])
+
+	# sum of the traces and its derivative at an age, with numpy only for long histories
+	if len(times) > 32:
+		offsets = last - times
+		def traces(age):
+			a = offsets + age
+			f = np.power(a, -decays)
+			return (f.sum(), -(decays*f/a).sum())
+	else:
+		terms = list(zip((last - times).tolist(), decays.tolist()))
+		def traces(age):
+			s = 0.0
+			ds = 0.0
+			for (offset, d) in terms:
+				a = offset + age
+				f = a**-d
+				s += f
+				ds -= d*f/a
+			return (s, ds)
+
+	# activation minus threshold, and its derivative to u, at age e^u
+	def excess(u):
+		age = math.exp(u)
+		(s, ds) = traces(age)
+		return (math.log(s) - threshold, ds*age/s)
+
+	(lo, hi) = (-30.0, 30.0)  # ages of 1e-13 s and 1e13 s
+	if excess(hi)[0] > 0:
+		return np.inf
+	u = min(max(-threshold / dLast, lo), hi) if dLast > 0 else 0.0
+	for i in range(100):
+		(g, slope) = excess(u)
+		step = g/slope if slope < 0 else 0.0
+		if abs(step) < tolerance:
+			return last + math.exp(u - step)
+		if g > 0:
+			lo = u
+		else:
+			hi = u
+		u -= step
+		if not (lo < u < hi):
+			u = 0.5*(lo + hi)
+	return last + math.exp(u)
+
+# The time at which the activation of every item falls below the threshold. Activations only
+# decay between presentations, so the crossing time of an item changes only when one of its
+# presentations gets a decay, and only then is it worked out again. The items that are below the
+# threshold at a time are those with an earlier crossing time, found in one pass over the table.
+class CrossingTimes(object):
+	def __init__(self, engine, threshold):
+		self.engine = engine
+		self.threshold = threshold
+		self.crossings = np.full(engine.numItems, np.inf)
+
+	def update(self, item):
+		rows = np.array(self.engine.decayedRows(item), dtype=np.intp)
+		self.set(item, crossingTime(self.engine.times[rows], self.engine.decays[rows], self.threshold))
+
+	# crossing time of an item if its first presentation without a decay got decay d
+	def crossingWith(self, item, d):
+		rows = np.array(self.engine.itemRows[item][:self.engine.numDecays[item]+1], dtype=np.intp)
+		decays = self.engine.decays[rows]
+		decays[-1] = d
+		return crossingTime(self.engine.times[rows], decays, self.threshold)
+
+	# an item with a crossing time that is already known
+	def set(self, item, t):
+		self.crossings[item] = t
+
+	# items that fall (or fell) below the threshold at time t or before, in order of item
+	def due(self, t):
+		return np.nonzero(self.crossings <= t)[0].tolist()
@@ -0,0 +1,266 @@
+# Copyright Menno Nijboer, 2015
+
+# Combines the results of a whole study into one tab separated file, with the trials of every
+# session (<prefix>_all.txt) behind the name of the subject, the number of the session for that
+# subject and its date (from <prefix>.xml). The trials of every session are parsed in parallel,
+# each into a shard (in <output>.shards) that already has the keys in front of every row, and
+# the combined file is the shards put together byte for byte. What is known about each session
+# is kept in an index next to the output (<output>.index), keyed on the modification times of
+# its files, so a re-run only parses the sessions that are new or changed, and those that got
+# another session number because a session of the same subject came before them.
+#
+#     python aggregate.py results               (writes study.txt)
+#     python aggregate.py -o all.txt lab1 lab2
+
+from __future__ import division, print_function
+
+import os
+import sys
+import json
+import codecs
+import shutil
+import hashlib
+import multiprocessing
+from optparse import OptionParser
+
+try:
+	import xml.etree.cElementTree as ElementTree
+except ImportError:
+	import xml.etree.ElementTree as ElementTree
+
+from results import spssHeader
+
+indexVersion = 2
+keyColumns = ['Subjectname', 'Session', 'Date']
+allSuffix = '_all.txt'
+
+def fileStamp(filename):
+	try:
+		st = os.stat(filename)
+	except OSError:
+		return None
+	return [st.st_mtime, st.st_size]
+
+# the _all.txt files below the given directories, except the output itself
+def findSessions(paths, exclude=()):
+	exclude = set(os.path.abspath(f) for f in exclude)
+	found = []
+	for path in paths:
+		if os.path.isfile(path):
+			found.append(path)
+			continue
+		for (directory, dirs, files) in os.walk(path):
+			dirs.sort()
+			for name in sorted(files):
+				filename = os.path.join(directory, name)
+				if name.endswith(allSuffix) and os.path.abspath(filename) not in exclude:
+					found.append(filename)
+	return found
+
+def xmlFile(allFile):
+	return allFile[:-len(allSuffix)] + '.xml'
+
+# subject name and date from the first element of the xml, without reading the rest
+def sessionHeader(filename):
+	for (event, elem) in ElementTree.iterparse(filename, events=('start',)):
+		return (elem.get('subjectname', ''), elem.get('date', ''))
+	return ('', '')
+
+# keys go in a tab separated file
+def cleanKey(value):
+	return (u'%s' % (value,)).replace(u'\t', u' ').replace(u'\r', u' ').replace(u'\n', u' ')
+
+# the shard of a session, named after the path of its _all.txt
+def shardName(filename):
+	return hashlib.md5(os.path.abspath(filename).encode('utf-8')).hexdigest() + '.txt'
+
+# Parse the trials of one session into its shard, with keys = [subject name, session number,
+# date] in front of every row: the job of a worker process. job = (filename, keys, shard).
+# Returns (filename, rows, error), where error is None when the session is usable.
+def writeShard(job):
+	(filename, keys, shard) = job
+	keyText = u'\t'.join(cleanKey(k) for k in keys) + u'\t'
+	tmpFile = '%s.%d.tmp' % (shard, os.getpid())
+	rows = 0
+	try:
+		f = codecs.open(filename, 'r', 'utf-8')
+		try:
+			if f.readline() != spssHeader:
+				raise ValueError('unexpected header')
+			columns = spssHeader.count('\t') + 1
+			out = codecs.open(tmpFile, 'w', 'utf-8')
+			try:
+				for (n, line) in enumerate(f):
+					line = line.rstrip('\r\n')
+					if line.count('\t') + 1 != columns:
+						raise ValueError('line %d has %d columns instead of %d' % (n+2, line.count('\t') + 1, columns))
+					out.write(keyText + line + u'\n')
+					rows += 1
+			finally:
+				out.close()
+		finally:
+			f.close()
+	except (IOError, ValueError) as e:
+		if os.path.exists(tmpFile):
+			os.remove(tmpFile)
+		return (filename, 0, '%s' % e)
+	replaceFile(tmpFile, shard)
+	return (filename, rows, None)
+
+def loadIndex(indexFile):
+	try:
+		f = open(indexFile, 'r')
+	except IOError:
+		return {}
+	try:
+		index = json.load(f)
+	except ValueError:
+		return {}
+	finally:
+		f.close()
+	if index.get('version') != indexVersion:
+		return {}
+	return index['sessions']
+
+def replaceFile(tmpFile, filename):
+	try:
+		os.rename(tmpFile, filename)
+	except OSError:
+		# windows does not replace an existing file
+		os.remove(filename)
+		os.rename(tmpFile, filename)
+
+def saveIndex(indexFile, sessions):
+	tmpFile = '%s.%d.tmp' % (indexFile, os.getpid())
+	f = open(tmpFile, 'w')
+	try:
+		json.dump({'version': indexVersion, 'sessions': sessions}, f, sort_keys=True, indent=1)
+	finally:
+		f.close()
+	replaceFile(tmpFile, indexFile)
+
+# Session numbers per subject, counting the sessions in order of date. Returns the filenames
+# in the order of the combined file and the keys of each of them.
+def numberSessions(sessions):
+	order = sorted(sessions, key=lambda f: (sessions[f]['subjectname'], sessions[f]['date'], sessions[f]['prefix'], f))
+	keys = {}
+	(subject, number) = (None, 0)
+	for filename in order:
+		entry = sessions[filename]
+		if entry['subjectname'] != subject:
+			(subject, number) = (entry['subjectname'], 0)
+		number += 1
+		keys[filename] = [entry['subjectname'], number, entry['date']]
+	return (order, keys)
+
+def runJobs(function, jobList, jobs):
+	if len(jobList) < 2 or jobs == 1:
+		return [function(job) for job in jobList]
+	pool = multiprocessing.Pool(jobs)
+	try:
+		results = list(pool.imap_unordered(function, jobList, chunksize=8))
+		pool.close()
+	except:
+		pool.terminate()
+		raise
+	finally:
+		pool.join()
+	return results
+
+# Write the combined file from the shards of the sessions in order
+def writeStudy(output, shardDir, entries):
+	tmpFile = '%s.%d.tmp' % (output, os.getpid())
+	out = open(tmpFile, 'wb')
+	try:
+		out.write(('\t'.join(keyColumns) + '\t' + spssHeader).encode('utf-8'))
+		for entry in entries:
+			f = open(os.path.join(shardDir, entry['shard']), 'rb')
+			try:
+				shutil.copyfileobj(f, out)
+			finally:
+				f.close()
+	finally:
+		out.close()
+	replaceFile(tmpFile, output)
+
+# Bring the index and the shards of output up to date with the sessions under paths and rewrite
+# output if anything changed. Returns (sessions, parsed, errors): the sessions in the study, the
+# number read on this run and (filename, error) of the sessions left out.
+def aggregate(paths, output='study.txt', jobs=None, force=False):
+	indexFile = output + '.index'
+	shardDir = output + '.shards'
+	cached = {} if force else loadIndex(indexFile)
+	filenames = findSessions(paths, exclude=[output])
+	if not os.path.isdir(shardDir):
+		os.makedirs(shardDir)
+
+	sessions = {}
+	errors = []
+	read = set()
+	for filename in filenames:
+		entry = cached.get(filename)
+		if (entry is not None and entry['stamp'] == fileStamp(filename) and entry['xmlStamp'] == fileStamp(xmlFile(filename)) and
+		    os.path.exists(os.path.join(shardDir, entry['shard']))):
+			sessions[filename] = entry
+			continue
+		# new or changed: only the header of the xml is read here, the trials in a worker
+		read.add(filename)
+		entry = {'stamp': fileStamp(filename), 'xmlStamp': fileStamp(xmlFile(filename)), 'shard': shardName(filename), 'keys': None,
+		         'prefix': os.path.basename(filename)[:-len(allSuffix)]}
+		try:
+			if entry['xmlStamp'] is not None:
+				(entry['subjectname'], entry['date']) = sessionHeader(xmlFile(filename))
+			else:
+				(entry['subjectname'], entry['date']) = ('', '')
+		except (IOError, SyntaxError) as e:
+			# SyntaxError covers the ParseError of a broken xml
+			errors.append((filename, '%s' % e))
+			continue
+		sessions[filename] = entry
+
+	# (re)write the shards whose keys are not those of their place in the study; a session that
+	# turns out to be unusable changes the numbers of the sessions of its subject after it
+	while True:
+		(order, keys) = numberSessions(sessions)
+		jobList = [(f, keys[f], os.path.join(shardDir, sessions[f]['shard'])) for f in order if sessions[f]['keys'] != keys[f]]
+		failed = False
+		for (filename, rows, error) in runJobs(writeShard, jobList, jobs):
+			read.add(filename)
+			if error is not None:
+				errors.append((filename, error))
+				del sessions[filename]
+				failed = True
+			else:
+				sessions[filename]['keys'] = keys[filename]
+				sessions[filename]['rows'] = rows
+		if not failed:
+			break
+
+	changed = len(read) > 0 or set(sessions) != set(cached) or not os.path.exists(output)
+	if changed:
+		writeStudy(output, shardDir, [sessions[f] for f in order])
+		saveIndex(indexFile, sessions)
+		# shards of sessions that are no longer in the study
+		used = set(e['shard'] for e in sessions.values())
+		for name in os.listdir(shardDir):
+			if name not in used:
+				os.remove(os.path.join(shardDir, name))
+	return (sessions, len(read), errors)
+
+def main(argv):
+	parser = OptionParser(usage='%prog [options] [directory or _all.txt ...]')
+	parser.add_option('-o', '--output', default='study.txt', help='combined file to write (default: study.txt), its index is <output>.index')
+	parser.add_option('-j', '--jobs', type='int', default=None, help='number of worker processes (default: all cores)')
+	parser.add_option('-f', '--force', action='store_true', default=False, help='read every session again instead of using the index')
+	(options, args) = parser.parse_args(argv)
+
+	(sessions, parsed, errors) = aggregate(args or ['results'], options.output, options.jobs, options.force)
+	for (filename, error) in errors:
+		print('%s: left out, %s' % (filename, error))
+	subjects = len(set(e['subjectname'] for e in sessions.values()))
+	rows = sum(e['rows'] for e in sessions.values())
+	print('%d sessions of %d subjects, %d trials in %s (%d sessions read, %d from the index)' % (len(sessions), subjects, rows, options.output, parsed - len(errors), len(sessions) - parsed + len(errors)))
+	return 1 if errors else 0
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,62 @@
+# Copyright Menno Nijboer, 2015
+
+from __future__ import division
+
+import os
+
+import pyglet
+from pyglet.image.atlas import TextureAtlas
+
+# the small ui images, packed together in one texture so their sprites share it
+atlasImages = ['marker', 'marker_right', 'marker_wrong', 'radius', 'glow', 'arrow', 'place_popup', 'feedback_box']
+
+# center the placement anchors of an image
+def center(img):
+	img.anchor_x = img.width // 2
+	img.anchor_y = img.height // 2
+	return img
+
+# Loads the images of img/ when they are first asked for. The ui images are all loaded into
+# one atlas the first time one of them is needed, the others each become their own texture.
+# Needs a gl context, so create it after the window.
+class AssetManager(object):
+	def __init__(self, directory='img', atlasNames=atlasImages, atlasSize=512):
+		self.directory = directory
+		self.atlasNames = atlasNames
+		self.atlasSize = atlasSize
+		self.atlas = None
+		self.images = {}
+		self.textures = {}
+
+	def path(self, name):
+		return os.path.join(self.directory, name + '.png')
+
+	def buildAtlas(self):
+		try:
+			self.atlas = TextureAtlas(self.atlasSize, self.atlasSize, border=True)
+		except TypeError:
+			# pyglet before 1.4 has no border around atlas images
+			self.atlas = TextureAtlas(self.atlasSize, self.atlasSize)
+		for name in self.atlasNames:
+			self.images[name] = center(self.atlas.add(pyglet.image.load(self.path(name))))
+
+	# an image with centered anchors, for sprites and blitting
+	def image(self, name):
+		img = self.images.get(name)
+		if img is None:
+			if name in self.atlasNames:
+				self.buildAtlas()
+				img = self.images[name]
+			else:
+				img = self.images[name] = center(pyglet.image.load(self.path(name)).get_texture())
+		return img
+
+	# an image as a texture of its own, anchored at the bottom left
+	def texture(self, name):
+		tex = self.textures.get(name)
+		if tex is None:
+			tex = self.textures[name] = pyglet.image.load(self.path(name)).get_texture()
+		return tex
+
+	def tileable(self, name):
+		return pyglet.image.TileableTexture.create_for_image(pyglet.image.load(self.path(name)))
@@ -0,0 +1,222 @@
+# Copyright Menno Nijboer, 2015
+
+# Benchmarks of the hot paths of TopoStudy on synthetic maps and sessions of growing size.
+# Every benchmark reports per call latency percentiles. Results can be saved as a json
+# baseline, and later runs compared against it: a slowdown beyond the tolerance makes the
+# comparison (and the exit code) fail.
+
+from __future__ import division, print_function
+
+import os
+import sys
+import json
+import random
+import shutil
+import tempfile
+import timeit
+from optparse import OptionParser
+
+import numpy as np
+
+from teacher import loadMapPlaces, findClickedPlace
+from activation import ActivationEngine, ActivationCache, CrossingTimes
+from spatial import PlaceGrid
+from simulate import Simulator, SyntheticLearner, syntheticPlaces
+
+timer = timeit.default_timer
+
+mapSizes = [32, 1000, 10000, 100000]
+sessionLengths = [100, 1000, 10000, 100000]
+defaultSessionLength = 1000  # used when scaling the map size
+defaultMapSize = 32          # used when scaling the session length
+
+percentiles = [50, 90, 99]
+
+def summarize(latencies):
+	ordered = sorted(latencies)
+	n = len(ordered)
+	stats = {'calls': n, 'mean': sum(ordered) / max(1, n), 'max': ordered[-1] if n else 0.0}
+	for p in percentiles:
+		stats['p%d' % p] = ordered[min(n-1, int(p/100*n))] if n else 0.0
+	return stats
+
+def timeCalls(func, args, repeat):
+	latencies = []
+	for i in range(repeat):
+		t0 = timer()
+		func(*args)
+		latencies.append(timer() - t0)
+	return latencies
+
+def timeEach(func, argsList):
+	latencies = []
+	for args in argsList:
+		t0 = timer()
+		func(*args)
+		latencies.append(timer() - t0)
+	return latencies
+
+# a simulated session of numTrials trials, spacing condition only
+def runSession(numPlaces, numTrials, seed=0):
+	sim = Simulator(syntheticPlaces(numPlaces, seed=seed), True, float('inf'))
+	sim.maxTrials = numTrials
+	return sim.runSession(SyntheticLearner(seed=seed), seed=seed)
+
+def writeMap(filename, places):
+	f = open(filename, 'w')
+	f.write('<?xml version="1.0"?>\n<map>\n')
+	for p in places:
+		f.write('\t<place x="%d" y="%d" name="%s" size="%s" />\n' % (p.x, p.y, p.name, p.size))
+	f.write('</map>\n')
+	f.close()
+
+# the benchmarks: every one yields (name, latencies)
+def benchSession(numPlaces, numTrials, repeat):
+	session = runSession(numPlaces, numTrials)
+	yield ('getNextTrial/places=%d/trials=%d' % (numPlaces, numTrials), session.latencies)
+
+	teacher = session.teacher
+	yield ('activation/places=%d/trials=%d' % (numPlaces, numTrials), timeCalls(teacher.activation, (teacher.placeCount,), repeat))
+
+	# saveResults writes to results/ in the working directory
+	cwd = os.getcwd()
+	tmp = tempfile.mkdtemp()
+	try:
+		os.chdir(tmp)
+		os.mkdir('results')
+		yield ('saveResults/places=%d/trials=%d' % (numPlaces, numTrials), timeCalls(teacher.saveResults, (), max(1, repeat // 100)))
+	finally:
+		os.chdir(cwd)
+		shutil.rmtree(tmp)
+
+def benchMap(numPlaces, repeat):
+	places = syntheticPlaces(numPlaces)
+	rng = random.Random(numPlaces)
+	clicks = [(rng.randrange(0, 1194), rng.randrange(0, 760)) for i in range(repeat)]
+	yield ('findClickedPlace/places=%d' % numPlaces, timeEach(findClickedPlace, [(places, x, y) for (x, y) in clicks]))
+
+	grid = PlaceGrid(places)
+	yield ('getClickedPlace/places=%d' % numPlaces, timeEach(grid.nearest, clicks))
+
+	tmp = tempfile.mkdtemp()
+	try:
+		filename = os.path.join(tmp, 'map.xml')
+		writeMap(filename, places)
+		yield ('loadMapPlaces/places=%d' % numPlaces, timeCalls(loadMapPlaces, (filename, False), max(1, repeat // 100)))
+		loadMapPlaces(filename)
+		yield ('loadMapPlaces/cached/places=%d' % numPlaces, timeCalls(loadMapPlaces, (filename,), max(1, repeat // 100)))
+	finally:
+		shutil.rmtree(tmp)
+
+# choosing the item to rehearse among numItems learned items: the crossing times against a
+# scan of all activations. Every call rehearses the chosen item, as a session would.
+def benchRehearsal(numItems, repeat, threshold=-0.5):
+	rng = random.Random(numItems)
+	engine = ActivationEngine(numItems)
+	for i in range(numItems):
+		# presentations of an item are in order of time
+		for t in sorted(rng.uniform(0, 100) for k in range(3)):
+			engine.addPresentation(i, t)
+			engine.addDecay(i, rng.uniform(0.2, 0.5))
+	cache = ActivationCache(engine)
+	crossings = CrossingTimes(engine, threshold)
+	for i in range(numItems):
+		crossings.update(i)
+	state = {'time': 200.0, 'item': 0}
+
+	# the lowest activation among the items below the threshold, as Teacher.nextRehearsal
+	def withCrossings():
+		crossings.update(state['item'])
+		due = crossings.due(state['time'])
+		if due:
+			state['item'] = min(zip(cache.activationsOf(due, state['time']).tolist(), due))[1]
+		else:
+			state['item'] = int(np.argmin(cache.activations(state['time'], numItems)))
+		rehearse()
+
+	def withScan():
+		state['item'] = int(np.argmin(cache.activations(state['time'], numItems)))
+		rehearse()
+
+	# the next choice comes a trial later, never at the time of the presentation itself
+	def rehearse():
+		engine.addPresentation(state['item'], state['time'])
+		engine.addDecay(state['item'], 0.3)
+		state['time'] += 5.0
+
+	yield ('nextRehearsal/crossings/items=%d' % numItems, timeCalls(withCrossings, (), repeat))
+	yield ('nextRehearsal/scan/items=%d' % numItems, timeCalls(withScan, (), repeat))
+
+def runBenchmarks(maxMapSize, maxSessionLength, repeat, selected=None):
+	jobs = []
+	for n in mapSizes:
+		if n <= maxMapSize:
+			jobs.append((benchMap, (n, repeat)))
+			jobs.append((benchSession, (n, defaultSessionLength, repeat)))
+			jobs.append((benchRehearsal, (n, repeat)))
+	for n in sessionLengths:
+		if n <= maxSessionLength and n != defaultSessionLength:
+			jobs.append((benchSession, (defaultMapSize, n, repeat)))
+
+	results = {}
+	for (bench, args) in jobs:
+		for (name, latencies) in bench(*args):
+			if selected and selected not in name:
+				continue
+			results[name] = summarize(latencies)
+			printResult(name, results[name])
+	return results
+
+def printResult(name, stats):
+	line = '%-45s %8d calls  p50 %10.1f us  p90 %10.1f us  p99 %10.1f us  max %10.1f us' % (name, stats['calls'], 1e6*stats['p50'], 1e6*stats['p90'], 1e6*stats['p99'], 1e6*stats['max'])
+	print(line)
+	sys.stdout.flush()
+
+# a benchmark fails when its median or 90th percentile got slower than the tolerance allows
+def compare(results, baseline, tolerance):
+	failures = []
+	for name in sorted(results):
+		if name not in baseline:
+			continue
+		for key in ('p50', 'p90'):
+			if results[name][key] > baseline[name][key]*(1+tolerance):
+				failures.append((name, key, baseline[name][key], results[name][key]))
+	return failures
+
+def main(argv):
+	parser = OptionParser(usage='%prog [options]')
+	parser.add_option('--max-places', type='int', default=mapSizes[-1], help='largest synthetic map to benchmark')
+	parser.add_option('--max-trials', type='int', default=sessionLengths[-1], help='longest session to benchmark')
+	parser.add_option('--quick', action='store_true', default=False, help='only maps up to 1000 places and sessions up to 1000 trials')
+	parser.add_option('-r', '--repeat', type='int', default=1000, help='calls per benchmark')
+	parser.add_option('-k', '--select', default=None, help='only run benchmarks with this text in their name')
+	parser.add_option('-s', '--save', default=None, help='save the results as a baseline to this json file')
+	parser.add_option('-c', '--compare', default=None, help='compare the results against this baseline')
+	parser.add_option('-t', '--tolerance', type='float', default=0.25, help='allowed slowdown compared to the baseline (0.25 is 25%)')
+	(options, args) = parser.parse_args(argv)
+
+	if options.quick:
+		options.max_places = min(options.max_places, 1000)
+		options.max_trials = min(options.max_trials, 1000)
+
+	results = runBenchmarks(options.max_places, options.max_trials, options.repeat, options.select)
+
+	if options.save:
+		f = open(options.save, 'w')
+		json.dump(results, f, indent=1, sort_keys=True)
+		f.close()
+
+	if options.compare:
+		f = open(options.compare)
+		baseline = json.load(f)
+		f.close()
+		failures = compare(results, baseline, options.tolerance)
+		for (name, key, old, new) in failures:
+			print('SLOWER: %s %s went from %.1f us to %.1f us' % (name, key, 1e6*old, 1e6*new))
+		if failures:
+			return 1
+		print('no slowdowns compared to %s' % options.compare)
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,64 @@
+# Copyright Menno Nijboer, 2015
+
+# Clocks for the timing of a session. Teacher and App take a clock as a dependency: any callable
+# returning seconds. The app uses a MonotonicClock, the simulator (and tests) a VirtualClock that
+# only moves when it is advanced.
+
+from __future__ import division
+
+import sys
+import time
+
+# the best monotonic high resolution time source of this python and platform
+def monotonicSource():
+	if hasattr(time, 'perf_counter'):
+		return time.perf_counter
+	if sys.platform == 'win32':
+		# performance counter based on windows
+		return time.clock
+	try:
+		return posixMonotonic()
+	except (OSError, AttributeError):
+		return time.time
+
+# clock_gettime(CLOCK_MONOTONIC) for python 2 on linux and mac
+def posixMonotonic():
+	import ctypes
+	import ctypes.util
+
+	class timespec(ctypes.Structure):
+		_fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+	lib = ctypes.CDLL(ctypes.util.find_library('rt') or ctypes.util.find_library('c'), use_errno=True)
+	clock_gettime = lib.clock_gettime
+	clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+	CLOCK_MONOTONIC = 6 if sys.platform == 'darwin' else 1
+	ts = timespec()
+	if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(ts)) != 0:
+		raise OSError(ctypes.get_errno(), 'clock_gettime failed')
+
+	def monotonic():
+		clock_gettime(CLOCK_MONOTONIC, ctypes.byref(ts))
+		return ts.tv_sec + ts.tv_nsec * 1e-9
+	return monotonic
+
+# Seconds since the clock was created, never going backwards
+class MonotonicClock(object):
+	def __init__(self, source=None):
+		self.source = source or monotonicSource()
+		self.origin = self.source()
+
+	def __call__(self):
+		return self.source() - self.origin
+
+# A clock that only moves when it is advanced
+class VirtualClock(object):
+	def __init__(self, start=0.0):
+		self.time = start
+
+	def __call__(self):
+		return self.time
+
+	def advance(self, dt):
+		self.time += dt
+		return self.time
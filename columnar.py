@@ -0,0 +1,194 @@
+# Copyright Menno Nijboer, 2015
+
+# Columnar binary export of a session, for analysing whole studies without parsing xml.
+#
+# A .cols file starts with the magic 'TOPOCOL1', the length of a json header (uint32, little
+# endian) and the header itself. The header describes the session and every column: its
+# dtype, number of elements and byte offset from the start of the data section, which begins
+# at the first multiple of 64 after the header. Every column is a plain little endian array.
+#
+# Columns:
+#   trial.<field>, calib.<field>   one element per (calibration) trial, for every TrialResult field
+#   place.<field>                  one element per place: name, x, y, size, numShows, condition
+#   place.times, .decays, .alpha   the histories of all places after each other; element i of
+#   place.times.offsets etc.       the offsets gives the start of place i, element i+1 its end
+
+from __future__ import division, print_function
+
+import os
+import sys
+import glob
+import json
+import mmap
+import struct
+
+import numpy as np
+
+from teacher import placeCondition
+
+magic = b'TOPOCOL1'
+alignment = 64
+
+trialColumns = [
+	('type', '<i1'),
+	('condition', '<i1'),
+	('placeIndex', '<i4'),
+	('placeName', 'S'),
+	('result', '<i1'),
+	('hintUsed', '<i1'),
+	('RT', '<f8'),
+	('avgVelocity', '<f8'),
+	('distanceTraveled', '<f8'),
+	('avgSpeed', '<f8'),
+	('shortestPath', '<f8'),
+	('timeStamp', '<f8'),
+]
+
+def encode(value):
+	if isinstance(value, bytes):
+		return value
+	return ('%s' % (value,)).encode('utf-8')
+
+def column(values, dtype):
+	if dtype == 'S':
+		values = [encode(v) for v in values]
+		return np.array(values, dtype='S%d' % max([1] + [len(v) for v in values]))
+	return np.array(values, dtype=dtype)
+
+# lists of values per place as one array, plus the offsets of every place
+def history(lists):
+	offsets = np.zeros(len(lists)+1, dtype='<i8')
+	offsets[1:] = np.cumsum([len(l) for l in lists])
+	values = np.array([v for l in lists for v in l], dtype='<f8')
+	return (values, offsets)
+
+def sessionColumns(session):
+	columns = []
+	for (prefix, trials) in (('trial', session.trials), ('calib', session.calibTrials)):
+		for (name, dtype) in trialColumns:
+			if name == 'placeName':
+				values = trials.placeNames()
+			else:
+				values = trials.column(name)
+			columns.append((prefix+'.'+name, column(values, dtype)))
+
+	places = session.places
+	columns.append(('place.name', column([p.name for p in places], 'S')))
+	columns.append(('place.x', column([p.x for p in places], '<i4')))
+	columns.append(('place.y', column([p.y for p in places], '<i4')))
+	columns.append(('place.size', column([p.size for p in places], '<f8')))
+	columns.append(('place.numShows', column([p.numShows for p in places], '<i4')))
+	columns.append(('place.condition', column([placeCondition(i, session.spacingFirst) for i in range(len(places))], '<i1')))
+	for name in ('times', 'decays', 'alpha'):
+		(values, offsets) = history([getattr(p, name) for p in places])
+		columns.append(('place.'+name, values))
+		columns.append(('place.'+name+'.offsets', offsets))
+	return columns
+
+def aligned(n):
+	return (n + alignment - 1) // alignment * alignment
+
+def writeColumnar(session, filename):
+	columns = sessionColumns(session)
+	header = {
+		'version': 1,
+		'prefix': encode(session.prefix).decode('utf-8'),
+		'date': encode(session.date).decode('utf-8'),
+		'subjectname': encode(session.subjectName).decode('utf-8'),
+		'spacingfirst': bool(session.spacingFirst),
+		'columns': {},
+	}
+	offset = 0
+	for (name, values) in columns:
+		header['columns'][name] = {'dtype': values.dtype.str, 'length': len(values), 'offset': offset}
+		offset = aligned(offset + values.nbytes)
+	headerBytes = json.dumps(header, sort_keys=True).encode('utf-8')
+
+	out = open(filename, 'wb')
+	out.write(magic + struct.pack('<I', len(headerBytes)) + headerBytes)
+	out.write(b'\0' * (aligned(out.tell()) - out.tell()))
+	start = out.tell()
+	for (name, values) in columns:
+		out.write(b'\0' * (start + header['columns'][name]['offset'] - out.tell()))
+		out.write(values.tobytes())
+	out.close()
+
+# Read only view on a .cols file. The file is memory mapped and columns are numpy arrays on top
+# of the mapping, so nothing is copied until the values are used. Use it in a with statement or
+# call close(). Columns still in use keep the mapping alive after close(): it is unmapped when
+# the last of them is gone, so close() never invalidates an array that was handed out.
+class ColumnarResults(object):
+	def __init__(self, filename):
+		self.filename = filename
+		f = open(filename, 'rb')
+		try:
+			self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		finally:
+			f.close()
+		if self.map[:len(magic)] != magic:
+			raise ValueError('%s is not a columnar results file' % filename)
+		(headerLen,) = struct.unpack('<I', self.map[len(magic):len(magic)+4])
+		headerStart = len(magic) + 4
+		self.header = json.loads(self.map[headerStart:headerStart+headerLen].decode('utf-8'))
+		self.dataStart = aligned(headerStart + headerLen)
+
+		self.prefix = self.header['prefix']
+		self.date = self.header['date']
+		self.subjectName = self.header['subjectname']
+		self.spacingFirst = self.header['spacingfirst']
+
+	def columnNames(self):
+		return sorted(self.header['columns'])
+
+	def column(self, name):
+		if self.map is None:
+			raise ValueError('%s is closed' % self.filename)
+		info = self.header['columns'][name]
+		return np.frombuffer(self.map, dtype=np.dtype(str(info['dtype'])), count=info['length'], offset=self.dataStart+info['offset'])
+
+	def __getitem__(self, name):
+		return self.column(name)
+
+	def numTrials(self):
+		return self.header['columns']['trial.type']['length']
+
+	# times, decays or alpha of place i
+	def placeHistory(self, name, i):
+		offsets = self.column('place.'+name+'.offsets')
+		return self.column('place.'+name)[offsets[i]:offsets[i+1]]
+
+	def placeNames(self):
+		return [n.decode('utf-8') for n in self.column('place.name')]
+
+	def close(self):
+		if self.map is None:
+			return
+		try:
+			self.map.close()
+		except BufferError:
+			# columns are still in use, they hold the last references to the mapping
+			pass
+		self.map = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+# open every .cols file of a study
+def openStudy(directory='results'):
+	return [ColumnarResults(f) for f in sorted(glob.glob(os.path.join(directory, '*.cols')))]
+
+def main(argv):
+	directory = argv[0] if argv else 'results'
+	study = openStudy(directory)
+	numTrials = sum(r.numTrials() for r in study)
+	correct = sum(int(r['trial.result'].sum()) for r in study)
+	for r in study:
+		r.close()
+	print('%d sessions, %d trials, %.1f%% correct' % (len(study), numTrials, 100*correct / max(1, numTrials)))
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,106 @@
+# Copyright Menno Nijboer, 2015
+
+# Always-on timing of the frames of a session. The time taken by App.update and App.on_draw
+# and the dt between updates go into fixed-size histograms, so the cost per frame is a few
+# counter increments. A frame is over budget when its update came more than a tick late, or
+# when update and draw together took longer than a tick. Clicks are stamped when they arrive,
+# but a trial that contains an over budget frame was shown late or received its clicks late.
+
+from __future__ import division
+
+import timeit
+
+import numpy as np
+
+from teacher import TRIAL, DRILL
+
+frameTimer = timeit.default_timer
+
+class FrameHistogram(object):
+	def __init__(self, binWidth, numBins):
+		self.binWidth = binWidth
+		self.counts = [0] * numBins  # the last bin holds everything longer
+		self.count = 0
+		self.total = 0.0
+		self.max = 0.0
+
+	def add(self, seconds):
+		i = int(seconds / self.binWidth)
+		if i >= len(self.counts):
+			i = len(self.counts) - 1
+		self.counts[i] += 1
+		self.count += 1
+		self.total += seconds
+		if seconds > self.max:
+			self.max = seconds
+
+	def mean(self):
+		return self.total / max(1, self.count)
+
+	# upper edge of the bin containing the p-th percentile
+	def percentile(self, p):
+		if self.count == 0:
+			return 0.0
+		rank = p / 100 * self.count
+		seen = 0
+		for (i, n) in enumerate(self.counts):
+			seen += n
+			if seen >= rank and n > 0:
+				return min(self.max, (i+1) * self.binWidth)
+		return self.max
+
+class FrameProfiler(object):
+	def __init__(self, budget, binWidth=0.00025, numBins=400, maxStalls=10000):
+		self.budget = budget
+		self.update = FrameHistogram(binWidth, numBins)
+		self.draw = FrameHistogram(binWidth, numBins)
+		self.dt = FrameHistogram(binWidth, numBins)
+		self.lastDraw = 0.0
+		self.overBudget = 0
+		self.maxStalls = maxStalls
+		self.stalls = []  # (mode, subjectTime, dt, update, draw) of over budget frames
+
+	def addDraw(self, seconds):
+		self.draw.add(seconds)
+		self.lastDraw = seconds
+
+	# called at the end of every update, with the draw before it this makes a frame
+	def addUpdate(self, dt, seconds, mode, subjectTime):
+		self.update.add(seconds)
+		self.dt.add(dt)
+		if dt > 2*self.budget or seconds + self.lastDraw > self.budget:
+			self.overBudget += 1
+			if len(self.stalls) < self.maxStalls:
+				self.stalls.append((mode, subjectTime, dt, seconds, self.lastDraw))
+		self.lastDraw = 0.0
+
+	# the first trial a stall overlaps with, a trial spans timeStamp-RT .. timeStamp
+	def stallTrial(self, mode, subjectTime, dt, ends, starts):
+		if mode != TRIAL and mode != DRILL:
+			return -1
+		i = int(np.searchsorted(ends, subjectTime - dt))
+		if i < len(ends) and starts[i] <= subjectTime:
+			return i
+		return -1
+
+	# write <prefix>_frames.txt (histogram summary) and <prefix>_stalls.txt (over budget frames)
+	def save(self, prefix, trials):
+		out = open(prefix + '_frames.txt', 'w')
+		out.write('measure\tframes\tmean_ms\tp50_ms\tp90_ms\tp99_ms\tmax_ms\tbudget_ms\tover_budget\n')
+		for (name, hist) in (('update', self.update), ('draw', self.draw), ('dt', self.dt)):
+			out.write('%s\t%d\t%.3f\t%.3f\t%.3f\t%.3f\t%.3f\t%.3f\t%d\n' % (name, hist.count, 1000*hist.mean(), 1000*hist.percentile(50),
+				1000*hist.percentile(90), 1000*hist.percentile(99), 1000*hist.max, 1000*self.budget, self.overBudget))
+		out.write('\nbin_ms\tupdate\tdraw\tdt\n')
+		for i in range(len(self.update.counts)):
+			counts = (self.update.counts[i], self.draw.counts[i], self.dt.counts[i])
+			if sum(counts) > 0:
+				out.write('%.2f\t%d\t%d\t%d\n' % ((1000*i*self.update.binWidth,) + counts))
+		out.close()
+
+		ends = trials.column('timeStamp')
+		starts = ends - trials.column('RT')
+		out = open(prefix + '_stalls.txt', 'w')
+		out.write('mode\tsubjecttime\ttrial\tdt_ms\tupdate_ms\tdraw_ms\n')
+		for (mode, subjectTime, dt, update, draw) in self.stalls:
+			out.write('%d\t%.4f\t%d\t%.3f\t%.3f\t%.3f\n' % (mode, subjectTime, self.stallTrial(mode, subjectTime, dt, ends, starts), 1000*dt, 1000*update, 1000*draw))
+		out.close()
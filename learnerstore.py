@@ -0,0 +1,82 @@
+# Copyright Menno Nijboer, 2015
+
+# Memory model of every learner across sessions, in an sqlite database (results/learners.db).
+# A row per (learner, place) holds the presentation times, decays and alphas of the place as
+# packed little endian float64 arrays, so a learner is loaded with a single query however many
+# presentations there are. Times are stored as seconds since the unix epoch; a Teacher converts
+# them to and from its own clock. The rows of the places a trial changed are written back after
+# every trial.
+
+from __future__ import division
+
+import sqlite3
+
+import numpy as np
+
+from results import text
+
+schema = '''CREATE TABLE IF NOT EXISTS places (
+	learner TEXT NOT NULL,
+	place TEXT NOT NULL,
+	times BLOB NOT NULL,
+	decays BLOB NOT NULL,
+	alpha BLOB NOT NULL,
+	act REAL NOT NULL,
+	shows INTEGER NOT NULL,
+	shownBefore INTEGER NOT NULL,
+	PRIMARY KEY (learner, place))'''
+
+def pack(values):
+	return sqlite3.Binary(np.asarray(values, dtype='<f8').tobytes())
+
+def unpack(blob):
+	return np.frombuffer(blob, dtype='<f8')
+
+# The stored memory of one place
+class PlaceState(object):
+	def __init__(self, times, decays, alpha, act, numShows, shownBefore):
+		self.times = times
+		self.decays = decays
+		self.alpha = alpha
+		self.act = act
+		self.numShows = numShows
+		self.shownBefore = shownBefore
+
+class LearnerStore(object):
+	def __init__(self, filename):
+		self.filename = filename
+		self.db = sqlite3.connect(filename)
+		# a commit per trial, the write ahead log keeps that cheap
+		self.db.execute('PRAGMA journal_mode=WAL')
+		self.db.execute('PRAGMA synchronous=NORMAL')
+		self.db.execute(schema)
+		self.db.commit()
+
+	# place name -> PlaceState, with times since the epoch
+	def load(self, learner):
+		rows = self.db.execute('SELECT place, times, decays, alpha, act, shows, shownBefore FROM places WHERE learner = ?', (text(learner),))
+		states = {}
+		for (place, times, decays, alpha, act, shows, shownBefore) in rows:
+			states[place] = PlaceState(unpack(times), unpack(decays), unpack(alpha), act, shows, bool(shownBefore))
+		return states
+
+	# write the memory of places, epoch is added to their times
+	def save(self, learner, places, epoch):
+		learner = text(learner)
+		rows = [(learner, text(p.name), pack(np.asarray(p.times, dtype=np.float64) + epoch), pack(p.decays), pack(p.alpha), float(p.act), p.numShows, int(p.shownBefore)) for p in places]
+		self.db.executemany('INSERT OR REPLACE INTO places VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+		self.db.commit()
+
+	# number of places a learner has a memory of
+	def numPlaces(self, learner):
+		return self.db.execute('SELECT COUNT(*) FROM places WHERE learner = ?', (text(learner),)).fetchone()[0]
+
+	def forget(self, learner):
+		self.db.execute('DELETE FROM places WHERE learner = ?', (text(learner),))
+		self.db.commit()
+
+	def learners(self):
+		return [row[0] for row in self.db.execute('SELECT DISTINCT learner FROM places ORDER BY learner')]
+
+	def close(self):
+		self.db.close()
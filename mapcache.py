@@ -0,0 +1,164 @@
+# Copyright Menno Nijboer, 2015
+
+# Loading of map files. The xml is parsed as a stream, so a large map is never held in memory
+# as a document, and the places are saved to a compiled cache next to the map (map.xml.cache).
+# Later loads read the cache in bulk instead of parsing. The cache is used when the modification
+# time and size of the map match those it was made from, or else when the sha1 of the map does.
+#
+# A cache file starts with the magic 'TOPOMAP1', the length of a json header (uint32, little
+# endian) and the header, followed by the arrays x (int32), y (int32) and size (float64) of all
+# places and the utf-8 encoded names of the places separated by NUL characters.
+#
+#     python mapcache.py [map.xml]    (re)builds the cache of a map
+
+from __future__ import division, print_function
+
+import os
+import sys
+import json
+import struct
+import hashlib
+
+try:
+	import xml.etree.cElementTree as ElementTree
+except ImportError:
+	import xml.etree.ElementTree as ElementTree
+
+import numpy as np
+
+from teacher import Place
+
+magic = b'TOPOMAP1'
+cacheVersion = 1
+cacheSuffix = '.cache'
+
+# attribute values are always unicode, as with minidom
+def text(value):
+	if isinstance(value, bytes):
+		return value.decode('utf-8')
+	return value
+
+# the places of a map, parsed one element at a time
+def parseMap(filename):
+	places = []
+	root = None
+	for (event, elem) in ElementTree.iterparse(filename, events=('start', 'end')):
+		if root is None:
+			root = elem
+		if event == 'end' and elem.tag == 'place':
+			places.append(Place(int(elem.get('x', '')), int(elem.get('y', '')), text(elem.get('name', '')), float(elem.get('size', ''))))
+			# drop the parsed elements, nothing keeps them alive after this
+			root.clear()
+	return places
+
+def fileHash(filename):
+	h = hashlib.sha1()
+	f = open(filename, 'rb')
+	try:
+		for block in iter(lambda: f.read(1 << 16), b''):
+			h.update(block)
+	finally:
+		f.close()
+	return h.hexdigest()
+
+def mapStamp(filename):
+	st = os.stat(filename)
+	return (st.st_mtime, st.st_size)
+
+def readCacheHeader(f):
+	start = f.read(len(magic) + 4)
+	if len(start) < len(magic) + 4 or start[:len(magic)] != magic:
+		return None
+	(headerLen,) = struct.unpack('<I', start[len(magic):])
+	header = json.loads(f.read(headerLen).decode('utf-8'))
+	if header.get('version') != cacheVersion:
+		return None
+	return header
+
+def readCache(f, header):
+	n = header['count']
+	data = f.read()
+	x = np.frombuffer(data, dtype='<i4', count=n, offset=0)
+	y = np.frombuffer(data, dtype='<i4', count=n, offset=4*n)
+	size = np.frombuffer(data, dtype='<f8', count=n, offset=8*n)
+	names = data[16*n:].decode('utf-8').split(u'\0') if n else []
+	if len(names) != n:
+		return None
+	return [Place(px, py, name, ps) for (px, py, name, ps) in zip(x.tolist(), y.tolist(), names, size.tolist())]
+
+# the places from the cache of a map, or None when there is no valid cache. The second value
+# tells whether the cache header is stale (the map was touched but its contents are the same).
+def loadCache(filename, cacheFile):
+	try:
+		f = open(cacheFile, 'rb')
+	except IOError:
+		return (None, False)
+	try:
+		header = readCacheHeader(f)
+		if header is None:
+			return (None, False)
+		(mtime, size) = mapStamp(filename)
+		stale = header['mtime'] != mtime or header['size'] != size
+		if stale and header['sha1'] != fileHash(filename):
+			return (None, False)
+		return (readCache(f, header), stale)
+	except (ValueError, KeyError, struct.error):
+		return (None, False)
+	finally:
+		f.close()
+
+def writeCache(filename, cacheFile, places):
+	(mtime, size) = mapStamp(filename)
+	header = {
+		'version': cacheVersion,
+		'mtime': mtime,
+		'size': size,
+		'sha1': fileHash(filename),
+		'count': len(places),
+	}
+	headerBytes = json.dumps(header, sort_keys=True).encode('utf-8')
+	x = np.array([p.x for p in places], dtype='<i4')
+	y = np.array([p.y for p in places], dtype='<i4')
+	sizes = np.array([p.size for p in places], dtype='<f8')
+	names = u'\0'.join(text(p.name) for p in places).encode('utf-8')
+
+	# write to a temporary file first, so a reader never sees half a cache
+	tmpFile = '%s.%d.tmp' % (cacheFile, os.getpid())
+	out = open(tmpFile, 'wb')
+	try:
+		out.write(magic + struct.pack('<I', len(headerBytes)) + headerBytes)
+		out.write(x.tobytes() + y.tobytes() + sizes.tobytes() + names)
+	finally:
+		out.close()
+	try:
+		os.rename(tmpFile, cacheFile)
+	except OSError:
+		# windows does not replace an existing file
+		os.remove(cacheFile)
+		os.rename(tmpFile, cacheFile)
+
+def loadMap(filename='map.xml', useCache=True):
+	if not useCache:
+		return parseMap(filename)
+	cacheFile = filename + cacheSuffix
+	(places, stale) = loadCache(filename, cacheFile)
+	if places is not None and not stale:
+		return places
+	if places is None:
+		places = parseMap(filename)
+	try:
+		writeCache(filename, cacheFile, places)
+	except (IOError, OSError):
+		# a read only map directory only costs the speedup
+		pass
+	return places
+
+def main(argv):
+	filename = argv[0] if argv else 'map.xml'
+	places = parseMap(filename)
+	writeCache(filename, filename + cacheSuffix, places)
+	print('%s: %d places, written %s%s' % (filename, len(places), filename, cacheSuffix))
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,283 @@
+# Copyright Menno Nijboer, 2015
+
+# Deterministic replay of saved sessions. The log of a session (results/<prefix>_log.txt, see
+# results.py) holds the places in the order the Teacher used, the calibration, every trial with
+# its response, and every change to the memory model with the clock time of each presentation.
+# A replay feeds the recorded responses back through a fresh Teacher on a virtual clock that is
+# set to the recorded presentation times, and checks that every getNextTrial gives the recorded
+# place, trial type and condition, with the same presentations, decays and alphas. A session
+# replays in milliseconds, so the whole archive can be checked after every scheduler change:
+#
+#     python replay.py results                     # every session log in the directory
+#     python replay.py results/<prefix>_log.txt    # (or results/<prefix>.xml) a single session
+
+from __future__ import division, print_function
+
+import os
+import sys
+import glob
+import codecs
+import timeit
+import multiprocessing
+from optparse import OptionParser
+
+import numpy as np
+
+from teacher import Teacher, Place
+from results import parseValue
+from learnerstore import PlaceState
+from clock import VirtualClock
+
+# same screen and session length as the App, for logs that do not record them
+screenWidth = 1194
+screenHeight = 760
+defaultExpLength = 20*60.0
+
+def parseTrial(fields):
+	return [parseValue(v) for v in fields[:3]] + [fields[3]] + [parseValue(v) for v in fields[4:]]
+
+# A session as read from its log. Every trial comes with the changes to the memory model that
+# the Teacher logged while choosing it.
+class Recording(object):
+	def __init__(self, filename):
+		self.filename = filename
+		self.prefix = None
+		self.subjectName = None
+		self.spacingFirst = True
+		self.expLength = None
+		self.places = []
+		self.prior = {}       # place index -> PlaceState, memory from earlier sessions
+		self.calibTrials = [] # field values of every calibration trial
+		self.trials = []      # (field values, events) of every trial
+
+	@property
+	def numTrials(self):
+		return len(self.trials)
+
+# Read a session log. A line cut off by a crash is ignored, as by results.readLog.
+def readRecording(filename):
+	recording = Recording(filename)
+	events = []
+	logFile = codecs.open(filename, 'r', 'utf-8')
+	for line in logFile:
+		if not line.endswith('\n'):
+			break
+		fields = line[:-1].split('\t')
+		kind = fields[0]
+		if kind == 'session':
+			recording.prefix = fields[1]
+			recording.subjectName = fields[3]
+			recording.spacingFirst = bool(int(fields[4]))
+			if len(fields) > 5:
+				recording.expLength = parseValue(fields[5])
+		elif kind == 'place':
+			recording.places.append(Place(parseValue(fields[2]), parseValue(fields[3]), fields[5], parseValue(fields[4])))
+		elif kind == 'prior':
+			recording.prior[int(fields[1])] = PlaceState([], [], [], parseValue(fields[2]), int(fields[3]), bool(int(fields[4])))
+		elif kind == 'priorpres':
+			recording.prior[int(fields[1])].times.append(parseValue(fields[2]))
+		elif kind == 'priordecay':
+			recording.prior[int(fields[1])].decays.append(parseValue(fields[2]))
+		elif kind == 'prioralpha':
+			recording.prior[int(fields[1])].alpha.append(parseValue(fields[2]))
+		elif kind in ('pres', 'decay', 'alpha'):
+			events.append((kind, int(fields[1]), parseValue(fields[2])))
+		elif kind == 'show':
+			events.append((kind, int(fields[1]), None))
+		elif kind == 'trial':
+			recording.trials.append((parseTrial(fields[1:]), events))
+			events = []
+		elif kind == 'calib':
+			recording.calibTrials.append(parseTrial(fields[1:]))
+	logFile.close()
+	if recording.prefix is None:
+		raise ValueError('%s is not a session log' % filename)
+	return recording
+
+# Stands in for the TrialLogWriter of the replayed Teacher, keeping the changes to the memory
+# model in the form readRecording gives them
+class EventLog(object):
+	def __init__(self):
+		self.events = []
+
+	def take(self):
+		(events, self.events) = (self.events, [])
+		return events
+
+	def presentation(self, i, t):
+		self.events.append(('pres', i, t))
+
+	def decay(self, i, d):
+		self.events.append(('decay', i, d))
+
+	def alpha(self, i, a):
+		self.events.append(('alpha', i, a))
+
+	def show(self, i):
+		self.events.append(('show', i, None))
+
+	def trial(self, trial):
+		pass
+
+	def calibration(self, trial):
+		pass
+
+	def close(self):
+		pass
+
+# Hands the recorded memory from earlier sessions to Teacher.useStore, and keeps nothing
+class PriorStore(object):
+	def __init__(self, states):
+		self.states = states
+
+	def load(self, learner):
+		return self.states
+
+	def save(self, learner, places, epoch):
+		pass
+
+class ReplayResult(object):
+	def __init__(self, filename, prefix, numTrials, replayed, divergence, elapsed):
+		self.filename = filename
+		self.prefix = prefix
+		self.numTrials = numTrials     # trials in the recording
+		self.replayed = replayed       # trials that matched before the first divergence
+		self.divergence = divergence   # description of the first difference, or None
+		self.elapsed = elapsed         # seconds the replay took
+
+	@property
+	def ok(self):
+		return self.divergence is None
+
+	def summary(self):
+		if self.ok:
+			return '%s: %d trials match (%.1f ms)' % (self.prefix, self.numTrials, 1e3*self.elapsed)
+		return '%s: diverges after %d of %d trials: %s' % (self.prefix, self.replayed, self.numTrials, self.divergence)
+
+def sameEvents(recorded, replayed, tolerance):
+	if len(recorded) != len(replayed):
+		return False
+	for (r, p) in zip(recorded, replayed):
+		if r[:2] != p[:2]:
+			return False
+		if r[2] is not None and abs(r[2] - p[2]) > tolerance:
+			return False
+	return True
+
+def formatEvents(events):
+	return ' '.join('%s(%d)' % e[:2] if e[2] is None else '%s(%d, %.9g)' % e for e in events)
+
+# Replay a recording, stopping at the first trial where the Teacher does something else. Values
+# of the memory model may differ by tolerance: the App can work out a trial during feedback, a
+# little before the presentation time the replay uses.
+def replay(recording, tolerance=1e-4, expLength=defaultExpLength):
+	t0 = timeit.default_timer()
+	clock = VirtualClock()
+	places = [Place(p.x, p.y, p.name, p.size) for p in recording.places]
+	teacher = Teacher(list(places), screenWidth, screenHeight, recording.spacingFirst, recording.expLength or expLength, recording.subjectName, clock)
+	# undo the shuffle, the log has the order of the recorded session
+	teacher.mapPlaces[:] = places
+	if recording.prior:
+		states = dict((places[i].name, PlaceState(np.array(p.times), np.array(p.decays), np.array(p.alpha), p.act, p.numShows, p.shownBefore))
+		              for (i, p) in recording.prior.items())
+		teacher.useStore(PriorStore(states), 0.0)
+	log = EventLog()
+	teacher.log = log
+
+	calib = iter(recording.calibTrials)
+	while not teacher.doneCalibrating():
+		fields = next(calib, None)
+		if fields is None:
+			# the recording stops during calibration
+			return ReplayResult(recording.filename, recording.prefix, recording.numTrials, 0, None, timeit.default_timer() - t0)
+		teacher.getNextCalibTrial()
+		teacher.currentCalibrationResult(*fields[6:])
+
+	divergence = None
+	for (k, (fields, recorded)) in enumerate(recording.trials):
+		(type, condition, placeIdx, placeName, result, hintUsed, rt, velocity, distance, shortest, timestamp) = fields
+		# the clock stood at the presentation time when the trial was chosen
+		for (kind, i, value) in recorded:
+			if kind == 'pres':
+				clock.time = value
+		(place, replayedType, hintAllowed) = teacher.getNextTrial(timestamp - rt)
+		replayed = log.take()
+		if (place, replayedType, teacher.trialCondition) != (placeIdx, type, condition):
+			divergence = 'trial %d: recorded %s (type %d, condition %d), replayed %s (type %d, condition %d)' % (k, placeName, type, condition,
+				teacher.mapPlaces[place].name, replayedType, teacher.trialCondition)
+		elif not sameEvents(recorded, replayed, tolerance):
+			divergence = 'trial %d: recorded %s, replayed %s' % (k, formatEvents(recorded), formatEvents(replayed))
+		if divergence is not None:
+			return ReplayResult(recording.filename, recording.prefix, recording.numTrials, k, divergence, timeit.default_timer() - t0)
+		teacher.currentTrialResult(result, hintUsed, rt, velocity, distance, shortest, timestamp)
+	return ReplayResult(recording.filename, recording.prefix, recording.numTrials, recording.numTrials, None, timeit.default_timer() - t0)
+
+# one job of the process pool: (filename, tolerance, expLength)
+def replayFile(job):
+	(filename, tolerance, expLength) = job
+	try:
+		recording = readRecording(filename)
+	except (IOError, ValueError, IndexError, KeyError) as e:
+		return ReplayResult(filename, os.path.basename(filename), 0, 0, 'unreadable: %s' % e, 0.0)
+	return replay(recording, tolerance, expLength)
+
+# session logs of the given files and directories; the results of a session (<prefix>.xml and
+# friends) lead to its log, which has what the xml leaves out (calibration, clock times)
+def sessionLogs(paths):
+	logs = []
+	for path in paths:
+		if os.path.isdir(path):
+			logs.extend(sorted(glob.glob(os.path.join(path, '*_log.txt'))))
+		elif path.endswith('_log.txt'):
+			logs.append(path)
+		else:
+			(base, ext) = os.path.splitext(path)
+			for suffix in ('_all', '_paths', '_frames', '_startup'):
+				if base.endswith(suffix):
+					base = base[:-len(suffix)]
+			logs.append(base + '_log.txt')
+	return logs
+
+def replayAll(filenames, tolerance=1e-4, expLength=defaultExpLength, jobs=None):
+	jobList = [(f, tolerance, expLength) for f in filenames]
+	if jobs == 1 or len(jobList) < 2:
+		for job in jobList:
+			yield replayFile(job)
+		return
+	pool = multiprocessing.Pool(jobs)
+	try:
+		for result in pool.imap(replayFile, jobList):
+			yield result
+		pool.close()
+	except:
+		pool.terminate()
+		raise
+	finally:
+		pool.join()
+
+def main(argv):
+	parser = OptionParser(usage='%prog [options] <directory or session log> [...]')
+	parser.add_option('-j', '--jobs', type='int', default=None, help='number of worker processes (default: all cores)')
+	parser.add_option('-t', '--tolerance', type='float', default=1e-4, help='largest difference allowed in decays and alphas')
+	parser.add_option('-l', '--length', type='float', default=defaultExpLength, help='session length for logs that do not record it')
+	parser.add_option('-q', '--quiet', action='store_true', default=False, help='only print the sessions that diverge')
+	(options, args) = parser.parse_args(argv)
+	if len(args) == 0:
+		parser.error('give the session logs or directories to replay')
+
+	filenames = sessionLogs(args)
+	t0 = timeit.default_timer()
+	(sessions, trials, failed) = (0, 0, 0)
+	for result in replayAll(filenames, options.tolerance, options.length, options.jobs):
+		sessions += 1
+		trials += result.numTrials
+		if not result.ok:
+			failed += 1
+		if not (result.ok and options.quiet):
+			print(result.summary())
+	elapsed = timeit.default_timer() - t0
+	print('%d sessions, %d trials replayed in %.2f s, %d diverge' % (sessions, trials, elapsed, failed))
+	return 1 if failed else 0
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,243 @@
+# Copyright Menno Nijboer, 2015
+
+# Crash safe storage of session results. While a session runs, every change to the memory model
+# and every completed trial is appended to a log file (results/<prefix>_log.txt). At the end of
+# the session the usual outputs (<prefix>_all.txt for spss and <prefix>.xml for plotting) are
+# produced from that log, and a log left behind by a crashed session can be turned into the
+# same outputs afterwards:
+#
+#     python results.py results/<prefix>_log.txt
+
+from __future__ import division, print_function
+
+import sys
+import os
+import codecs
+
+from teacher import Place, placeCondition
+from triallog import TrialLog
+from columnar import writeColumnar
+
+# columns of a trial (and calibration) record, in the order of the TrialResult constructor
+trialFields = ['type', 'condition', 'placeIndex', 'placeName', 'result', 'hintUsed', 'RT', 'avgVelocity', 'distanceTraveled', 'shortestPath', 'timeStamp']
+
+# names typed in by the subject arrive as utf-8 encoded bytes
+def text(value):
+	if isinstance(value, bytes):
+		return value.decode('utf-8', 'replace')
+	return '%s' % (value,)
+
+# numbers are written with repr, so they are read back exactly
+def formatValue(value):
+	if isinstance(value, float):
+		return repr(value)
+	return text(value)
+
+def parseValue(text):
+	if text == 'True':
+		return True
+	if text == 'False':
+		return False
+	try:
+		return int(text)
+	except ValueError:
+		return float(text)
+
+# Appends the events of a session to the log, one tab separated record per line. The file is
+# flushed (and synced to disk) every batchSize trials, and when the log is closed.
+class TrialLogWriter(object):
+	def __init__(self, filename, batchSize=5):
+		self.filename = filename
+		self.batchSize = batchSize
+		self.pending = 0
+		self.file = codecs.open(filename, 'w', 'utf-8')
+
+	def write(self, *fields):
+		self.file.write('\t'.join(formatValue(f) for f in fields) + '\n')
+
+	# the places, and the memory of the places that were studied in earlier sessions (times on
+	# the clock of this session), so a replay can start where the session started
+	def session(self, prefix, date, subjectName, spacingFirst, places, expLength=None):
+		self.write('session', prefix, date, subjectName, int(spacingFirst), *([] if expLength is None else [expLength]))
+		for (i, place) in enumerate(places):
+			self.write('place', i, place.x, place.y, place.size, place.name)
+		for (i, place) in enumerate(places):
+			if len(place.times) > 0 or place.numShows > 0 or place.shownBefore:
+				self.write('prior', i, place.act, place.numShows, int(place.shownBefore))
+				for t in place.times:
+					self.write('priorpres', i, t)
+				for d in place.decays:
+					self.write('priordecay', i, d)
+				for a in place.alpha:
+					self.write('prioralpha', i, a)
+		self.flush()
+
+	def presentation(self, i, t):
+		self.write('pres', i, t)
+
+	def decay(self, i, d):
+		self.write('decay', i, d)
+
+	def alpha(self, i, a):
+		self.write('alpha', i, a)
+
+	def show(self, i):
+		self.write('show', i)
+
+	def trial(self, trial):
+		self.write('trial', *[getattr(trial, f) for f in trialFields])
+		self.trialDone()
+
+	def calibration(self, trial):
+		self.write('calib', *[getattr(trial, f) for f in trialFields])
+		self.trialDone()
+
+	def trialDone(self):
+		self.pending += 1
+		if self.pending >= self.batchSize:
+			self.flush()
+
+	def flush(self):
+		self.file.flush()
+		os.fsync(self.file.fileno())
+		self.pending = 0
+
+	def close(self):
+		if not self.file.closed:
+			self.flush()
+			self.file.close()
+
+# Everything needed to write the outputs of a session
+class SessionLog(object):
+	def __init__(self, prefix, date, subjectName, spacingFirst, places, trials, calibTrials):
+		self.prefix = prefix
+		self.date = date
+		self.subjectName = subjectName
+		self.spacingFirst = spacingFirst
+		self.places = places
+		self.trials = trials
+		self.calibTrials = calibTrials
+
+def readTrial(trials, fields):
+	values = [parseValue(v) for v in fields[:3]] + [fields[3]] + [parseValue(v) for v in fields[4:]]
+	trials.append(*values)
+
+# Rebuild a session from its log. A line cut off by a crash is ignored.
+def readLog(filename):
+	session = None
+	places = []
+	trials = TrialLog()
+	calibTrials = TrialLog()
+	logFile = codecs.open(filename, 'r', 'utf-8')
+	for line in logFile:
+		if not line.endswith('\n'):
+			break
+		fields = line[:-1].split('\t')
+		kind = fields[0]
+		if kind == 'session':
+			session = fields[1:]
+		elif kind == 'place':
+			places.append(Place(parseValue(fields[2]), parseValue(fields[3]), fields[5], parseValue(fields[4])))
+		elif kind == 'pres':
+			places[int(fields[1])].times.append(parseValue(fields[2]))
+		elif kind == 'decay':
+			places[int(fields[1])].decays.append(parseValue(fields[2]))
+		elif kind == 'alpha':
+			places[int(fields[1])].alpha.append(parseValue(fields[2]))
+		elif kind == 'show':
+			places[int(fields[1])].addShow()
+		elif kind == 'trial':
+			readTrial(trials, fields[1:])
+		elif kind == 'calib':
+			readTrial(calibTrials, fields[1:])
+	logFile.close()
+
+	(prefix, date, subjectName, spacingFirst) = session[:4]
+	return SessionLog(prefix, date, subjectName, bool(int(spacingFirst)), places, trials, calibTrials)
+
+# escape attribute values the way xml.dom.minidom does
+def escapeAttr(value):
+	return value.replace('&', '&amp;').replace('<', '&lt;').replace('"', '&quot;').replace('>', '&gt;')
+
+# write an element in the layout of minidom's writexml, attributes sorted by name
+def writeElement(out, indent, tag, attrs, close=True):
+	out.write(indent + '<' + tag)
+	for name in sorted(attrs):
+		out.write(' %s="%s"' % (name, escapeAttr(text(attrs[name]))))
+	if close:
+		out.write('/>\n')
+	else:
+		out.write('>\n')
+
+# header of <prefix>_all.txt
+spssHeader = 'Subject\tTrialtype\tCondition\tPlacename\tSuccess\tHintUsed\tTimestamp\tRT\tAvgspeed\tAvgvelocity\tTravdistance\tShortestpath\n'
+
+# the fields of the trials a column at a time, as tuples of python values per trial
+def trialValues(trials, names):
+	return zip(*[trials.placeNames() if name == 'placeName' else trials.column(name).tolist() for name in names])
+
+spssFields = ['type', 'condition', 'placeName', 'result', 'hintUsed', 'timeStamp', 'RT', 'avgSpeed', 'avgVelocity', 'distanceTraveled', 'shortestPath']
+
+def spssLines(prefix, trials):
+	for (type, condition, placeName, result, hintUsed, timeStamp, rt, avgSpeed, avgVelocity, distance, shortest) in trialValues(trials, spssFields):
+		yield '\t'.join([prefix, str(type-1), str(condition), text(placeName), str(result), str(hintUsed),
+			str(timeStamp), str(rt), str(avgSpeed), str(avgVelocity), str(distance), str(shortest)]) + '\n'
+
+# a trial element as writeElement writes it, numbers need no escaping
+trialElement = ('      <trial avgspeed="%s" avgvelocity="%s" condition="%s" hintused="%s" placename="%s" rt="%s" shortestpath="%s" '
+                'success="%s" timestamp="%s" travdistance="%s" trialtype="%s"/>\n')
+
+def trialLines(trials):
+	for (type, condition, placeName, result, hintUsed, timeStamp, rt, avgSpeed, avgVelocity, distance, shortest) in trialValues(trials, spssFields):
+		yield trialElement % (avgSpeed, avgVelocity, condition, hintUsed, escapeAttr(text(placeName)), rt, shortest, result, timeStamp, distance, type-1)
+
+# write <prefix>_all.txt, <prefix>.xml and the columnar <prefix>.cols
+def writeResults(session, directory='results'):
+	prefix = session.prefix
+
+	# save results for spss
+	spssAll = codecs.open(os.path.join(directory, prefix+'_all.txt'), 'w', 'utf-8')
+	spssAll.write(spssHeader)
+	spssAll.write(''.join(spssLines(prefix, session.trials)))
+	spssAll.close()
+
+	#save xml for plotting later
+	out = codecs.open(os.path.join(directory, prefix+'.xml'), 'w', 'utf-8')
+	out.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+	writeElement(out, '    ', 'results', {'subject': prefix, 'date': session.date, 'subjectname': session.subjectName}, close=False)
+
+	#format the place information
+	for (i, place) in enumerate(session.places):
+		condition = placeCondition(i, session.spacingFirst)
+		attrs = {'condition': str(condition), 'name': place.name, 'totalpresentations': str(place.numShows), 'i': str(i)}
+		if len(place.times) + len(place.decays) + len(place.alpha) == 0:
+			writeElement(out, '      ', 'place', attrs)
+			continue
+		writeElement(out, '      ', 'place', attrs, close=False)
+		for (j, t) in enumerate(place.times):
+			writeElement(out, '        ', 'pres', {'time': str(t), 'i': str(j)})
+		for (j, d) in enumerate(place.decays):
+			writeElement(out, '        ', 'decay', {'value': str(d), 'i': str(j)})
+		for (j, a) in enumerate(place.alpha):
+			writeElement(out, '        ', 'alpha', {'value': str(a), 'i': str(j)})
+		out.write('      </place>\n')
+
+	#format the trial results for analysis
+	out.write(''.join(trialLines(session.trials)))
+	out.write('    </results>\n')
+	out.close()
+
+	writeColumnar(session, os.path.join(directory, prefix+'.cols'))
+
+def main(argv):
+	if len(argv) == 0:
+		print('usage: python results.py <prefix>_log.txt [...]')
+		return 1
+	for filename in argv:
+		session = readLog(filename)
+		writeResults(session, os.path.dirname(filename) or '.')
+		print('%s: %d trials, written %s_all.txt and %s.xml' % (filename, len(session.trials), session.prefix, session.prefix))
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,420 @@
+# Copyright Menno Nijboer, 2015
+
+# Session service: the Teachers of many learners in one process, so the scheduling of a whole
+# study can run on one server. The App then is a thin client (RemoteTeacher): it keeps the
+# places and the completed trials for drawing and hit testing, and asks the service for every
+# decision.
+#
+# Requests and replies are json objects, one per line:
+#
+#     {"id": 7, "session": 3, "op": "nextTrial", "args": [412.5], "time": 415.25}
+#     {"id": 7, "result": [12, 1, true]}        or        {"id": 7, "error": "no session 3"}
+#
+# "time" is the clock of the client when it sent the request. The Teacher of a session runs on
+# a virtual clock that is set to this time, so presentation times are those of the learner and
+# network latency does not change the model.
+#
+# The service runs on an asyncio event loop (Python 3). The Teachers answer in microseconds, so
+# requests are handled on the loop itself; only saving the results of a session is moved to a
+# worker thread. While a session saves, its other operations are refused, and the requests of
+# the connection that asked for the save wait, so its replies stay in order. LoopbackConnection runs a service in the same process, for tests and the
+# simulator.
+#
+#     python sessions.py [--host 127.0.0.1] [--port 5601]    runs the service
+#     python topostudy.py --server=127.0.0.1:5601            runs the App against it
+
+from __future__ import division, print_function
+
+import sys
+import json
+import time
+import socket
+from optparse import OptionParser
+
+from teacher import Teacher, Place, CALIB
+from triallog import TrialLog
+from results import trialFields
+from clock import MonotonicClock, VirtualClock
+
+defaultPort = 5601
+
+class SessionError(Exception):
+	pass
+
+def encode(message):
+	return (json.dumps(message) + '\n').encode('utf-8')
+
+def decode(line):
+	return json.loads(line.decode('utf-8'))
+
+# A learner on the service
+class Session(object):
+	def __init__(self, number, teacher, clock, owner):
+		self.number = number
+		self.teacher = teacher
+		self.clock = clock
+		self.owner = owner  # the connection that opened it, the session is closed with it
+		self.saving = False # saving its results in a worker thread, see beginSave
+		self.dropped = False # its owner went away while it was saving
+
+class SessionService(object):
+	def __init__(self, directory='results'):
+		self.directory = directory
+		self.sessions = {}
+		self.nextNumber = 1
+		self.started = int(time.time())
+		# the operations on a session, by name
+		self.ops = {
+			'startLog': self.startLog,
+			'nextCalib': self.nextCalib,
+			'calibResult': self.calibResult,
+			'doneCalibrating': self.doneCalibrating,
+			'nextTrial': self.nextTrial,
+			'trialResult': self.trialResult,
+			'percentageCorrect': self.percentageCorrect,
+			'saveResults': self.saveResults,
+			'close': self.close,
+		}
+
+	# answer a request, an error is sent back instead of stopping the service
+	def handle(self, request, owner=None):
+		reply = {'id': request.get('id')}
+		try:
+			reply['result'] = self.call(request, owner)
+		except Exception as e:
+			reply['error'] = '%s: %s' % (type(e).__name__, e)
+		return reply
+
+	def call(self, request, owner=None):
+		op = request.get('op')
+		args = request.get('args', [])
+		if op == 'open':
+			return self.open(owner, request.get('time', 0.0), *args)
+		if op not in self.ops:
+			raise SessionError('unknown operation %r' % (op,))
+		session = self.session(request.get('session'))
+		if session.saving:
+			raise SessionError('session %r is saving its results' % (session.number,))
+		if 'time' in request:
+			session.clock.time = request['time']
+		return self.ops[op](session, *args)
+
+	def session(self, number):
+		session = self.sessions.get(number)
+		if session is None:
+			raise SessionError('no session %r' % (number,))
+		return session
+
+	# places are sent as (x, y, name, size); the reply holds the order the teacher shuffled them
+	# in (indices into the places sent) and the calibration targets
+	def open(self, owner, time, places, width, height, spacing, expLen, subject):
+		mapPlaces = [Place(x, y, name, size) for (x, y, name, size) in places]
+		index = dict((id(p), i) for (i, p) in enumerate(mapPlaces))
+		clock = VirtualClock(time)
+		teacher = Teacher(mapPlaces, width, height, spacing, expLen, subject, clock)
+		session = Session(self.nextNumber, teacher, clock, owner)
+		self.sessions[session.number] = session
+		self.nextNumber += 1
+		return {
+			'session': session.number,
+			'order': [index[id(p)] for p in teacher.mapPlaces],
+			'calib': [p.coords() for p in teacher.calibPlaces],
+		}
+
+	# sessions started in the same second get their own prefix
+	def startLog(self, session):
+		session.teacher.startLog(self.directory, '%d_%d' % (self.started, session.number))
+		return session.teacher.prefix
+
+	def nextCalib(self, session):
+		return session.teacher.getNextCalibTrial()
+
+	def calibResult(self, session, rt, velocity, distance, shortest, timestamp):
+		session.teacher.currentCalibrationResult(rt, velocity, distance, shortest, timestamp)
+
+	def doneCalibrating(self, session):
+		return session.teacher.doneCalibrating()
+
+	def nextTrial(self, session, time):
+		(place, type, hintAllowed) = session.teacher.getNextTrial(time)
+		return [int(place), int(type), bool(hintAllowed)]
+
+	# the trial as it was logged, so the client can keep the same TrialLog
+	def trialResult(self, session, result, hintUsed, rt, velocity, distance, shortest, timestamp):
+		teacher = session.teacher
+		teacher.currentTrialResult(result, hintUsed, rt, velocity, distance, shortest, timestamp)
+		trial = teacher.completedTrials[-1]
+		return [getattr(trial, f) for f in trialFields]
+
+	def percentageCorrect(self, session, numTrials):
+		return session.teacher.percentageCorrect(numTrials)
+
+	def saveResults(self, session):
+		return session.teacher.saveResults()
+
+	def close(self, session):
+		del self.sessions[session.number]
+		if session.teacher.log:
+			session.teacher.log.close()
+		return True
+
+	# a client went away: its sessions end, their logs stay behind for results.py. A session
+	# that is saving is closed when the save is done.
+	def dropOwner(self, owner):
+		for session in [s for s in self.sessions.values() if s.owner is owner]:
+			if session.saving:
+				session.dropped = True
+			else:
+				self.close(session)
+
+	# Saving outside the thread of the other requests: beginSave (on that thread) marks the
+	# session so nothing else touches its teacher, save runs in a worker thread, and endSave (on
+	# that thread again) lets the session go on. Returns the session, raises SessionError if the
+	# request can not be saved.
+	def beginSave(self, request):
+		session = self.session(request.get('session'))
+		if session.saving:
+			raise SessionError('session %r is saving its results' % (session.number,))
+		session.saving = True
+		return session
+
+	# the reply to a saveResults request of a session from beginSave
+	def save(self, request, session):
+		reply = {'id': request.get('id')}
+		try:
+			reply['result'] = self.saveResults(session)
+		except Exception as e:
+			reply['error'] = '%s: %s' % (type(e).__name__, e)
+		return reply
+
+	def endSave(self, session):
+		session.saving = False
+		if session.dropped:
+			self.close(session)
+
+# Runs a service in this process, with the same encoding as over a socket
+class LoopbackConnection(object):
+	def __init__(self, service=None):
+		self.service = service or SessionService()
+
+	def request(self, message):
+		return decode(encode(self.service.handle(decode(encode(message)), self)))
+
+	def close(self):
+		self.service.dropOwner(self)
+
+# Blocking connection to a service, usable from the App on Python 2 and 3
+class SocketConnection(object):
+	def __init__(self, host='127.0.0.1', port=defaultPort, timeout=10.0):
+		self.socket = socket.create_connection((host, port), timeout)
+		self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		self.input = self.socket.makefile('rb')
+
+	def request(self, message):
+		self.socket.sendall(encode(message))
+		line = self.input.readline()
+		if not line:
+			raise SessionError('the session service closed the connection')
+		return decode(line)
+
+	def close(self):
+		self.input.close()
+		self.socket.close()
+
+# 'host:port' as given on the command line
+def connect(address):
+	(host, sep, port) = address.rpartition(':')
+	if not sep:
+		return SocketConnection(address)
+	return SocketConnection(host or '127.0.0.1', int(port))
+
+# Stands in for a Teacher in the App, the decisions are made by the service
+class RemoteTeacher(object):
+	def __init__(self, connection, mapPlaces, width, height, spacing, expLen, subject, clock=None):
+		self.connection = connection
+		if clock is None:
+			clock = MonotonicClock()
+		self.clock = clock
+		self.requests = 0
+		self.session = None
+
+		self.mapPlaces = mapPlaces
+		self.numPlaces = len(mapPlaces)
+		self.subjectName = subject
+		self.spacingFirst = spacing
+		self.currentTrialPlace = 0
+		self.trialType = 0
+		self.calibCounter = -1
+		self.completedTrials = TrialLog()
+		self.completedCalibTrials = TrialLog()
+		self.prefix = None
+
+		opened = self.request('open', [(p.x, p.y, p.name, p.size) for p in mapPlaces], width, height, spacing, expLen, subject)
+		self.session = opened['session']
+		# same order as the teacher on the service, like Teacher the list is shuffled in place
+		mapPlaces[:] = [mapPlaces[i] for i in opened['order']]
+		self.calibPlaces = [Place(x, y) for (x, y) in opened['calib']]
+
+	def request(self, op, *args):
+		self.requests += 1
+		reply = self.connection.request({'id': self.requests, 'session': self.session, 'op': op, 'args': args, 'time': self.clock()})
+		if 'error' in reply:
+			raise SessionError('%s failed: %s' % (op, reply['error']))
+		return reply['result']
+
+	# the service decides at the time of the request, there is nothing to plan here
+	def planNextTrial(self, time, at):
+		return None
+
+	def getNextTrial(self, time, plan=None):
+		(place, type, hintAllowed) = self.request('nextTrial', time)
+		self.currentTrialPlace = place
+		self.trialType = type
+		return (place, type, hintAllowed)
+
+	def currentTrialResult(self, trialResult, hintUsed, rt, velocity, distance, shortest, timestamp):
+		trial = self.request('trialResult', trialResult, hintUsed, rt, velocity, distance, shortest, timestamp)
+		self.completedTrials.append(*trial)
+		return True
+
+	def getNextCalibTrial(self):
+		self.calibCounter = self.request('nextCalib')
+		return self.calibCounter
+
+	def doneCalibrating(self):
+		return self.request('doneCalibrating')
+
+	def currentCalibrationResult(self, rt, velocity, distance, shortest, timestamp):
+		self.request('calibResult', rt, velocity, distance, shortest, timestamp)
+		self.completedCalibTrials.append(CALIB, 0, self.calibCounter, '', 1, False, rt, velocity, distance, shortest, timestamp)
+
+	def percentageCorrect(self, numTrials):
+		return self.request('percentageCorrect', numTrials)
+
+	def currentTrialPlaceCoords(self):
+		return self.mapPlaces[self.currentTrialPlace].coords()
+
+	def currentCalibCoords(self):
+		return self.calibPlaces[self.calibCounter].coords()
+
+	def currentTrialPlaceSize(self):
+		return self.mapPlaces[self.currentTrialPlace].size
+
+	def currentTrialPlaceName(self):
+		return self.mapPlaces[self.currentTrialPlace].name
+
+	def getPlace(self, i):
+		return self.mapPlaces[i]
+
+	def getCalib(self, i):
+		return self.calibPlaces[i]
+
+	# the log is written by the service, the prefix names the files of the App
+	def startLog(self, directory='results'):
+		self.prefix = self.request('startLog')
+
+	def saveResults(self):
+		return self.request('saveResults')
+
+	def close(self):
+		self.request('close')
+
+# One client connection to the service on the event loop
+def serverProtocol(asyncio, service):
+	class SessionProtocol(asyncio.Protocol):
+		def connection_made(self, transport):
+			self.transport = transport
+			self.buffer = b''
+			self.waiting = []   # requests that came in during a save, in order
+			self.busy = False   # a save of this connection runs in a worker thread
+			self.lost = False
+			sock = transport.get_extra_info('socket')
+			if sock is not None:
+				sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+		def data_received(self, data):
+			self.buffer += data
+			while b'\n' in self.buffer:
+				(line, self.buffer) = self.buffer.split(b'\n', 1)
+				self.waiting.append(line)
+			self.handleWaiting()
+
+		def reply(self, reply):
+			if not self.lost:
+				self.transport.write(encode(reply))
+
+		def handleWaiting(self):
+			while self.waiting and not self.busy:
+				try:
+					request = decode(self.waiting.pop(0))
+				except ValueError:
+					self.reply({'id': None, 'error': 'not a json request'})
+					continue
+				if request.get('op') == 'saveResults':
+					# writes all the result files, keep the loop free for the others
+					self.inWorker(request)
+				else:
+					self.reply(service.handle(request, self))
+
+		def inWorker(self, request):
+			try:
+				session = service.beginSave(request)
+			except SessionError as e:
+				self.reply({'id': request.get('id'), 'error': '%s: %s' % (type(e).__name__, e)})
+				return
+			self.busy = True
+			future = asyncio.get_event_loop().run_in_executor(None, service.save, request, session)
+			future.add_done_callback(lambda f: self.saved(request, session, f))
+
+		# on the loop, when the worker is done
+		def saved(self, request, session, future):
+			service.endSave(session)
+			try:
+				reply = future.result()
+			except Exception as e:
+				reply = {'id': request.get('id'), 'error': '%s: %s' % (type(e).__name__, e)}
+			self.busy = False
+			self.reply(reply)
+			self.handleWaiting()
+
+		def connection_lost(self, exc):
+			self.lost = True
+			self.waiting = []
+			service.dropOwner(self)
+
+	return SessionProtocol
+
+def serve(host='127.0.0.1', port=defaultPort, service=None):
+	try:
+		import asyncio
+	except ImportError:
+		raise SessionError('the session service needs Python 3')
+	if service is None:
+		service = SessionService()
+	loop = asyncio.new_event_loop()
+	asyncio.set_event_loop(loop)
+	protocol = serverProtocol(asyncio, service)
+	server = loop.run_until_complete(loop.create_server(protocol, host, port))
+	print('session service on %s:%d' % (host, port))
+	try:
+		loop.run_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.close()
+		loop.run_until_complete(server.wait_closed())
+		for session in list(service.sessions.values()):
+			service.close(session)
+		loop.close()
+
+def main(argv):
+	parser = OptionParser(usage='%prog [options]')
+	parser.add_option('--host', default='127.0.0.1')
+	parser.add_option('-p', '--port', type='int', default=defaultPort)
+	parser.add_option('-d', '--directory', default='results', help='directory the session logs and results are written to')
+	(options, args) = parser.parse_args(argv)
+	serve(options.host, options.port, SessionService(options.directory))
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,247 @@
+# Copyright Menno Nijboer, 2015
+
+# Headless simulation of experiment sessions: synthetic learners answer the trials chosen by
+# the Teacher while a virtual clock stands in for the real one, so no window is needed and a
+# session of twenty minutes takes only a fraction of a second.
+
+from __future__ import division, print_function
+
+import sys
+import random
+import math
+import timeit
+from optparse import OptionParser
+
+from teacher import Teacher, Place, loadMapPlaces
+from teacher import TRIAL, DRILL, WRONG, CORRECT, HINT, NOHINT, SPACING
+from clock import VirtualClock
+
+# same timing as the App
+tickLen = 1.0/70.0
+screenWidth = 1194
+screenHeight = 760
+
+# A simulated subject. Its memory of a place follows the same power law as the model of the
+# Teacher, but with its own (unknown to the Teacher) decay per place.
+class SyntheticLearner(object):
+	def __init__(self, seed=None, speed=450.0, decay=0.35, decaySpread=0.08, treshold=-0.8, noise=0.3, F=1.0, maxTrialLen=15.0):
+		self.rng = random.Random(seed)
+		self.speed = speed              # pixels per second
+		self.decay = decay              # average decay of the memory traces
+		self.decaySpread = decaySpread  # how much places differ in difficulty
+		self.treshold = treshold        # activation at which recall is at chance
+		self.noise = noise              # noise of the recall probability
+		self.F = F                      # latency factor
+		self.maxTrialLen = maxTrialLen
+
+		self.memory = {}   # place -> times the place was seen
+		self.decays = {}   # place -> decay of the place
+
+	def activation(self, place, curTime):
+		times = self.memory.get(place)
+		if not times:
+			return None
+		d = self.decays[place]
+		act = 0
+		for t in times:
+			act += math.pow(curTime - t, -d)
+		return math.log(act)
+
+	# time needed to move the pointer over a distance
+	def movementTime(self, distance):
+		return 0.25 + (distance / self.speed) * self.rng.uniform(1.0, 1.3)
+
+	def calibrationTrial(self, distance):
+		rt = self.movementTime(distance)
+		travelled = distance * self.rng.uniform(1.05, 1.4)
+		return (rt, travelled)
+
+	# returns (result, rt, travelled distance)
+	def trial(self, place, trialType, distance, curTime):
+		rt = self.movementTime(distance)
+		travelled = distance * self.rng.uniform(1.05, 1.4)
+		if trialType == DRILL:
+			# the arrow shows where to click
+			return (CORRECT, rt + 0.5, travelled)
+
+		act = self.activation(place, curTime)
+		if act is None:
+			# never seen it, pick a random place
+			return (WRONG, min(self.maxTrialLen, rt + self.rng.uniform(2.0, 10.0)), travelled)
+
+		pCorrect = 1.0 / (1.0 + math.exp(-(act - self.treshold) / self.noise))
+		rt += self.F * math.exp(-act) * self.rng.uniform(0.8, 1.2)
+		if self.rng.random() < pCorrect:
+			return (CORRECT, min(self.maxTrialLen, rt), travelled)
+		return (WRONG, min(self.maxTrialLen, rt + self.rng.uniform(0.0, 3.0)), travelled)
+
+	# the place has been shown to the learner (after a drill or as feedback)
+	def study(self, place, curTime):
+		if place not in self.memory:
+			self.memory[place] = []
+			self.decays[place] = max(0.05, self.rng.gauss(self.decay, self.decaySpread))
+		self.memory[place].append(curTime)
+
+# Summary of one simulated session
+class SessionResult(object):
+	def __init__(self, teacher, decisions, latencies):
+		self.teacher = teacher
+		self.decisions = decisions     # (place name, trial type, condition) of every trial
+		self.latencies = latencies     # wall clock time of every getNextTrial call
+
+		trials = teacher.completedTrials
+		self.numTrials = len(trials)
+		self.accuracy = float(trials.column('result').sum()) / max(1, len(trials))
+		self.numRehearsals = int(((trials.column('type') == TRIAL) & (trials.column('condition') == SPACING)).sum())
+		self.itemsIntroduced = len([p for p in teacher.mapPlaces if p.numShows > 0])
+
+	def latencyPercentile(self, q):
+		if len(self.latencies) == 0:
+			return 0.0
+		ordered = sorted(self.latencies)
+		return ordered[min(len(ordered)-1, int(q*len(ordered)))]
+
+	def summary(self):
+		return {
+			'trials': self.numTrials,
+			'accuracy': self.accuracy,
+			'rehearsals': self.numRehearsals,
+			'introduced': self.itemsIntroduced,
+			'latency_mean': sum(self.latencies) / max(1, len(self.latencies)),
+			'latency_p95': self.latencyPercentile(0.95),
+			'latency_max': max(self.latencies) if self.latencies else 0.0,
+		}
+
+# Runs the calibration and experiment the same way the App does, without a window
+class Simulator(object):
+	def __init__(self, places, spacingFirst=True, expLength=20*60.0, width=screenWidth, height=screenHeight, teacherParams=None):
+		self.places = places
+		self.spacingFirst = spacingFirst
+		self.expLength = expLength
+		self.width = width
+		self.height = height
+		self.maxTrialLen = 15.0
+		self.posFeedbackLen = 0.75
+		self.negFeedbackLen = 2.0
+		self.teacherParams = teacherParams or {} # overrides of the model constants
+		self.validateActCache = False
+		self.maxTrials = None # stop the session after this many trials, even if there is time left
+		self.planAhead = False # plan the next trial during feedback, as the App does
+
+	# the Teacher shuffles and annotates the places, so every session gets fresh ones
+	def copyPlaces(self):
+		return [Place(p.x, p.y, p.name, p.size) for p in self.places]
+
+	def createTeacher(self, clock):
+		teacher = Teacher(self.copyPlaces(), self.width, self.height, self.spacingFirst, self.expLength, 'simulated', clock)
+		for (name, value) in self.teacherParams.items():
+			setattr(teacher, name, value)
+		teacher.validateActCache = self.validateActCache
+		return teacher
+
+	def runSession(self, learner, seed=None):
+		# the Teacher uses the global random generator for the order of places
+		random.seed(seed)
+		clock = VirtualClock()
+		teacher = self.createTeacher(clock)
+		mouse = (self.width//2, self.height//2)
+
+		# calibration
+		while not teacher.doneCalibrating():
+			teacher.getNextCalibTrial()
+			(tx, ty) = teacher.currentCalibCoords()
+			shortest = abs(tx-mouse[0]) + abs(ty-mouse[1])
+			(rt, travelled) = learner.calibrationTrial(shortest)
+			clock.advance(rt)
+			teacher.currentCalibrationResult(rt, travelled*tickLen/rt, travelled, shortest, clock())
+			mouse = (tx, ty)
+
+		# experiment
+		start = clock()
+		decisions = []
+		latencies = []
+		timer = timeit.default_timer
+		plan = None
+		while clock() - start < self.expLength and (self.maxTrials is None or len(decisions) < self.maxTrials):
+			t0 = timer()
+			(place, trialType, hintAllowed) = teacher.getNextTrial(clock() - start, plan)
+			latencies.append(timer() - t0)
+			decisions.append((teacher.currentTrialPlaceName(), trialType, teacher.trialCondition))
+
+			(tx, ty) = teacher.currentTrialPlaceCoords()
+			shortest = abs(tx-mouse[0]) + abs(ty-mouse[1])
+			(result, rt, travelled) = learner.trial(place, trialType, shortest, clock())
+			hint = NOHINT
+			if hintAllowed and rt > 0.66*self.maxTrialLen:
+				hint = HINT
+			clock.advance(rt)
+			teacher.currentTrialResult(result, hint, rt, travelled*tickLen/rt, travelled, shortest, clock() - start)
+
+			# feedback always shows the right place
+			learner.study(place, clock())
+			if result == CORRECT:
+				feedbackLen = self.posFeedbackLen
+			else:
+				feedbackLen = self.negFeedbackLen
+			if self.planAhead:
+				plan = teacher.planNextTrial(clock() + feedbackLen - start, clock() + feedbackLen)
+			clock.advance(feedbackLen)
+			mouse = (tx, ty)
+
+		return SessionResult(teacher, decisions, latencies)
+
+	def runSessions(self, numSessions, seed=0, learnerParams=None):
+		results = []
+		for i in range(numSessions):
+			sessionSeed = seed*1000003 + i
+			learner = SyntheticLearner(seed=2*sessionSeed+1, **(learnerParams or {}))
+			results.append(self.runSession(learner, seed=2*sessionSeed))
+		return results
+
+# random places spread over the screen, for maps of any size
+def syntheticPlaces(numPlaces, width=screenWidth, height=screenHeight, seed=0):
+	rng = random.Random(seed)
+	return [Place(rng.randrange(20, width-20), rng.randrange(20, height-90), 'Place %d' % i, 0.6) for i in range(numPlaces)]
+
+def main(argv):
+	parser = OptionParser(usage='%prog [options]')
+	parser.add_option('-n', '--sessions', type='int', default=100, help='number of sessions to simulate')
+	parser.add_option('-m', '--map', default='map.xml', help='map file to load the places from')
+	parser.add_option('-p', '--places', type='int', default=0, help='use a synthetic map with this many places instead')
+	parser.add_option('-l', '--length', type='float', default=20*60.0, help='length of a session in seconds')
+	parser.add_option('-s', '--seed', type='int', default=0)
+	parser.add_option('-f', '--flashcard-first', action='store_true', default=False, help='start with the flashcard condition')
+	parser.add_option('-t', '--trace', action='store_true', default=False, help='print the decisions of every session')
+	parser.add_option('--validate', action='store_true', default=False, help='check the activation cache every trial')
+	parser.add_option('--plan-ahead', action='store_true', default=False, help='plan every next trial during feedback')
+	(options, args) = parser.parse_args(argv)
+
+	if options.places > 0:
+		places = syntheticPlaces(options.places, seed=options.seed)
+	else:
+		places = loadMapPlaces(options.map)
+
+	sim = Simulator(places, not options.flashcard_first, options.length)
+	sim.validateActCache = options.validate
+	sim.planAhead = options.plan_ahead
+	t0 = timeit.default_timer()
+	results = sim.runSessions(options.sessions, options.seed)
+	elapsed = timeit.default_timer() - t0
+
+	if options.trace:
+		for (i, r) in enumerate(results):
+			for (name, trialType, condition) in r.decisions:
+				print('%d\t%s\t%d\t%d' % (i, name, trialType, condition))
+
+	n = max(1, len(results))
+	latencies = [l for r in results for l in r.latencies]
+	print('sessions:          %d (%.1f per minute)' % (len(results), 60*len(results)/elapsed))
+	print('trials/session:    %.1f' % (sum(r.numTrials for r in results) / n))
+	print('accuracy:          %.3f' % (sum(r.accuracy for r in results) / n))
+	print('rehearsals:        %.1f' % (sum(r.numRehearsals for r in results) / n))
+	print('items introduced:  %.1f' % (sum(r.itemsIntroduced for r in results) / n))
+	print('decision latency:  mean %.1f us, max %.1f us' % (1e6*sum(latencies)/max(1, len(latencies)), 1e6*max(latencies or [0])))
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv[1:]))
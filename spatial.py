@@ -0,0 +1,125 @@
+# Copyright Menno Nijboer, 2015
+
+from __future__ import division
+
+import math
+import random
+
+from teacher import placeClickArea, placeClickAreaSqr
+
+# Uniform grid over a list of places. The cells are as large as the click area, so a click only
+# has to be checked against the places in the cell it falls in and the eight cells around it.
+class PlaceGrid(object):
+	def __init__(self, places, cellSize=placeClickArea):
+		self.places = places
+		self.cellSize = cellSize
+		self.cells = {}
+		for (i, place) in enumerate(places):
+			self.cells.setdefault(self.cell(place.x, place.y), []).append(i)
+
+	def cell(self, x, y):
+		return (int(x // self.cellSize), int(y // self.cellSize))
+
+	# index of the nearest place within clicking distance of (x, y), the lowest index on a tie
+	def nearest(self, x, y):
+		(cx, cy) = self.cell(x, y)
+		best = None
+		bestDist = placeClickAreaSqr
+		for gx in (cx-1, cx, cx+1):
+			for gy in (cy-1, cy, cy+1):
+				for i in self.cells.get((gx, gy), ()):
+					place = self.places[i]
+					distanceSqr = (place.x-x)*(place.x-x) + (place.y-y)*(place.y-y)
+					if distanceSqr < bestDist or (distanceSqr == bestDist and (best is None or i < best)):
+						best = i
+						bestDist = distanceSqr
+		return best
+
+# Random points in the rectangle bounds = (x0, y0, x1, y1), at least spacing apart, that stops as
+# soon as count points are found. A background grid with cells of spacing/sqrt(2) holds at most
+# one point per cell, so a candidate is only compared with the points in the 5x5 cells around it.
+# Points closer than avoidDist to one of the (x, y) in avoid are not used. Candidates are first
+# thrown uniformly over the rectangle, attempts per point, which spreads the points over the
+# whole of it. When that does not give enough, the rectangle is filled the way of Bridson's
+# algorithm: new points are tried in the ring of spacing to 2*spacing around an active point,
+# and a point stops being active after attempts failed tries; the avoided points can split the
+# rectangle, so a new random point is tried whenever no point is active. There are at most as
+# many points as grid cells, so this takes a bounded number of tries. Raises ValueError when
+# fewer than count points fit.
+def poissonDiskSample(count, spacing, bounds, seed=None, avoid=(), avoidDist=0.0, attempts=30):
+	rng = random.Random(seed)
+	(x0, y0, x1, y1) = bounds
+	cellSize = spacing / math.sqrt(2)
+	cols = max(int(math.ceil((x1 - x0) / cellSize)), 0)
+	rows = max(int(math.ceil((y1 - y0) / cellSize)), 0)
+	grid = [None]*(cols*rows)
+	spacingSqr = spacing*spacing
+
+	# the points to stay away from, in cells of avoidDist
+	blocked = {}
+	if avoidDist > 0:
+		for (ax, ay) in avoid:
+			blocked.setdefault((int(ax // avoidDist), int(ay // avoidDist)), []).append((ax, ay))
+	avoidSqr = avoidDist*avoidDist
+
+	def fits(x, y):
+		if not (x0 <= x < x1 and y0 <= y < y1):
+			return False
+		(cx, cy) = (int((x - x0) // cellSize), int((y - y0) // cellSize))
+		for gy in range(max(cy-2, 0), min(cy+3, rows)):
+			for gx in range(max(cx-2, 0), min(cx+3, cols)):
+				p = grid[gy*cols + gx]
+				if p is not None and (p[0]-x)*(p[0]-x) + (p[1]-y)*(p[1]-y) < spacingSqr:
+					return False
+		if blocked:
+			(bx, by) = (int(x // avoidDist), int(y // avoidDist))
+			for gx in (bx-1, bx, bx+1):
+				for gy in (by-1, by, by+1):
+					for (ax, ay) in blocked.get((gx, gy), ()):
+						if (ax-x)*(ax-x) + (ay-y)*(ay-y) < avoidSqr:
+							return False
+		return True
+
+	points = []
+	active = []
+	def add(x, y):
+		grid[int((y - y0) // cellSize)*cols + int((x - x0) // cellSize)] = (x, y)
+		points.append((x, y))
+		active.append((x, y))
+
+	# dart throwing
+	for i in range(attempts*count):
+		if len(points) == count:
+			return points
+		(x, y) = (rng.uniform(x0, x1), rng.uniform(y0, y1))
+		if fits(x, y):
+			add(x, y)
+
+	# fill the room that is left
+	while len(points) < count:
+		if not active:
+			for i in range(attempts):
+				(x, y) = (rng.uniform(x0, x1), rng.uniform(y0, y1))
+				if fits(x, y):
+					add(x, y)
+					break
+			else:
+				break
+			continue
+		k = rng.randrange(len(active))
+		(px, py) = active[k]
+		for i in range(attempts):
+			# uniform over the area of the ring
+			r = spacing*math.sqrt(rng.uniform(1, 4))
+			a = rng.uniform(0, 2*math.pi)
+			(x, y) = (px + r*math.cos(a), py + r*math.sin(a))
+			if fits(x, y):
+				add(x, y)
+				break
+		else:
+			active[k] = active[-1]
+			active.pop()
+
+	if len(points) < count:
+		raise ValueError('only %d points %g apart fit in %r, %d are needed' % (len(points), spacing, bounds, count))
+	return points
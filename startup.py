@@ -0,0 +1,80 @@
+# Copyright Menno Nijboer, 2015
+
+# Wall time of the start-up phases of TopoStudy, from the start of topostudy.py up to the
+# first frame. Phases can be nested; a phase only counts while the timer is running, so code
+# shared with the simulator costs nothing there.
+
+from __future__ import division
+
+import timeit
+from contextlib import contextmanager
+
+class StartupTimer(object):
+	def __init__(self, clock=timeit.default_timer):
+		self.clock = clock
+		self.start = None
+		self.total = None
+		self.running = False
+		self.verbose = False  # print the breakdown when start-up is done
+		self.phases = []      # [name, depth, seconds], in the order the phases started
+		self.depth = 0
+
+	def begin(self):
+		if self.start is None:
+			self.start = self.clock()
+			self.running = True
+
+	@contextmanager
+	def phase(self, name):
+		if not self.running:
+			yield
+			return
+		entry = [name, self.depth, 0.0]
+		self.phases.append(entry)
+		self.depth += 1
+		t0 = self.clock()
+		try:
+			yield
+		finally:
+			entry[2] = self.clock() - t0
+			self.depth -= 1
+
+	# time spent waiting for the user does not count
+	@contextmanager
+	def paused(self):
+		t0 = self.clock()
+		try:
+			yield
+		finally:
+			if self.running:
+				self.start += self.clock() - t0
+
+	# start-up is over, the time not covered by a phase is reported as 'other'
+	def finish(self):
+		if not self.running:
+			return False
+		self.total = self.clock() - self.start
+		self.running = False
+		return True
+
+	def other(self):
+		return self.total - sum(seconds for (name, depth, seconds) in self.phases if depth == 0)
+
+	def report(self):
+		lines = []
+		for (name, depth, seconds) in self.phases:
+			lines.append('%-40s %9.1f ms' % ('  '*depth + name, 1000*seconds))
+		lines.append('%-40s %9.1f ms' % ('other', 1000*self.other()))
+		lines.append('%-40s %9.1f ms' % ('total', 1000*self.total))
+		return '\n'.join(lines)
+
+	# tab separated: phase, depth, seconds
+	def save(self, filename):
+		out = open(filename, 'w')
+		out.write('phase\tdepth\tseconds\n')
+		for (name, depth, seconds) in self.phases + [['other', 0, self.other()], ['total', 0, self.total]]:
+			out.write('%s\t%d\t%r\n' % (name, depth, seconds))
+		out.close()
+
+# the timer of this process
+startupTimer = StartupTimer()
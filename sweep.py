@@ -0,0 +1,153 @@
+# Copyright Menno Nijboer, 2015
+
+# Parameter sweep over the constants of the spacing model. Every point of a grid (or random
+# search) runs a batch of simulated sessions, spread over all cores. A summary line per
+# point is written to the results file as soon as the point is done.
+
+from __future__ import division, print_function
+
+import sys
+import time
+import random
+import itertools
+import multiprocessing
+from optparse import OptionParser
+
+from teacher import loadMapPlaces
+from simulate import Simulator, syntheticPlaces
+
+# the constants of Teacher that can be swept
+sweepParams = ['treshold', 'F', 'std_a', 'c']
+columns = ['point'] + sweepParams + ['sessions', 'trials', 'accuracy', 'rehearsals', 'introduced', 'latency_mean', 'latency_p95', 'latency_max']
+
+# the places of the map, handed to each worker process once. They are loaded before the pool
+# starts: an initializer that fails makes the pool start new workers forever.
+workerPlaces = None
+
+def initWorker(places):
+	global workerPlaces
+	workerPlaces = places
+
+# run a batch of sessions for one point. All points use the same learners and seeds, so
+# differences between points come from the parameters only.
+def runPoint(job):
+	(index, params, numSessions, seed, spacingFirst, expLength) = job
+	sim = Simulator(workerPlaces, spacingFirst, expLength, teacherParams=params)
+	results = sim.runSessions(numSessions, seed)
+
+	n = max(1, len(results))
+	latencies = sorted(l for r in results for l in r.latencies)
+	summary = {'point': index}
+	for name in sweepParams:
+		# swept or not, report the value the Teacher actually used
+		summary[name] = getattr(results[0].teacher, name) if results else params.get(name)
+	summary['sessions'] = len(results)
+	summary['trials'] = sum(r.numTrials for r in results) / n
+	summary['accuracy'] = sum(r.accuracy for r in results) / n
+	summary['rehearsals'] = sum(r.numRehearsals for r in results) / n
+	summary['introduced'] = sum(r.itemsIntroduced for r in results) / n
+	summary['latency_mean'] = sum(latencies) / max(1, len(latencies))
+	summary['latency_p95'] = latencies[int(0.95*(len(latencies)-1))] if latencies else 0.0
+	summary['latency_max'] = latencies[-1] if latencies else 0.0
+	return summary
+
+# 'name=a,b,c' gives a list of values, 'name=lo:hi' a range for the random search
+def parseParam(text):
+	(name, values) = text.split('=', 1)
+	if name not in sweepParams:
+		raise ValueError('unknown parameter %s, choose from %s' % (name, ', '.join(sweepParams)))
+	if ':' in values:
+		(lo, hi) = values.split(':')
+		return (name, (float(lo), float(hi)))
+	return (name, [float(v) for v in values.split(',')])
+
+def gridPoints(params):
+	names = sorted(params)
+	for name in names:
+		if isinstance(params[name], tuple):
+			raise ValueError('a grid needs a list of values for %s, not a range' % name)
+	for values in itertools.product(*[params[name] for name in names]):
+		yield dict(zip(names, values))
+
+def randomPoints(params, numPoints, seed):
+	rng = random.Random(seed)
+	names = sorted(params)
+	for i in range(numPoints):
+		point = {}
+		for name in names:
+			values = params[name]
+			if isinstance(values, tuple):
+				point[name] = rng.uniform(values[0], values[1])
+			else:
+				point[name] = rng.choice(values)
+		yield point
+
+def formatValue(value):
+	if isinstance(value, float):
+		return '%.6g' % value
+	return str(value)
+
+def runSweep(points, output, places, numSessions=20, seed=0, jobs=None, spacingFirst=True, expLength=20*60.0):
+	jobList = [(i, point, numSessions, seed, spacingFirst, expLength) for (i, point) in enumerate(points)]
+	pool = multiprocessing.Pool(jobs, initWorker, (places,))
+	done = 0
+	try:
+		output.write('\t'.join(columns) + '\n')
+		output.flush()
+		for summary in pool.imap_unordered(runPoint, jobList):
+			output.write('\t'.join(formatValue(summary.get(c, '')) for c in columns) + '\n')
+			output.flush()
+			done += 1
+		pool.close()
+	except:
+		pool.terminate()
+		raise
+	finally:
+		pool.join()
+	return done
+
+def main(argv):
+	parser = OptionParser(usage='%prog [options] -p name=values [-p name=values ...]')
+	parser.add_option('-p', '--param', action='append', default=[], help='name=a,b,c for a list of values or name=lo:hi for a range. Parameters: ' + ', '.join(sweepParams))
+	parser.add_option('-r', '--random', type='int', default=0, help='draw this many random points instead of the full grid')
+	parser.add_option('-n', '--sessions', type='int', default=20, help='simulated sessions per point')
+	parser.add_option('-j', '--jobs', type='int', default=None, help='number of worker processes (default: all cores)')
+	parser.add_option('-o', '--output', default=None, help='file to write the results to (default: sweep_<timestamp>.txt)')
+	parser.add_option('-m', '--map', default='map.xml')
+	parser.add_option('--places', type='int', default=0, help='use a synthetic map with this many places')
+	parser.add_option('-l', '--length', type='float', default=20*60.0, help='length of a session in seconds')
+	parser.add_option('-s', '--seed', type='int', default=0)
+	parser.add_option('-f', '--flashcard-first', action='store_true', default=False)
+	(options, args) = parser.parse_args(argv)
+
+	if len(options.param) == 0:
+		parser.error('nothing to sweep, give at least one -p')
+	try:
+		params = dict(parseParam(p) for p in options.param)
+		if options.random > 0:
+			points = list(randomPoints(params, options.random, options.seed))
+		else:
+			points = list(gridPoints(params))
+	except ValueError as e:
+		parser.error(str(e))
+
+	if options.places > 0:
+		places = syntheticPlaces(options.places, seed=options.seed)
+	else:
+		try:
+			places = loadMapPlaces(options.map)
+		except (IOError, SyntaxError) as e:
+			# SyntaxError covers the ParseError of a broken xml
+			parser.error('cannot load the map %s: %s' % (options.map, e))
+
+	filename = options.output or 'sweep_%d.txt' % int(time.time())
+	print('sweeping %d points, %d sessions each, results in %s' % (len(points), options.sessions, filename))
+	output = open(filename, 'w')
+	try:
+		runSweep(points, output, places, options.sessions, options.seed, options.jobs, not options.flashcard_first, options.length)
+	finally:
+		output.close()
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv[1:]))
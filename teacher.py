@@ -0,0 +1,659 @@
+# Copyright Menno Nijboer, 2015
+
+from __future__ import division
+
+import os
+import time
+import datetime
+import random
+import math
+from math import sqrt
+
+import numpy as np
+
+from activation import ActivationEngine, ActivationCache, CrossingTimes
+from triallog import TrialLog
+from startup import startupTimer
+from clock import MonotonicClock
+
+# global variables
+placeClickArea = 22
+
+# stuff to make things easier
+placeClickAreaSqr = placeClickArea*placeClickArea
+# modes
+INTRO = 0
+TRIAL = 1
+DRILL = 2
+CALIB = 3
+END = 4
+
+WRONG = 0
+CORRECT = 1
+
+FLASHCARD = 0
+SPACING = 1
+
+HINT = 1
+NOHINT = 0
+
+class Teacher(object):
+    # The spacing / hint cards algorithms, implemented by Jelle Dalenberg
+
+	def __init__(self, mapPlaces, width, height, spacing, expLen, subject, clock=None):
+		self.width = width
+		self.height = height
+		self.mapPlaces = mapPlaces
+		self.numPlaces = len(self.mapPlaces)
+		
+		self.subjectName = subject
+		self.spacingFirst = spacing
+		self.experimentLen = expLen
+		
+		# source of the presentation times, can be replaced by a virtual clock
+		if clock is None:
+			clock = MonotonicClock()
+		self.clock = clock
+		
+		# randomly locate the places
+		# spacing: 0 .. 15 with 0..7 giving optional hits and 8..15 not giving hints
+		# flascard: 16..31 with 16..23 not giving hits, and 24..31 giving hits. Flashcard batches are 4 places
+		random.shuffle(mapPlaces)
+		self.currentTrialPlace = 0
+		self.calibPlaces = []
+		self.calibCounter = -1
+		self.maxCalib = 5
+		self.calibSpacing = 50 # least distance between calibration places
+		self.calibMargin = 100 # least distance of a calibration place to the edge of the screen
+		self.trialType = DRILL
+		self.trialCondition = FLASHCARD
+		self.completedTrials = TrialLog()
+		self.scoreHistory = []
+####################################################################################
+		self.placeCount = 0     #counter needed for counting the self.mapPlaces
+		self.lastPlace = 0  	#Last shown place
+####################################################################################
+		self.doSpacingTrial = True
+		
+		self.date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
+		self.prefix = None
+		self.log = None # log of the session on disk, see startLog
+		self.resultsDir = 'results'
+		with startupTimer.phase('initCalibrationPlaces'):
+			self.initCalibrationPlaces()
+		self.completedCalibTrials = TrialLog()
+
+		# Vars for the flashcard approach
+		self.flashcardResults = [WRONG,WRONG,WRONG,WRONG]
+		self.flashcardBatch = 0
+		self.flashcardBatchOffset = 3 # to make sure that this var becomes 0 before the first trial
+		
+		self.estimatedAvgSpeed = 0
+		
+##########################################################################
+		self.treshold = -0.5          #Activation treshold
+		self.F = 1                   #F in the latency equation
+		self.std_a = 0.25            #Alpha in the decay equation
+		self.curAct = 0              #The activity of the current
+		self.trialStart = 0          #Starting time of whole session
+		self.c = 0.25				 #constant c
+###########################################################################
+		self.engine = ActivationEngine(self.numPlaces) #presentation times and decays of all places
+		self.actCache = ActivationCache(self.engine)   #incrementally updated activations
+		self.validateActCache = False                  #check the cache against activation() every trial
+		self.crossings = None                          #introduced places by the time they fall below treshold
+		self.crossingMargin = 1e-3                     #seconds a crossing time may be off
+		self.planTolerance = 0.1                       #seconds the clock may be off from a plan of the next trial
+
+		# memory of the learner across sessions, see useStore
+		self.store = None
+		self.priorCounts = None
+		self.learner = None         # id of the learner in the store
+		self.storeEpoch = 0.0       # unix time at which the clock read 0
+		self.changedPlaces = set()  # places changed since they were last stored
+		self.lastDecayKnown = False # the decay of lastPlace came from the store
+	
+	def initCalibrationPlaces(self):
+		# generate some random places, but well distributed and away from the places of the map,
+		# seeded from the global generator like the shuffle of the places
+		from spatial import poissonDiskSample
+		bounds = (self.calibMargin, self.calibMargin, self.width-self.calibMargin, self.height-self.calibMargin)
+		seed = random.randrange(1 << 30)
+		try:
+			points = poissonDiskSample(self.maxCalib, self.calibSpacing, bounds, seed, [p.coords() for p in self.mapPlaces], 2*placeClickArea)
+		except ValueError:
+			# the map leaves no room, only keep the places apart
+			points = poissonDiskSample(self.maxCalib, self.calibSpacing, bounds, seed)
+		self.calibPlaces = [Place(int(x), int(y)) for (x, y) in points]
+		
+	# is a trial at this time of the experiment a spacing trial?
+	def spacingTime(self, time):
+		if self.spacingFirst:
+			return time < 0.5*self.experimentLen #first half, do spacing
+		else: #start with flashcard
+			return time > 0.5*self.experimentLen #second half, switch to spacing
+
+	# get the next place according to either spacing / cuecards, using a plan from
+	# planNextTrial if it still holds
+	def getNextTrial(self, time, plan=None):
+		doSpacing = self.spacingTime(time)
+		if plan is not None and not (doSpacing and self.planHolds(plan)):
+			plan = None
+		
+		if doSpacing:
+			#print 'spacing trial'
+			(place, type) = self.getNextSpacingPlace(plan)
+			self.trialType = type                                              		
+			self.currentTrialPlace = place                                     		
+			self.trialCondition = SPACING											
+
+		else: #Flashcard
+			#print 'flashcard trial'
+			(place, type) = self.getNextFlashcardPlace()
+			self.trialType = type
+			self.currentTrialPlace = place
+			self.trialCondition = FLASHCARD		
+		
+		self.doSpacingTrial = not self.doSpacingTrial
+		return (self.currentTrialPlace, self.trialType, (place < 8 or place > 23))  #determine whether a hint can appear
+
+	# Work out ahead of time what getNextTrial(time) will do when it is called at clock time at,
+	# without changing anything: the alpha and decay of the last shown place and its new crossing
+	# time. The App does this during the feedback of a trial, so the end of the feedback does not
+	# solve for the crossing time; it still picks the place, with a pass over the introduced
+	# places (see nextRehearsal). Returns None when there is nothing to plan: flashcard trials,
+	# the first trial, or no crossing times yet.
+	def planNextTrial(self, time, at):
+		if not self.spacingTime(time) or self.placeCount == 0 or self.lastDecayKnown:
+			return None
+		if self.crossings is None or self.crossings.threshold != self.treshold:
+			return None
+		i = self.lastPlace
+		a = self.alphaAt(i, self.lastLatency(), at)
+		if a is None:
+			return None
+		d = self.decayValue(i, a)
+		crossing = self.crossings.crossingWith(i, d)
+		return TrialPlan(at, len(self.completedTrials), i, self.placeCount, self.crossings, a, d, crossing)
+
+	# the teacher is where it was when the plan was made, and the clock is close to the planned time
+	def planHolds(self, plan):
+		return (plan.trials == len(self.completedTrials) and plan.lastPlace == self.lastPlace and
+		        plan.placeCount == self.placeCount and plan.crossings is self.crossings and
+		        plan.crossings.threshold == self.treshold and not self.lastDecayKnown and
+		        abs(self.clock() - plan.at) <= self.planTolerance)
+
+
+################################################# Spacing###########################
+	
+	def fixTime(self):
+		if len(self.completedTrials) < 2:
+			# resumed from the store: no place was clicked before the last one yet
+			return 0.0
+		(x, y) = self.mapPlaces[self.completedTrials[-2].placeIndex].coords()
+		ft = self.mapPlaces[self.completedTrials[-1].placeIndex].distanceTo(x, y)
+		time = ft / self.estimatedAvgSpeed
+		
+		#print 'ft =', time
+		return time
+	
+    #Update alpha: Latency = F * math.exp(-act) + fixed time -> act = -math.log(latency - fixed time)/F
+	def alpha(self, i, latency): #i = last shown item; latency = response time
+		a = self.alphaAt(i, latency, self.clock())
+		if a is not None:
+			self.addAlpha(i, a)
+		return a
+
+	# the new alpha of place i at curTime, see alpha
+	def alphaAt(self, i, latency, curTime):
+		#print 'alpha gebuikte plaats', i
+		if len(self.mapPlaces[i].times) < 3:
+				return self.std_a
+		else:  	#Estimate current activation with the last decay value
+			old_act = self.mapPlaces[i].act
+			#print old_act, 'prev act'
+		  
+			est_act = self.actCache.activation(i, curTime)
+			if self.validateActCache:
+				full = self.engine.activation(i, curTime)
+				self.checkActivation(i, est_act, full)
+				est_act = full
+			#print est_act, 'estimated act'
+		  
+			#The expected latency:
+			Lexpected = self.F * math.exp(-est_act) + self.fixTime()
+			#print Lexpected, 'expected'
+
+			#The observed latency:
+			Lobserved = latency
+			#print Lobserved, 'observed'
+
+			#Update Alpha
+			if Lobserved - Lexpected > 0:
+				a = self.mapPlaces[i].alpha[-1] + max(0.01,((Lobserved-Lexpected)/1000))
+				#print 'a increased to:', a, self.mapPlaces[i].name
+				return a
+			if Lobserved - Lexpected < 0:
+				a = self.mapPlaces[i].alpha[-1] + min(-0.01,((Lobserved-Lexpected)/1000))
+				#print 'a decreased to:', a, self.mapPlaces[i].name
+				return a
+
+	def decay(self, i, latency):
+		self.addDecay(i, self.decayValue(i, self.alpha(i, latency)))
+
+	# the decay of the last presentation of place i with alpha a
+	def decayValue(self, i, a):
+		if self.mapPlaces[i].act == 0:
+			return self.c + a
+		else:
+			return self.c * math.exp(self.mapPlaces[i].act) + a
+
+	# response time of the last trial as the spacing model sees it
+	def lastLatency(self):
+		if self.scoreHistory[-1] == 0:
+			return 15
+		else:
+			return self.completedTrials[-1].RT
+
+	def activation(self, place, curTime=None):
+		if curTime is None:
+			curTime = self.clock()
+		count = min(max(place, 1), self.numPlaces)
+		acts = self.engine.activations(curTime, count)
+		for i in range(count):
+			self.mapPlaces[i].act = float(acts[i])
+
+	# The introduced place with the lowest activation, with its activation updated. The crossing
+	# times give the places that are below the treshold now, and only their activations are
+	# worked out. When none is, the activations of all introduced places are. Both take a pass
+	# over the introduced places. Between trials only the crossing time of the last shown place
+	# changes, to the one of the plan if there is one.
+	def nextRehearsal(self, plan=None):
+		curTime = self.clock()
+		if plan is not None:
+			self.crossings.set(self.lastPlace, plan.crossing)
+		elif self.crossings is None or self.crossings.threshold != self.treshold:
+			self.crossings = CrossingTimes(self.engine, self.treshold)
+			for i in range(self.placeCount):
+				self.crossings.update(i)
+		else:
+			self.crossings.update(self.lastPlace)
+		due = self.crossings.due(curTime + self.crossingMargin)
+		below = [(act, i) for (act, i) in zip(self.actCache.activationsOf(due, curTime).tolist(), due) if act < self.treshold]
+		if below:
+			# lowest index first among equal activations, as acts.index(min(acts))
+			(act, i) = min(below)
+		else:
+			acts = self.actCache.activations(curTime, self.placeCount)
+			i = int(np.argmin(acts))
+			act = float(acts[i])
+		if self.validateActCache:
+			self.activation(self.placeCount, curTime)
+			self.checkActivation(i, act, self.mapPlaces[i].act)
+			acts = [p.act for p in self.mapPlaces[0:self.placeCount]]
+			lowest = acts.index(min(acts))
+			if lowest != i and acts[i] - acts[lowest] > self.actCache.tolerance:
+				raise AssertionError('%s was chosen with activation %r, %s has the lowest activation %r' % (self.mapPlaces[i].name, acts[i], self.mapPlaces[lowest].name, acts[lowest]))
+		self.mapPlaces[i].act = act
+		return i
+
+	def checkActivation(self, i, cached, full):
+		if abs(cached - full) > self.actCache.tolerance:
+			raise AssertionError('cached activation of %s is %r, full recomputation gives %r' % (self.mapPlaces[i].name, cached, full))
+
+	# keep the place history and the activation engine in sync
+	def addPresentation(self, i, t):
+		self.mapPlaces[i].times.append(t)
+		self.engine.addPresentation(i, t)
+		self.changedPlaces.add(i)
+
+		if self.log:
+			self.log.presentation(i, t)
+
+	def addDecay(self, i, d):
+		self.mapPlaces[i].decays.append(d)
+		self.engine.addDecay(i, d)
+		self.changedPlaces.add(i)
+		if self.log:
+			self.log.decay(i, d)
+
+	def addAlpha(self, i, a):
+		self.mapPlaces[i].alpha.append(a)
+		self.changedPlaces.add(i)
+		if self.log:
+			self.log.alpha(i, a)
+
+	def memoryUpdate(self, place):
+		#Add one to the number of total shows of current item
+		self.mapPlaces[place].addShow()         
+		self.changedPlaces.add(place)
+		if self.log:
+			self.log.show(place)
+
+	def rehearse(self, place, actmin, latency):
+		self.addPresentation(actmin, self.clock())
+		#Calculate the decay (and alpha) up to the last shown item
+		self.memoryUpdate(actmin)
+		#print self.mapPlaces[actmin].name, 'is rehearsed'
+		self.lastPlace = actmin
+		return actmin, TRIAL
+
+	def getNextSpacingPlace(self, plan=None):	
+		#print '-----------------------------'
+		#Spacing: 3 conditions; 1) first encounter, 2)rehearse or add new, 3) rehearse if all are shown
+		if self.placeCount == 0:
+			#Present first place  
+			self.addPresentation(self.placeCount, self.clock())
+			#print self.mapPlaces[self.placeCount].name, 'is presented'
+			self.memoryUpdate(self.placeCount)
+			self.lastPlace = self.placeCount
+			self.placeCount += 1
+			return 0, DRILL
+		
+		if self.lastDecayKnown:
+			# resumed from the store, nothing to learn from the last trial of the previous session
+			self.lastDecayKnown = False
+			latency = None
+		elif plan is None:
+			latency = self.lastLatency()
+			
+			#Calculate the decay (and alpha) up to the last shown item
+			self.decay(self.lastPlace, latency)
+		else:
+			latency = self.lastLatency()
+			self.addAlpha(self.lastPlace, plan.alpha)
+			self.addDecay(self.lastPlace, plan.decay)
+		#Present new item or rehearse?: Search for lowest act
+		actmin = self.nextRehearsal(plan)
+
+		if self.placeCount < 16: #15 places for spacing
+			#if it is below treshold: rehearse item
+			if self.mapPlaces[actmin].act < self.treshold:                               
+				return self.rehearse(self.placeCount, actmin, latency)
+			else:
+				#if lowest act is not below treshold: present new item
+				self.addPresentation(self.placeCount, self.clock())
+				#print self.mapPlaces[self.placeCount].name, self.placeCount, 'is presented'
+				#Calculate the decay (and alpha) up to the last shown item
+				self.memoryUpdate(self.placeCount)
+				lastPlace = self.placeCount
+				self.lastPlace = self.placeCount
+				self.placeCount += 1
+				return self.lastPlace, DRILL
+		else: #When all items are presented: keep rehearsing the lowest untill the session time exceeded.
+			self.memoryUpdate(actmin)
+			return self.rehearse(self.placeCount, actmin, latency)
+
+############################################################################################################	
+	def getNextFlashcardPlace(self):
+		# has the subject guessed all places in the batch correctly in a row?
+		#lastFlashResults = self.scoreHistory[-2:-9:-2] #scores are interleaved with spacing
+		#print 'FLASHCARD ', self.flashcardResults, self.flashcardBatchOffset
+		#print 'SUM', sum(self.flashcardResults)
+		if sum(self.flashcardResults) == 4 and self.flashcardBatchOffset == 3:
+			# was it the first time we showed this batch?
+			if self.mapPlaces[(self.numPlaces // 2) + self.flashcardBatch*4].numShows > 1:
+				# if not, time for the next batch
+				#print 'NEXT BATCH'
+				self.flashcardBatch = (self.flashcardBatch+1) % 4
+			
+			self.flashcardBatchOffset = 0
+			if self.flashcardBatch > 3: #we've done everything: reset
+				self.flashcardBatch = 0
+				
+		else:
+			# get the next place of the current batch
+			self.flashcardBatchOffset = (self.flashcardBatchOffset+1) % 4
+
+		# get the next place
+		place = (self.numPlaces // 2) + self.flashcardBatch*4 + self.flashcardBatchOffset
+		self.memoryUpdate(place)
+		type = TRIAL
+		# has this place been presented before?
+		if not self.mapPlaces[place].shownBefore:
+			type = DRILL
+			self.mapPlaces[place].shownBefore = True
+		
+		return (place, type)
+
+	def getNextCalibTrial(self):
+		self.calibCounter += 1
+		idx = self.calibCounter
+
+		return idx
+	
+	def doneCalibrating(self):
+		if self.calibCounter < self.maxCalib-1:
+			return False
+		else:
+			# we're done calibrating
+			totalDist = sum(self.completedCalibTrials[2:].column('distanceTraveled').tolist())
+			totalTime = sum(self.completedCalibTrials[2:].column('RT').tolist())
+			self.estimatedAvgSpeed = totalDist / totalTime
+			#print 'time estimated from calibration ',self.estimatedAvgSpeed
+			return True
+		#return not (self.calibCounter < self.maxCalib-1)
+	
+	# use the result of the trial (right/wrong, hint/no hint) to update the teacher
+	def currentTrialResult(self, trialResult, hintUsed, rt, velocity, distance, shortest, timestamp):
+		name = self.mapPlaces[self.currentTrialPlace].name
+		self.completedTrials.append(self.trialType, self.trialCondition, self.currentTrialPlace, name, trialResult, hintUsed, rt, velocity, distance, shortest, timestamp)
+		if self.log:
+			self.log.trial(self.completedTrials[-1])
+		self.scoreHistory.append(trialResult)
+		
+		#print 'RESULT ',trialResult
+		if self.trialCondition == FLASHCARD:
+			#print 'UPDATE FC'
+			self.flashcardResults[self.flashcardBatchOffset] = trialResult
+		
+		self.storeChanges()
+		return True
+	
+	def currentCalibrationResult(self, rt, velocity, distance, shortest, timestamp):
+		self.completedCalibTrials.append(CALIB, 0, self.calibCounter, '', 1, False, rt, velocity, distance, shortest, timestamp)
+		if self.log:
+			self.log.calibration(self.completedCalibTrials[-1])
+	
+	def percentageCorrect(self, numTrials):
+		trials = self.scoreHistory[-numTrials:]
+		if len(trials) == 0:
+			return 100
+		else:
+			return int( (sum(trials) / len(trials))*100 )
+		
+	def  currentTrialPlaceCoords(self):
+		return (self.mapPlaces[self.currentTrialPlace].x, self.mapPlaces[self.currentTrialPlace].y)
+
+	def  currentCalibCoords(self):
+		return (self.calibPlaces[self.calibCounter].x, self.calibPlaces[self.calibCounter].y)
+		
+	def  currentTrialPlaceSize(self):
+		return self.mapPlaces[self.currentTrialPlace].size
+		
+	def currentTrialPlaceName(self):
+		return self.mapPlaces[self.currentTrialPlace].name
+	
+	def getPlace(self, i):
+		return self.mapPlaces[i]
+		
+	def getCalib(self, i):
+		return self.calibPlaces[i]
+	
+	# Continue with the memory of a learner from a LearnerStore (see learnerstore.py), call
+	# before startLog. The learner is the id the store knows them by, the subject name if not
+	# given. Places with a history are moved to the front, where the spacing algorithm treats
+	# them as introduced. Returns the number of places that have a history.
+	def useStore(self, store, epoch=None, learner=None):
+		if epoch is None:
+			epoch = time.time() - self.clock()
+		self.store = store
+		self.storeEpoch = epoch
+		self.learner = learner if learner is not None else self.subjectName
+		states = store.load(self.learner)
+		known = [p for p in self.mapPlaces if p.name in states and len(states[p.name].times) > 0]
+		knownIds = set(id(p) for p in known)
+		self.mapPlaces[:] = known + [p for p in self.mapPlaces if id(p) not in knownIds]
+
+		for (i, place) in enumerate(self.mapPlaces):
+			state = states.get(place.name)
+			if state is None:
+				continue
+			place.times = (state.times - epoch).tolist()
+			place.decays = state.decays.tolist()
+			place.alpha = state.alpha.tolist()
+			place.act = state.act
+			place.numShows = state.numShows
+			place.shownBefore = state.shownBefore
+			# the decay of a last presentation is set at the trial after it, which never came
+			while len(place.decays) < len(place.times):
+				a = place.alpha[-1] if place.alpha else self.std_a
+				place.decays.append(self.c * math.exp(place.act) + a)
+				self.changedPlaces.add(i)
+			self.engine.addHistory(i, place.times, place.decays)
+		self.crossings = None
+
+		self.placeCount = min(len(known), self.numPlaces // 2)
+		if self.placeCount > 0:
+			self.lastPlace = max(range(self.placeCount), key=lambda i: self.mapPlaces[i].times[-1])
+			self.lastDecayKnown = True
+		return len(known)
+
+	# write the places changed since the last call to the store
+	def storeChanges(self):
+		if self.store is None or not self.changedPlaces:
+			return
+		self.store.save(self.learner, [self.mapPlaces[i] for i in sorted(self.changedPlaces)], self.storeEpoch)
+		self.changedPlaces = set()
+
+	# start writing everything that happens to results/<prefix>_log.txt
+	def startLog(self, directory='results', prefix=None):
+		from results import TrialLogWriter
+		self.prefix = prefix or str(int(time.time()))
+		self.resultsDir = directory
+		self.log = TrialLogWriter(os.path.join(directory, self.prefix+'_log.txt'))
+		self.log.session(self.prefix, self.date, self.subjectName, self.spacingFirst, self.mapPlaces, self.experimentLen)
+		# the log has the memory from earlier sessions apart, the outputs leave it out
+		self.priorCounts = [(len(p.times), len(p.decays), len(p.alpha), p.numShows) for p in self.mapPlaces]
+
+	# the places with only what happened to them since startLog, as readLog gives them
+	def loggedPlaces(self):
+		places = []
+		for (p, (times, decays, alpha, shows)) in zip(self.mapPlaces, self.priorCounts):
+			place = Place(p.x, p.y, p.name, p.size)
+			place.times = p.times[times:]
+			place.decays = p.decays[decays:]
+			place.alpha = p.alpha[alpha:]
+			place.numShows = p.numShows - shows
+			places.append(place)
+		return places
+
+	# The outputs are made from the trials in memory. The log is only needed after a crash,
+	# when results.py makes the same outputs from it.
+	def saveResults(self):
+		from results import SessionLog, writeResults
+		self.storeChanges()
+		if self.log:
+			self.log.close()
+			session = SessionLog(self.prefix, self.date, self.subjectName, self.spacingFirst, self.loggedPlaces(), self.completedTrials, self.completedCalibTrials)
+		else:
+			session = SessionLog(str(int(time.time())), self.date, self.subjectName, self.spacingFirst, self.mapPlaces, self.completedTrials, self.completedCalibTrials)
+		writeResults(session, self.resultsDir)
+		return True
+
+
+# The next spacing trial as worked out by Teacher.planNextTrial for clock time at
+class TrialPlan(object):
+	def __init__(self, at, trials, lastPlace, placeCount, crossings, alpha, decay, crossing):
+		self.at = at
+		# state of the teacher the plan was made from
+		self.trials = trials
+		self.lastPlace = lastPlace
+		self.placeCount = placeCount
+		self.crossings = crossings
+		# what getNextTrial will do with it
+		self.alpha = alpha         # new alpha of the last shown place
+		self.decay = decay         # decay of its last presentation
+		self.crossing = crossing   # time at which it falls below treshold
+
+	
+# Represents a place on the map
+class Place(object):
+	def __init__(self, x=0, y=0, name='None', size=0.8):
+		self.x = x
+		self.y = y
+		self.name = name
+		self.size = size
+#############################################################################################
+		self.times = []		#The list of response times per item
+		self.decays = []	#The list of decay values per item
+		self.alpha = []		#The list of alpha's for each item
+		self.act = 0		#The activation per item
+		self.numShows = 0 	#The # of shows per item
+		
+		self.shownBefore = False
+
+	def addShow(self):
+		self.numShows += 1
+###########################################################################################                
+	def hit(self, x, y):
+		distanceSqr = (self.x-x)*(self.x-x) + (self.y-y)*(self.y-y)
+		if distanceSqr <= placeClickAreaSqr:
+			return True
+		else:
+			return False
+	
+	def distanceTo(self, x, y):
+		return sqrt( (self.x-x)*(self.x-x) + (self.y-y)*(self.y-y) )
+
+	def coords(self):
+		return (self.x, self.y)
+	
+		return False
+
+class TrialResult(object):
+	def __init__(self, type, condition, placeIdx, placeName, result, hintUsed, rt, velocity, distance, shortest, timestamp):
+		self.type = type
+		self.condition = condition
+		self.placeIndex = placeIdx
+		self.placeName = placeName
+		self.result = result
+		self.hintUsed = hintUsed
+		self.RT = rt
+		self.avgVelocity = velocity
+		self.distanceTraveled = distance
+		if rt > 0:
+			self.avgSpeed = distance / rt
+		else:
+			self.avgSpeed = 1000
+		self.shortestPath = shortest
+		self.timeStamp = timestamp
+
+# the condition a place is studied in, by its index after shuffling
+def placeCondition(i, spacingFirst):
+	condition = FLASHCARD
+	if spacingFirst:
+		if i < 16:
+			condition = SPACING
+	else:
+		if i >= 16:
+			condition = SPACING
+	return condition
+
+# Find out which place is at (x, y): the nearest one if the click areas overlap
+def findClickedPlace(places, x, y):
+	best = None
+	bestDist = 0
+	for (i, place) in enumerate(places):
+		if place.hit(x,y):
+			distanceSqr = (place.x-x)*(place.x-x) + (place.y-y)*(place.y-y)
+			if best is None or distanceSqr < bestDist:
+				best = i
+				bestDist = distanceSqr
+	return best
+
+# Load places from an xml file, or from its compiled cache (see mapcache.py)
+def loadMapPlaces(filename='map.xml', useCache=True):
+	# imported here, mapcache needs Place
+	from mapcache import loadMap
+	return loadMap(filename, useCache)
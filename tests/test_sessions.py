@@ -0,0 +1,201 @@
+# Copyright Menno Nijboer, 2015
+
+# A session through the session service (RemoteTeacher over a LoopbackConnection) makes the same
+# decisions as a Teacher in the same process, on the same virtual clock.
+#
+#     python -m pytest tests
+
+from __future__ import division
+
+import os
+import sys
+import random
+import shutil
+import tempfile
+import threading
+import unittest
+
+try:
+	import asyncio
+except ImportError:
+	asyncio = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from teacher import Teacher, loadMapPlaces
+from sessions import SessionService, LoopbackConnection, RemoteTeacher, SessionError, serverProtocol, encode, decode
+from clock import VirtualClock
+
+mapFile = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'map.xml')
+width = 1194
+height = 760
+
+# Runs the calibration and numTrials trials with made up responses, returns the decisions
+def runSession(teacher, clock, numTrials=120):
+	decisions = []
+	while not teacher.doneCalibrating():
+		teacher.getNextCalibTrial()
+		clock.advance(1.0)
+		teacher.currentCalibrationResult(1.0, 3.0, 300, 200, clock())
+	start = clock()
+	for k in range(numTrials):
+		(place, type, hintAllowed) = teacher.getNextTrial(clock() - start)
+		decisions.append((teacher.currentTrialPlaceName(), type, hintAllowed))
+		rt = 1.0 + (k % 5)*0.4
+		clock.advance(rt)
+		teacher.currentTrialResult(0 if k % 4 == 0 else 1, 0, rt, 3.0, 300, 200, clock() - start)
+		clock.advance(2.0 if k % 4 == 0 else 0.75)
+	return decisions
+
+class SessionServiceTest(unittest.TestCase):
+	seed = 5
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.service = SessionService(self.directory)
+		self.connection = LoopbackConnection(self.service)
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def test_sameDecisionsAsLocalTeacher(self):
+		random.seed(self.seed)
+		clock = VirtualClock(100.0)
+		local = Teacher(loadMapPlaces(mapFile), width, height, True, 10*60.0, 'local', clock)
+		expected = runSession(local, clock)
+
+		random.seed(self.seed)
+		clock = VirtualClock(100.0)
+		places = loadMapPlaces(mapFile)
+		remote = RemoteTeacher(self.connection, places, width, height, True, 10*60.0, 'remote', clock)
+		self.assertEqual([p.name for p in places], [p.name for p in local.mapPlaces])
+		self.assertEqual([p.coords() for p in remote.calibPlaces], [p.coords() for p in local.calibPlaces])
+		self.assertEqual(runSession(remote, clock), expected)
+
+		# the service teacher ran on the clock of the client
+		served = self.service.session(remote.session).teacher
+		self.assertEqual([p.times for p in served.mapPlaces], [p.times for p in local.mapPlaces])
+		self.assertEqual(len(remote.completedTrials), len(local.completedTrials))
+		self.assertTrue(len(remote.completedTrials.column('RT')) > 0)
+		self.assertEqual(list(remote.completedTrials.column('RT')), list(local.completedTrials.column('RT')))
+
+	def test_saveAndClose(self):
+		random.seed(self.seed)
+		clock = VirtualClock()
+		remote = RemoteTeacher(self.connection, loadMapPlaces(mapFile), width, height, False, 10*60.0, 'remote', clock)
+		remote.startLog()
+		runSession(remote, clock, 20)
+		self.assertTrue(remote.saveResults())
+		names = os.listdir(self.directory)
+		self.assertTrue(remote.prefix + '_log.txt' in names)
+		self.assertTrue(remote.prefix + '.xml' in names)
+		remote.close()
+		self.assertEqual(self.service.sessions, {})
+		self.assertRaises(SessionError, remote.getNextTrial, 0.0)
+
+	def test_errorReply(self):
+		reply = self.connection.request({'id': 3, 'session': 42, 'op': 'nextTrial', 'args': [0.0]})
+		self.assertEqual(reply['id'], 3)
+		self.assertTrue('no session 42' in reply['error'])
+
+	def test_savingSessionRefusesOtherOps(self):
+		random.seed(self.seed)
+		clock = VirtualClock()
+		remote = RemoteTeacher(self.connection, loadMapPlaces(mapFile), width, height, True, 10*60.0, 'remote', clock)
+		remote.startLog()
+		runSession(remote, clock, 10)
+		session = self.service.beginSave({'session': remote.session})
+		self.assertRaises(SessionError, remote.getNextTrial, 0.0)
+		self.assertRaises(SessionError, self.service.beginSave, {'session': remote.session})
+		# the owner goes away during the save: the session is closed after it
+		self.connection.close()
+		self.assertTrue(remote.session in self.service.sessions)
+		self.assertEqual(self.service.save({'id': 1}, session), {'id': 1, 'result': True})
+		self.service.endSave(session)
+		self.assertEqual(self.service.sessions, {})
+
+# Stands in for the socket of a connection to the service on the event loop
+class FakeTransport(object):
+	def __init__(self):
+		self.replies = []
+
+	def get_extra_info(self, name):
+		return None
+
+	def write(self, data):
+		self.replies.extend(decode(line) for line in data.splitlines())
+
+@unittest.skipIf(asyncio is None, 'the session service needs Python 3')
+class SessionProtocolTest(unittest.TestCase):
+	seed = 5
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.service = SessionService(self.directory)
+		self.loop = asyncio.new_event_loop()
+		asyncio.set_event_loop(self.loop)
+
+	def tearDown(self):
+		self.loop.close()
+		asyncio.set_event_loop(None)
+		shutil.rmtree(self.directory)
+
+	# send the requests in one go and wait for a reply to each of them
+	def exchange(self, protocol, transport, requests):
+		count = len(transport.replies) + len(requests)
+		protocol.data_received(b''.join(encode(r) for r in requests))
+		for i in range(1000):
+			if len(transport.replies) >= count:
+				break
+			self.loop.run_until_complete(asyncio.sleep(0.005))
+		return transport.replies[count-len(requests):]
+
+	def openSession(self, protocol, transport):
+		random.seed(self.seed)
+		places = loadMapPlaces(mapFile)
+		opened = self.exchange(protocol, transport, [{'id': 1, 'op': 'open', 'time': 0.0, 'args': [[(p.x, p.y, p.name, p.size) for p in places], width, height, True, 600.0, 'remote']}])
+		return opened[0]['result']['session']
+
+	def test_requestsWaitForSave(self):
+		transport = FakeTransport()
+		protocol = serverProtocol(asyncio, self.service)()
+		protocol.connection_made(transport)
+		number = self.openSession(protocol, transport)
+		self.exchange(protocol, transport, [{'id': 2, 'session': number, 'op': 'startLog'}])
+
+		# the save holds the teacher until the test lets it go
+		release = threading.Event()
+		saveResults = self.service.saveResults
+		def slowSave(session):
+			release.wait(5.0)
+			return saveResults(session)
+		self.service.saveResults = slowSave
+		protocol.data_received(encode({'id': 3, 'session': number, 'op': 'saveResults'}) + encode({'id': 4, 'session': number, 'op': 'doneCalibrating', 'time': 1.0}))
+		self.loop.run_until_complete(asyncio.sleep(0.05))
+		self.assertEqual([r['id'] for r in transport.replies], [1, 2])
+		self.assertTrue(self.service.sessions[number].saving)
+		release.set()
+		for i in range(1000):
+			if len(transport.replies) == 4:
+				break
+			self.loop.run_until_complete(asyncio.sleep(0.005))
+		self.assertEqual([r['id'] for r in transport.replies], [1, 2, 3, 4])
+		self.assertEqual(transport.replies[2], {'id': 3, 'result': True})
+		self.assertEqual(transport.replies[3], {'id': 4, 'result': False})
+
+	def test_saveErrorIsReplied(self):
+		transport = FakeTransport()
+		protocol = serverProtocol(asyncio, self.service)()
+		protocol.connection_made(transport)
+		number = self.openSession(protocol, transport)
+		def failingSave(session):
+			raise IOError('disk full')
+		self.service.saveResults = failingSave
+		replies = self.exchange(protocol, transport, [{'id': 2, 'session': number, 'op': 'saveResults'}, {'id': 3, 'session': 99, 'op': 'saveResults'}])
+		self.assertEqual([r['id'] for r in replies], [2, 3])
+		self.assertTrue('disk full' in replies[0]['error'])
+		self.assertTrue('no session 99' in replies[1]['error'])
+		self.assertFalse(self.service.sessions[number].saving)
+
+if __name__ == '__main__':
+	unittest.main()
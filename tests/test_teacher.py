@@ -0,0 +1,110 @@
+# Copyright Menno Nijboer, 2015
+
+# Simulated sessions with a fixed seed, checked against the spacing model computed directly from
+# the presentation history of every place: log of the sum of (t - t_i)^-d_i.
+#
+#     python -m pytest tests
+
+from __future__ import division
+
+import os
+import sys
+import math
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from teacher import loadMapPlaces, TRIAL, DRILL, SPACING
+from simulate import Simulator, SyntheticLearner
+
+mapFile = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'map.xml')
+
+# activation of a place from its presentations that have a decay
+def referenceActivation(place, curTime):
+	return math.log(sum(math.pow(curTime - t, -d) for (t, d) in zip(place.times, place.decays)))
+
+# Keeps, for every spacing decision, the place the teacher chose and the reference activations of
+# the introduced places at that time
+class CheckedSimulator(Simulator):
+	def __init__(self, places, **keys):
+		Simulator.__init__(self, places, **keys)
+		self.choices = []
+
+	def createTeacher(self, clock):
+		teacher = Simulator.createTeacher(self, clock)
+		nextRehearsal = teacher.nextRehearsal
+		def checkedRehearsal(plan=None):
+			acts = [referenceActivation(p, clock()) for p in teacher.mapPlaces[0:teacher.placeCount]]
+			i = nextRehearsal(plan)
+			self.choices.append((i, teacher.mapPlaces[i].name, teacher.mapPlaces[i].act, acts))
+			return i
+		teacher.nextRehearsal = checkedRehearsal
+		return teacher
+
+class TeacherTest(unittest.TestCase):
+	seed = 11
+	tolerance = 1e-6
+
+	def runSession(self, planAhead=False, validate=False):
+		sim = CheckedSimulator(loadMapPlaces(mapFile), expLength=10*60.0)
+		sim.planAhead = planAhead
+		sim.validateActCache = validate
+		result = sim.runSession(SyntheticLearner(seed=self.seed + 1), seed=self.seed)
+		return (sim, result)
+
+	def test_sameSeedSameSession(self):
+		(sim1, first) = self.runSession()
+		(sim2, second) = self.runSession()
+		self.assertEqual(first.decisions, second.decisions)
+		self.assertEqual([c[0] for c in sim1.choices], [c[0] for c in sim2.choices])
+
+	def test_rehearsesLowestActivation(self):
+		(sim, result) = self.runSession()
+		self.assertTrue(len(sim.choices) > 50)
+		for (i, name, act, acts) in sim.choices:
+			self.assertAlmostEqual(act, acts[i], delta=self.tolerance)
+			self.assertTrue(acts[i] - min(acts) <= self.tolerance, 'chose %d with %r, lowest is %r' % (i, acts[i], min(acts)))
+
+	# the place with the lowest activation is rehearsed when it is below the treshold, otherwise a
+	# new place is introduced, as long as there are new places for spacing
+	def test_rehearsesBelowTreshold(self):
+		(sim, result) = self.runSession()
+		treshold = result.teacher.treshold
+		# the first spacing trial introduces a place without a choice
+		spacing = [d for d in result.decisions if d[2] == SPACING][1:]
+		self.assertEqual(len(spacing), len(sim.choices))
+		(introduced, rehearsed) = (1, 0)
+		for ((name, type, condition), (i, chosen, act, acts)) in zip(spacing, sim.choices):
+			if acts[i] < treshold or introduced == 16:
+				self.assertEqual((name, type), (chosen, TRIAL))
+				rehearsed += 1
+			else:
+				self.assertEqual(type, DRILL)
+				introduced += 1
+		self.assertTrue(rehearsed > 0)
+		self.assertEqual(introduced, 16)
+
+	def test_activationsMatchReference(self):
+		(sim, result) = self.runSession()
+		teacher = result.teacher
+		curTime = teacher.clock()
+		acts = teacher.engine.activations(curTime, teacher.placeCount)
+		for i in range(teacher.placeCount):
+			place = teacher.mapPlaces[i]
+			self.assertEqual(teacher.engine.numDecays[i], len(place.decays))
+			self.assertAlmostEqual(acts[i], referenceActivation(place, curTime), delta=1e-9)
+			self.assertAlmostEqual(teacher.actCache.activation(i, curTime), referenceActivation(place, curTime), delta=self.tolerance)
+
+	def test_validatedSession(self):
+		# the teacher checks its cache and its choices against a full recomputation itself
+		(sim, checked) = self.runSession(validate=True)
+		(sim, plain) = self.runSession()
+		self.assertEqual(checked.decisions, plain.decisions)
+
+	def test_planAheadSameDecisions(self):
+		(sim, planned) = self.runSession(planAhead=True)
+		(sim, plain) = self.runSession()
+		self.assertEqual(planned.decisions, plain.decisions)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -2,523 +2,90 @@
 
 from __future__ import division
 
-import pyglet
-from pyglet.gl import *
+from startup import startupTimer
+startupTimer.begin()
+
+with startupTimer.phase('import pyglet'):
+	import pyglet
+	from pyglet.gl import *
 
-import xml.dom.minidom
 import sys
-import time
-import datetime
+import os
 import random
-import math
 from math import sqrt, pow
 
+with startupTimer.phase('import modules'):
+	from teacher import Teacher, loadMapPlaces
+	from spatial import PlaceGrid
+	from assets import AssetManager
+	from tween import Tween, TweenScheduler, setChanged
+	from frameprofile import FrameProfiler, frameTimer
+	from trajectory import TrajectoryRecorder, PathWriter, TRIALPATH, CALIBPATH
+	from clock import MonotonicClock
+	from teacher import INTRO, TRIAL, DRILL, CALIB, END, WRONG, CORRECT, HINT, NOHINT
+
 # global variables
 updateFreq = 1.0/70.0
-placeClickArea = 22
 appFont = 'Helvetica'
 
-# stuff to make things easier
-placeClickAreaSqr = placeClickArea*placeClickArea
-# modes
-INTRO = 0
-TRIAL = 1
-DRILL = 2
-CALIB = 3
-END = 4
-
-WRONG = 0
-CORRECT = 1
-
-FLASHCARD = 0
-SPACING = 1
-
-HINT = 1
-NOHINT = 0
-
 # Some global functions
 
-# load an image from a file and center it's placement anchors
-def loadAndCenterImg(imgName):
-	img =  pyglet.image.load(imgName)
-	img.anchor_x = img.width // 2
-	img.anchor_y = img.height // 2
-	return img
-
 # create a sprite from a loaded image
-def createSprite(img, x=0, y=0, visible=False):
-	sprite = pyglet.sprite.Sprite(img, x=x, y=y)
+def createSprite(img, x=0, y=0, visible=False, batch=None, group=None):
+	sprite = pyglet.sprite.Sprite(img, x=x, y=y, batch=batch, group=group)
 	sprite.visible = visible
 	return sprite	
 
-class Teacher(object):
-    # The spacing / hint cards algorithms, implemented by Jelle Dalenberg
+# Blending, and optionally a texture, for the overlays in the batches of Gui
+class OverlayGroup(pyglet.graphics.Group):
+	def __init__(self, order, texture=None):
+		super(OverlayGroup, self).__init__(pyglet.graphics.OrderedGroup(order))
+		self.texture = texture
 
-	def __init__(self, mapPlaces, width, height, spacing, expLen, subject):
-		self.width = width
-		self.height = height
-		self.mapPlaces = mapPlaces
-		self.numPlaces = len(self.mapPlaces)
-		
-		self.subjectName = subject
-		self.spacingFirst = spacing
-		self.experimentLen = expLen
-		
-		# randomly locate the places
-		# spacing: 0 .. 15 with 0..7 giving optional hits and 8..15 not giving hints
-		# flascard: 16..31 with 16..23 not giving hits, and 24..31 giving hits. Flashcard batches are 4 places
-		random.shuffle(mapPlaces)
-		self.currentTrialPlace = 0
-		self.calibPlaces = []
-		self.calibCounter = -1
-		self.maxCalib = 5
-		self.trialType = DRILL
-		self.trialCondition = FLASHCARD
-		self.completedTrials = []
-		self.scoreHistory = []
-####################################################################################
-		self.placeCount = 0     #counter needed for counting the self.mapPlaces
-		self.lastPlace = 0  	#Last shown place
-####################################################################################
-		self.doSpacingTrial = True
-		
-		self.date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
-		self.initCalibrationPlaces()
-		self.completedCalibTrials = []
-
-		# Vars for the flashcard approach
-		self.flashcardResults = [WRONG,WRONG,WRONG,WRONG]
-		self.flashcardBatch = 0
-		self.flashcardBatchOffset = 3 # to make sure that this var becomes 0 before the first trial
-		
-		self.estimatedAvgSpeed = 0
-		
-##########################################################################
-		self.treshold = -0.5          #Activation treshold
-		self.F = 1                   #F in the latency equation
-		self.std_a = 0.25            #Alpha in the decay equation
-		self.curAct = 0              #The activity of the current
-		self.trialStart = 0          #Starting time of whole session
-		self.c = 0.25				 #constant c
-###########################################################################
-	
-	def initCalibrationPlaces(self):
-		# generate some random places, but well distributed
-		numCalib = 0
-		while numCalib < self.maxCalib:
-			x = random.randrange(100, self.width-100)
-			y = random.randrange(100, self.height-100)
-			accepted = True
-			for cp in self.calibPlaces:
-				if cp.distanceTo(x, y) < 50: # we don't want places too close to eachother
-					accepted = False
-			if accepted:
-				self.calibPlaces.append(Place(x, y))
-				numCalib += 1
-		
-	# get the next place according to either spacing / cuecards
-	def getNextTrial(self, time):
-		doSpacing = False
-		if self.spacingFirst:
-			if time < 0.5*self.experimentLen: #first half, do spacing
-				doSpacing = True
-		else: #start with flashcard
-			if time > 0.5*self.experimentLen: #second half, switch to spacing
-				doSpacing = True
-		
-		if doSpacing:
-			#print 'spacing trial'
-			(place, type) = self.getNextSpacingPlace() 		 
-			self.trialType = type                                              		
-			self.currentTrialPlace = place                                     		
-			self.trialCondition = SPACING											
-
-		else: #Flashcard
-			#print 'flashcard trial'
-			(place, type) = self.getNextFlashcardPlace()
-			self.trialType = type
-			self.currentTrialPlace = place
-			self.trialCondition = FLASHCARD		
-		
-		self.doSpacingTrial = not self.doSpacingTrial
-		return (self.currentTrialPlace, self.trialType, (place < 8 or place > 23))  #determine whether a hint can appear
-
-
-################################################# Spacing###########################
-	
-	def fixTime(self):
-		(x, y) = self.mapPlaces[self.completedTrials[-2].placeIndex].coords()
-		ft = self.mapPlaces[self.completedTrials[-1].placeIndex].distanceTo(x, y)
-		time = ft / self.estimatedAvgSpeed
-		
-		#print 'ft =', time
-		return time
-	
-    #Update alpha: Latency = F * math.exp(-act) + fixed time -> act = -math.log(latency - fixed time)/F
-	def alpha(self, i, latency): #i = last shown item; latency = response time
-		#print 'alpha gebuikte plaats', i
-		if len(self.mapPlaces[i].times) < 3:
-				self.mapPlaces[i].alpha.append(self.std_a)
-				return self.std_a
-		else:  	#Estimate current activation with the last decay value
-			curTime = time.clock()
-			old_act = self.mapPlaces[i].act
-			#print old_act, 'prev act'
-		  
-			est_act = 0
-			for j in range(len(self.mapPlaces[i].decays)):
-				est_act += math.pow((curTime - self.mapPlaces[i].times[j]), -(self.mapPlaces[i].decays[j]))
-			est_act = math.log(est_act)
-			#print est_act, 'estimated act'
-		  
-			#The expected latency:
-			Lexpected = self.F * math.exp(-est_act) + self.fixTime()
-			#print Lexpected, 'expected'
-
-			#The observed latency:
-			Lobserved = latency
-			#print Lobserved, 'observed'
-
-			#Update Alpha
-			if Lobserved - Lexpected > 0:
-				a = self.mapPlaces[i].alpha[-1] + max(0.01,((Lobserved-Lexpected)/1000))
-				self.mapPlaces[i].alpha.append(a)
-				#print 'a increased to:', a, self.mapPlaces[i].name
-				return a
-			if Lobserved - Lexpected < 0:
-				a = self.mapPlaces[i].alpha[-1] + min(-0.01,((Lobserved-Lexpected)/1000))
-				self.mapPlaces[i].alpha.append(a)
-				#print 'a decreased to:', a, self.mapPlaces[i].name
-				return a
-
-	def decay(self, i, latency):
-		if self.mapPlaces[i].act == 0:
-			d = self.c + self.alpha(i, latency)
-			self.mapPlaces[i].decays.append(d)
-		else:
-			d = self.c * math.exp(self.mapPlaces[i].act) + self.alpha(i, latency)
-			self.mapPlaces[i].decays.append(d)
-
-	def activation(self, place):
-		curTime = time.clock()
-		if place == 0:
-			act = 0
-			for j in range(len(self.mapPlaces[0].times)):
-				act += math.pow((curTime - self.mapPlaces[0].times[j]), -(self.mapPlaces[0].decays[j]))
-			self.mapPlaces[0].act = math.log(act)
-		else:
-			for i in range(len(self.mapPlaces[0:place])):
-				act = 0
-				for j in range(len(self.mapPlaces[i].times)):
-					act += math.pow((curTime - self.mapPlaces[i].times[j]), -(self.mapPlaces[i].decays[j]))
-				self.mapPlaces[i].act = math.log(act)
-
-	def memoryUpdate(self, place):
-		#Add one to the number of total shows of current item
-		self.mapPlaces[place].addShow()         
-
-	def rehearse(self, place, actmin, latency):
-		self.mapPlaces[actmin].times.append(time.clock())
-		#Calculate the decay (and alpha) up to the last shown item
-		self.memoryUpdate(actmin)
-		#print self.mapPlaces[actmin].name, 'is rehearsed'
-		self.lastPlace = actmin
-		return actmin, TRIAL
-
-	def getNextSpacingPlace(self):	
-		#print '-----------------------------'
-		#Spacing: 3 conditions; 1) first encounter, 2)rehearse or add new, 3) rehearse if all are shown
-		if self.placeCount == 0:
-			#Present first place  
-			self.mapPlaces[self.placeCount].times.append(time.clock())
-			#print self.mapPlaces[self.placeCount].name, 'is presented'
-			self.memoryUpdate(self.placeCount)
-			self.lastPlace = self.placeCount
-			self.placeCount += 1
-			return 0, DRILL
-		
-		if self.scoreHistory[-1] == 0:
-			latency = 15
-		else:
-			latency = self.completedTrials[-1].RT
-		
-		#Calculate the decay (and alpha) up to the last shown item
-		self.decay(self.lastPlace, latency)
-		#Calculate activations up to the last shown item
-		self.activation(self.placeCount)
-
-		if self.placeCount < 16: #15 places for spacing
-			if self.placeCount == 1:
-				actmin = 0
-			else: #Present new item or rehearse?: Search for lowest act
-				acts = [p.act for p in self.mapPlaces[0:self.placeCount]]
-				actmin = acts.index(min(acts))
-				#if lowest act is below treshold: rehearse item
-			if self.mapPlaces[actmin].act < self.treshold:                               
-				return self.rehearse(self.placeCount, actmin, latency)
-			else:
-				#if lowest act is not below treshold: present new item
-				self.mapPlaces[self.placeCount].times.append(time.clock())
-				#print self.mapPlaces[self.placeCount].name, self.placeCount, 'is presented'
-				#Calculate the decay (and alpha) up to the last shown item
-				self.memoryUpdate(self.placeCount)
-				lastPlace = self.placeCount
-				self.lastPlace = self.placeCount
-				self.placeCount += 1
-				return self.lastPlace, DRILL
-		else: #When all items are presented: keep rehearsing the lowest untill the session time exceeded.
-			acts = [p.act for p in self.mapPlaces[0:self.placeCount]]
-			actmin = acts.index(min(acts))
-			self.memoryUpdate(actmin)
-			return self.rehearse(self.placeCount, actmin, latency)
-
-############################################################################################################	
-	def getNextFlashcardPlace(self):
-		# has the subject guessed all places in the batch correctly in a row?
-		#lastFlashResults = self.scoreHistory[-2:-9:-2] #scores are interleaved with spacing
-		#print 'FLASHCARD ', self.flashcardResults, self.flashcardBatchOffset
-		#print 'SUM', sum(self.flashcardResults)
-		if sum(self.flashcardResults) == 4 and self.flashcardBatchOffset == 3:
-			# was it the first time we showed this batch?
-			if self.mapPlaces[(self.numPlaces // 2) + self.flashcardBatch*4].numShows > 1:
-				# if not, time for the next batch
-				#print 'NEXT BATCH'
-				self.flashcardBatch = (self.flashcardBatch+1) % 4
-			
-			self.flashcardBatchOffset = 0
-			if self.flashcardBatch > 3: #we've done everything: reset
-				self.flashcardBatch = 0
-				
-		else:
-			# get the next place of the current batch
-			self.flashcardBatchOffset = (self.flashcardBatchOffset+1) % 4
-
-		# get the next place
-		place = (self.numPlaces // 2) + self.flashcardBatch*4 + self.flashcardBatchOffset
-		self.mapPlaces[place].addShow()
-		type = TRIAL
-		# has this place been presented before?
-		if not self.mapPlaces[place].shownBefore:
-			type = DRILL
-			self.mapPlaces[place].shownBefore = True
-		
-		return (place, type)
-
-	def getNextCalibTrial(self):
-		self.calibCounter += 1
-		idx = self.calibCounter
-
-		return idx
-	
-	def doneCalibrating(self):
-		if self.calibCounter < self.maxCalib-1:
-			return False
-		else:
-			# we're done calibrating
-			totalDist = sum([c.distanceTraveled for c in self.completedCalibTrials[2:]])
-			totalTime = sum([c.RT for c in self.completedCalibTrials[2:]])
-			self.estimatedAvgSpeed = totalDist / totalTime
-			#print 'time estimated from calibration ',self.estimatedAvgSpeed
-			return True
-		#return not (self.calibCounter < self.maxCalib-1)
-	
-	# use the result of the trial (right/wrong, hint/no hint) to update the teacher
-	def currentTrialResult(self, trialResult, hintUsed, rt, velocity, distance, shortest, timestamp):
-		name = self.mapPlaces[self.currentTrialPlace].name
-		self.completedTrials.append(TrialResult(self.trialType, self.trialCondition, self.currentTrialPlace, name, trialResult, hintUsed, rt, velocity, distance, shortest, timestamp))
-		self.scoreHistory.append(trialResult)
-		
-		#print 'RESULT ',trialResult
-		if self.trialCondition == FLASHCARD:
-			#print 'UPDATE FC'
-			self.flashcardResults[self.flashcardBatchOffset] = trialResult
-		
-		return True
-	
-	def currentCalibrationResult(self, rt, velocity, distance, shortest, timestamp):
-		self.completedCalibTrials.append(TrialResult(CALIB, 0, self.calibCounter, '', 1, False, rt, velocity, distance, shortest, timestamp))
-	
-	def percentageCorrect(self, numTrials):
-		trials = self.scoreHistory[-numTrials:]
-		if len(trials) == 0:
-			return 100
-		else:
-			return int( (sum(trials) / len(trials))*100 )
-		
-	def  currentTrialPlaceCoords(self):
-		return (self.mapPlaces[self.currentTrialPlace].x, self.mapPlaces[self.currentTrialPlace].y)
-
-	def  currentCalibCoords(self):
-		return (self.calibPlaces[self.calibCounter].x, self.calibPlaces[self.calibCounter].y)
-		
-	def  currentTrialPlaceSize(self):
-		return self.mapPlaces[self.currentTrialPlace].size
-		
-	def currentTrialPlaceName(self):
-		return self.mapPlaces[self.currentTrialPlace].name
-	
-	def getPlace(self, i):
-		return self.mapPlaces[i]
-		
-	def getCalib(self, i):
-		return self.calibPlaces[i]
-	
-	def saveResults(self):
-		prefix = str(int(time.time()))
-		
-		# save results for spss
-		spssHeader = 'Subject\tTrialtype\tCondition\tPlacename\tSuccess\tHintUsed\tTimestamp\tRT\tAvgspeed\tAvgvelocity\tTravdistance\tShortestpath\n'
-		
-		spssFull = ''
-		spssFlash = ''
-		spssSpacing = ''
-		
-		#save xml for plotting later
-		xmlFull = xml.dom.minidom.Document()
-		xmlres = xmlFull.createElement("results")
-		xmlres.setAttribute("subject", prefix)
-		xmlres.setAttribute("date", self.date)
-		xmlres.setAttribute("subjectname", self.subjectName)
-		xmlFull.appendChild(xmlres)
-		
-		#format the place information
-		for (i, place) in enumerate(self.mapPlaces):
-			xmlDat = xmlFull.createElement("place")
-			condition = FLASHCARD
-			if self.spacingFirst:
-				if i < 16:
-					condition = SPACING
-			else:
-				if i >= 16:
-					condition = SPACING
-			xmlDat.setAttribute("condition", str(condition))
-			xmlDat.setAttribute("name", place.name)
-			xmlDat.setAttribute("totalpresentations", str(place.numShows))
-			xmlDat.setAttribute("i", str(i))
-			#xmlDat.setAttribute("firstpresentation", place.times[0])
-			
-			if len(place.times) > 0:
-				for (i,times) in enumerate(place.times):
-					placeTime = xmlFull.createElement("pres")
-					placeTime.setAttribute("time", str(times))
-					placeTime.setAttribute("i", str(i))
-					xmlDat.appendChild(placeTime)
-			if len(place.decays) > 0:
-				for (i,decay) in enumerate(place.decays):
-					placeDecay = xmlFull.createElement("decay")
-					placeDecay.setAttribute("value", str(decay))
-					placeDecay.setAttribute("i", str(i))
-					xmlDat.appendChild(placeDecay)
-			if len(place.alpha) > 0:
-				for (i,a) in enumerate(place.alpha):
-					placeAlpha = xmlFull.createElement("alpha")
-					placeAlpha.setAttribute("value", str(a))
-					placeAlpha.setAttribute("i", str(i))
-					xmlDat.appendChild(placeAlpha)
-	
-			xmlres.appendChild(xmlDat)
-			
-		#format the trial results for analysis
-		for trial in self.completedTrials:
-			#spss
-			spssDat =  prefix+'\t'+str(trial.type-1)+'\t'+str(trial.condition)+'\t'+str(trial.placeName)+'\t'+str(trial.result)
-			spssDat += '\t'+str(trial.hintUsed)+'\t'+str(trial.timeStamp)+'\t'+str(trial.RT)+'\t'+str(trial.avgSpeed)+'\t'
-			spssDat += str(trial.avgVelocity)+'\t'+str(trial.distanceTraveled)+'\t'+str(trial.shortestPath)+'\n'
-			spssFull += spssDat
-			if trial.condition == SPACING:
-				spssSpacing += spssDat
-			else:
-				spssFlash += spssDat
-			#xml
-			xmlDat = xmlFull.createElement("trial")
-			xmlDat.setAttribute("trialtype", str(trial.type-1))
-			xmlDat.setAttribute("condition", str(trial.condition))
-			xmlDat.setAttribute("placename", str(trial.placeName))
-			xmlDat.setAttribute("success", str(trial.result))
-			xmlDat.setAttribute("hintused", str(trial.hintUsed))
-			xmlDat.setAttribute("timestamp", str(trial.timeStamp))
-			xmlDat.setAttribute("rt", str(trial.RT))
-			xmlDat.setAttribute("avgspeed", str(trial.avgSpeed))
-			xmlDat.setAttribute("avgvelocity", str(trial.avgVelocity))
-			xmlDat.setAttribute("travdistance", str(trial.distanceTraveled))
-			xmlDat.setAttribute("shortestpath", str(trial.shortestPath))
-			xmlres.appendChild(xmlDat)
-		
-		spssAll = open('results/'+prefix+'_all.txt','w')
-		spssAll.write(spssHeader+spssFull)
-		#spssSp = open('results/'+prefix+'_spacing.txt','w')
-		#spssSp.write(spssHeader+spssSpacing)
-		#spssFl = open('results/'+prefix+'_flash.txt','w')
-		#spssFl.write(spssHeader+spssFlash)	
-
-		xmlFile = open('results/'+prefix+'.xml','w')
-		xmlFull.writexml(xmlFile, "    ", "  ", "\n", "UTF-8")
-		return True
-
-	
-# Represents a place on the map
-class Place(object):
-	def __init__(self, x=0, y=0, name='None', size=0.8):
-		self.x = x
-		self.y = y
-		self.name = name
-		self.size = size
-#############################################################################################
-		self.times = []		#The list of response times per item
-		self.decays = []	#The list of decay values per item
-		self.alpha = []		#The list of alpha's for each item
-		self.act = 0		#The activation per item
-		self.numShows = 0 	#The # of shows per item
-		
-		self.shownBefore = False
-
-	def addShow(self):
-		self.numShows += 1
-###########################################################################################                
-	def hit(self, x, y):
-		distanceSqr = (self.x-x)*(self.x-x) + (self.y-y)*(self.y-y)
-		if distanceSqr <= placeClickAreaSqr:
-			return True
-		else:
-			return False
-	
-	def distanceTo(self, x, y):
-		return sqrt( (self.x-x)*(self.x-x) + (self.y-y)*(self.y-y) )
+	def set_state(self):
+		glEnable(GL_BLEND)
+		glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+		if self.texture is not None:
+			glEnable(self.texture.target)
+			glBindTexture(self.texture.target, self.texture.id)
+
+	def unset_state(self):
+		if self.texture is not None:
+			glDisable(self.texture.target)
+
+# Event loop that only redraws a window when it is invalid. App marks itself invalid when
+# something on screen changed, instead of being redrawn after every tick.
+class RedrawEventLoop(pyglet.app.EventLoop):
+	def idle(self):
+		dt = self.clock.update_time()
+		self.clock.call_scheduled_functions(dt)
+		for window in pyglet.app.windows:
+			if window.invalid:
+				window.switch_to()
+				window.dispatch_event('on_draw')
+				window.flip()
+		return self.clock.get_sleep_time(True)
 
-	def coords(self):
-		return (self.x, self.y)
-	
-		return False
-
-class TrialResult(object):
-	def __init__(self, type, condition, placeIdx, placeName, result, hintUsed, rt, velocity, distance, shortest, timestamp):
-		self.type = type
-		self.condition = condition
-		self.placeIndex = placeIdx
-		self.placeName = placeName
-		self.result = result
-		self.hintUsed = hintUsed
-		self.RT = rt
-		self.avgVelocity = velocity
-		self.distanceTraveled = distance
-		if rt > 0:
-			self.avgSpeed = distance / rt
-		else:
-			self.avgSpeed = 1000
-		self.shortestPath = shortest
-		self.timeStamp = timestamp
-		
 # App handles the window, initialization and scheduling
 class App(pyglet.window.Window):
 	def __init__(self, subject, spacing, *args, **keys):
-		super(App, self).__init__(*args, **keys)
+		# the clock that stamps events and trial starts, can be replaced by a virtual clock
+		clock = keys.pop('clock', None)
+		# connection to a session service that makes the decisions (see sessions.py), or None
+		server = keys.pop('server', None)
+		# id of the learner in results/learners.db whose memory this session continues, or None
+		learner = keys.pop('learner', None)
+		with startupTimer.phase('create window'):
+			super(App, self).__init__(*args, **keys)
 
 		self.subjectName = subject
 		self.spacingFirst = spacing
+		self.clock = clock or MonotonicClock()
+		self.subjectStart = self.clock()  # clock time at which subjectTime was 0
 		
 		# variables that define the state of the program
 		self.runTime = 0.0              # internal clock
-		self.subjectTime = 0.0          # starts running when the subject starts
+		self.subjectTime = 0.0          # starts running when the subject starts, updated every tick
 		self.expLength = 20*60.0      # total experiment length
 		self.maxTrialLen = 15.0         # maximal length of a trial
 		self.trialStartTime = 0.0       # time the user starts a new trial by clicking ok
@@ -526,6 +93,8 @@ class App(pyglet.window.Window):
 		self.posFeedbackTimer = 0.0     # keeps track of positive feedback time
 		self.negFeedbackLen = 2.0       # amount of time positive feedback is shown
 		self.negFeedbackTimer = 0.0     # keeps track of positive feedback time		
+		self.nextTrialPlan = None       # next trial worked out during feedback, see planNextTrial
+		self.trialPlanned = False
 		self.mode = INTRO               # the current mode the program is in. 0 is the welcomescreen
 		self.showNextPlaceBox = False  #is the next place the user must find shown?
 		self.clickedCorrectPlace = False
@@ -548,16 +117,45 @@ class App(pyglet.window.Window):
 		self.shortestPath = 0 # shortest path from trial starting pos to target
 		self.mouseUpdated = False
 		self.clickedPlace = 0 # place clicked by the subject
+		self.drawnState = None # see redrawState
 
 		#initialize teacher with the list of map places
-		mapPlaces = self.loadMapPlaces()
-		self.teacher = Teacher(mapPlaces, self.width, self.height, self.spacingFirst, self.expLength, self.subjectName) 
+		with startupTimer.phase('loadMapPlaces'):
+			mapPlaces = self.loadMapPlaces()
+		with startupTimer.phase('Teacher.__init__'):
+			if server is None:
+				self.teacher = Teacher(mapPlaces, self.width, self.height, self.spacingFirst, self.expLength, self.subjectName, self.clock) 
+				if learner is not None:
+					# continue where the learner left off in earlier sessions
+					from learnerstore import LearnerStore
+					self.teacher.useStore(LearnerStore(learnerStoreFile), learner=learner)
+			else:
+				from sessions import RemoteTeacher
+				self.teacher = RemoteTeacher(server, mapPlaces, self.width, self.height, self.spacingFirst, self.expLength, self.subjectName, self.clock)
+		self.teacher.startLog()
+
+		# mouse path of every trial, see trajectory.py
+		self.trajectory = TrajectoryRecorder(clock=self.clock)
+		self.paths = PathWriter(os.path.join('results', self.teacher.prefix+'_paths.bin'))
+		
+		# spatial indexes for finding clicked places, built after the teacher has shuffled the places
+		with startupTimer.phase('PlaceGrid'):
+			self.mapIndex = PlaceGrid(self.teacher.mapPlaces)
+			self.calibIndex = PlaceGrid(self.teacher.calibPlaces)
 		
+		# time taken by every update and draw
+		self.frames = FrameProfiler(updateFreq)
+
+		# images are loaded when first used
+		self.assets = AssetManager('img')
+
 		#setup gui
-		self.gui = Gui(self.width, self.height, mapPlaces, self.teacher.calibPlaces)
+		with startupTimer.phase('Gui.__init__'):
+			self.gui = Gui(self.width, self.height, mapPlaces, self.teacher.calibPlaces, self.assets)
 
 		#setup animations
-		self.ani = Animator(self.width, self.height, self.posFeedbackLen, self.negFeedbackLen)
+		with startupTimer.phase('Animator.__init__'):
+			self.ani = Animator(self.width, self.height, self.posFeedbackLen, self.negFeedbackLen, self.assets)
 
 		# nicer graphics
 		glEnable(GL_BLEND)
@@ -567,6 +165,24 @@ class App(pyglet.window.Window):
 	
 	# Drawing loop
 	def on_draw(self):
+		if startupTimer.running:
+			with startupTimer.phase('first on_draw'):
+				self.drawFrame()
+			self.finishStartup()
+		else:
+			t0 = frameTimer()
+			self.drawFrame()
+			self.frames.addDraw(frameTimer() - t0)
+		self.invalid = False
+
+	def on_expose(self):
+		self.invalid = True
+
+	# the state that decides what is drawn, apart from the animations and the gui
+	def redrawState(self):
+		return (self.mode, self.showHint, self.clickedCorrectPlace, self.clickedWrongPlace, self.trialTimedOut, self.currentTrialPlace, self.calibPlace, self.ani.state())
+
+	def drawFrame(self):
 		self.clear()
 
 		if self.mode == INTRO:
@@ -601,33 +217,28 @@ class App(pyglet.window.Window):
 	
 	# Find out which place was clicked by the user
 	def getClickedPlace(self, x, y):
-		places = []
 		if (self.mode == CALIB):
-			places = self.teacher.calibPlaces
+			return self.calibIndex.nearest(x, y)
 		else:
-			places = self.teacher.mapPlaces
-		
-		for (i, place) in enumerate(places):
-			if place.hit(x,y):
-				return i
-		return None
+			return self.mapIndex.nearest(x, y)
 
 	# update the amount the mouse as moved, using a 'city block' distance measure
 	def updateDistanceTraveled(self, dx, dy):
 		self.distanceTraveled += abs(dx) + abs(dy)
 	
 	# submit information of the completed trial to the teacher object
-	def updateTeacherWithTrial(self, result):
+	def updateTeacherWithTrial(self, result, eventTime):
 		avgVelocity = sum(self.velocityMeasures) / len(self.velocityMeasures)
 		hint = NOHINT
 		if self.showHint:
 			hint = HINT
-		self.teacher.currentTrialResult(result, hint, (self.subjectTime - self.trialStartTime), avgVelocity, self.distanceTraveled, self.shortestPath, self.subjectTime)
+		self.teacher.currentTrialResult(result, hint, (eventTime - self.trialStartTime), avgVelocity, self.distanceTraveled, self.shortestPath, eventTime)
+		self.paths.write(TRIALPATH, len(self.teacher.completedTrials)-1, self.trajectory)
 		self.resetMeasurements()	
 	
 	# start all the processes when the subject has clicked a correct place
-	def startClickedCorrectPlace(self):	
-		self.updateTeacherWithTrial(CORRECT)
+	def startClickedCorrectPlace(self, eventTime):	
+		self.updateTeacherWithTrial(CORRECT, eventTime)
 
 		self.clickedCorrectPlace = True
 		self.showHint = False		
@@ -661,8 +272,8 @@ class App(pyglet.window.Window):
 		# start a new trial
 		self.startNextTrial()
 		
-	def startClickedWrongPlace(self):
-		self.updateTeacherWithTrial(WRONG)
+	def startClickedWrongPlace(self, eventTime):
+		self.updateTeacherWithTrial(WRONG, eventTime)
 
 		self.clickedWrongPlace = True
 		self.showHint = False		
@@ -694,7 +305,7 @@ class App(pyglet.window.Window):
 
 	# if a subject waits too long before answering, the trial times out
 	def startTimedOut(self):	
-		self.updateTeacherWithTrial(WRONG)
+		self.updateTeacherWithTrial(WRONG, self.subjectTime)
 
 		self.trialTimedOut = True
 		self.showHint = False
@@ -715,6 +326,22 @@ class App(pyglet.window.Window):
 		
 		self.startNextTrial()
 
+	# Work out the alpha, decay and crossing time of the next trial once during feedback, on the
+	# frame after the one that started it, so the frame that ends the feedback only applies them
+	# and picks the place. The teacher throws the plan away if the feedback ends too far from the
+	# expected time.
+	def planNextTrial(self):
+		if self.trialPlanned:
+			return
+		if self.clickedCorrectPlace:
+			remaining = self.posFeedbackLen - self.posFeedbackTimer
+		elif self.clickedWrongPlace or self.trialTimedOut:
+			remaining = self.negFeedbackLen - self.negFeedbackTimer
+		else:
+			return
+		self.trialPlanned = True
+		self.nextTrialPlan = self.teacher.planNextTrial(self.subjectTime + remaining, self.clock() + remaining)
+
 	def calcShowHint(self, dt):
 		if self.subjectTime - self.trialStartTime > 0.66*self.maxTrialLen and not self.showHint:
 			if self.allowHint:
@@ -727,18 +354,18 @@ class App(pyglet.window.Window):
 		self.shortestPath = 0		
 		
 	# check to see which place was clicked, if any
-	def handleMapClickInput(self, x, y):
+	def handleMapClickInput(self, x, y, eventTime):
 		# what place did the subject click
 		placeIdx = self.getClickedPlace(x, y)
 		self.clickedPlace = placeIdx
 		if placeIdx != None: # a place was clicked
 			# is it the right place?
 			if placeIdx == self.currentTrialPlace: #right
-				self.startClickedCorrectPlace()
+				self.startClickedCorrectPlace(eventTime)
 			else: #wrong
-				self.startClickedWrongPlace()
+				self.startClickedWrongPlace(eventTime)
 
-	def handleCalibClickInput(self, x, y):
+	def handleCalibClickInput(self, x, y, eventTime):
 		placeIdx = self.getClickedPlace(x, y)
 		self.clickedPlace = placeIdx
 		#print placeIdx
@@ -747,14 +374,16 @@ class App(pyglet.window.Window):
 			self.ani.startClickPlaceAni(px, py)
 			if placeIdx == self.calibPlace: #right
 				avgVelocity = sum(self.velocityMeasures) / len(self.velocityMeasures)
-				self.teacher.currentCalibrationResult( (self.subjectTime - self.trialStartTime), avgVelocity, self.distanceTraveled, self.shortestPath, self.subjectTime)
+				self.teacher.currentCalibrationResult( (eventTime - self.trialStartTime), avgVelocity, self.distanceTraveled, self.shortestPath, eventTime)
+				self.paths.write(CALIBPATH, len(self.teacher.completedCalibTrials)-1, self.trajectory)
 				self.clickedPlace = 0
 				self.resetMeasurements()
 				self.ani.endArrowAni()
 				self.startNextCalib()
 			else: # wrong, reset
 				self.resetMeasurements()
-				self.trialStartTime = self.subjectTime
+				self.trialStartTime = eventTime
+				self.trajectory.beginTrial()
 				(tx, ty) = self.teacher.currentCalibCoords()
 				self.ani.endArrowAni()
 				self.ani.startArrowAni(tx, ty)
@@ -765,10 +394,18 @@ class App(pyglet.window.Window):
 	
 	######### TIMING #########
 	
+	# the time since the subject started, read from the clock
+	def subjectNow(self):
+		return self.clock() - self.subjectStart
+
+	def resetSubjectTime(self):
+		self.subjectStart = self.clock()
+		self.subjectTime = 0.0
+
 	# keep track of time
 	def updateTime(self, dt):
 		self.runTime += dt
-		self.subjectTime += dt
+		self.subjectTime = self.subjectNow()
 		#print self.timeRunning
 
 	# check how long this trial has been going on
@@ -787,6 +424,8 @@ class App(pyglet.window.Window):
 		
 	# run animations when apropriate
 	def update(self, dt):
+		t0 = frameTimer()
+		animating = self.ani.isAnimating()
 		#compensation for the mouse position only being updated when moved
 		if not self.mouseUpdated:
 			self.prevMousePos = self.mousePos
@@ -801,20 +440,32 @@ class App(pyglet.window.Window):
 		self.calcClickedCorrectPlace(dt)
 		self.calcClickedWrongPlace(dt)
 		self.calcTimedOut(dt)
+		self.planNextTrial()
 		
 		self.mouseUpdated = False
+
+		# redraw when something on screen changed, only used with RedrawEventLoop
+		state = self.redrawState()
+		if animating or self.ani.isAnimating() or self.gui.dirty or state != self.drawnState:
+			self.invalid = True
+			self.drawnState = state
+			self.gui.dirty = False
+
+		self.frames.addUpdate(dt, frameTimer() - t0, self.mode, self.subjectTime)
 		
 	######## INPUT EVENTS #########
 	
 	def on_mouse_press(self,x, y, button, modifiers):
+		# stamp the press when it arrives, not at the next tick
+		eventTime = self.subjectNow()
 		#print x,y
 		# what mode are we in? (before trial, during trial, training, etc.)
 		if self.mode == TRIAL or self.mode == DRILL: # subject can click places
 			if not self.clickedCorrectPlace and not self.clickedWrongPlace and not self.trialTimedOut: # not busy handling a previous trial	
 				# subject has already initiated the new (practice) trial
-				self.handleMapClickInput(x, y)
+				self.handleMapClickInput(x, y, eventTime)
 		elif self.mode == CALIB:
-			self.handleCalibClickInput(x, y)
+			self.handleCalibClickInput(x, y, eventTime)
 		elif self.mode == INTRO:
 			self.handleIntroScreenInput(x, y)
 	
@@ -822,10 +473,12 @@ class App(pyglet.window.Window):
 		self.mouseUpdated = True
 		self.prevMousePos = self.mousePos
 		self.mousePos = (x, y)
+		self.trajectory.add(x, y)
 		
 		self.updateDistanceTraveled(dx, dy)
 	
 	def on_mouse_drag(self, x, y, dx, dy, buttons, modifiers):
+		self.trajectory.add(x, y)
 		if self.mode == TRIAL or self.mode == DRILL:
 			self.updateDistanceTraveled(dx, dy)
 	
@@ -838,19 +491,21 @@ class App(pyglet.window.Window):
 		if self.mode != END:
 			#we didn't save the data for some reason, do so now
 			self.teacher.saveResults()
+			self.saveFrameTimes()
+			self.paths.close()
 		super(App, self).on_close()
 				
 	######### MISC #########
 	
 	def startCalibration(self):
 		self.mode = CALIB
-		self.subjectTime = 0.0
+		self.resetSubjectTime()
 		self.startNextCalib()
 	
 	# called once at the beginning of the experiment
 	def startExperiment(self):
 		self.mode = DRILL
-		self.subjectTime = 0.0
+		self.resetSubjectTime()
 		self.startNextTrial()
 	
 	def startNextCalib(self):
@@ -859,7 +514,8 @@ class App(pyglet.window.Window):
 			(tx, ty) = self.teacher.currentCalibCoords()
 			(mx, my) = self.mousePos
 			
-			self.trialStartTime = self.subjectTime
+			self.trialStartTime = self.subjectNow()
+			self.trajectory.beginTrial()
 			self.shortestPath = abs(tx-mx) + abs(ty-my) # in 'city blocks'
 			
 			self.ani.startArrowAni(tx, ty)
@@ -871,7 +527,9 @@ class App(pyglet.window.Window):
 		# check if there's time for another trial
 		if self.subjectTime < self.expLength:
 			# get a new trial from the teacher
-			(newPlace, type, hintAllowed) = self.teacher.getNextTrial(self.subjectTime)
+			(newPlace, type, hintAllowed) = self.teacher.getNextTrial(self.subjectTime, self.nextTrialPlan)
+			self.nextTrialPlan = None
+			self.trialPlanned = False
 			#print 'newplace ',newPlace
 			self.currentTrialPlace = newPlace
 			self.currentTrialType = type
@@ -881,7 +539,8 @@ class App(pyglet.window.Window):
 			(tx, ty) = self.teacher.currentTrialPlaceCoords()
 			(mx, my) = self.mousePos
 			self.shortestPath = abs(tx-mx) + abs(ty-my) # in 'city blocks'
-			self.trialStartTime = self.subjectTime
+			self.trialStartTime = self.subjectNow()
+			self.trajectory.beginTrial()
 
 			#setup hint area
 			self.gui.setHintArea(tx, ty)
@@ -898,72 +557,79 @@ class App(pyglet.window.Window):
 	def finalizeExperiment(self):
 		# save results
 		self.teacher.saveResults()
+		self.saveFrameTimes()
+		self.paths.close()
 		
 		# show end screen
 		self.mode = END
 	
+	# frame times go next to the results, see frameprofile.py
+	def saveFrameTimes(self):
+		self.frames.save(os.path.join('results', self.teacher.prefix), self.teacher.completedTrials)
+
+	# the first frame is drawn, save (and print) where start-up time went
+	def finishStartup(self):
+		startupTimer.finish()
+		startupTimer.save(os.path.join('results', self.teacher.prefix+'_startup.txt'))
+		if startupTimer.verbose:
+			print(startupTimer.report())
+
 	# Load countries from an xml file
 	def loadMapPlaces(self):
-		doc = xml.dom.minidom.parse('map.xml')
-		places = []
-		
-		for node in doc.getElementsByTagName('place'):
-			x = node.getAttribute('x')
-			y = node.getAttribute('y')
-			name = node.getAttribute('name')
-			size = node.getAttribute('size')
-		
-			places.append(Place(int(x), int(y), name, float(size)))
-		
-		doc.unlink()
-		return places			
+		return loadMapPlaces('map.xml')
 
 # Display animations
 class Animator(object):
-	def __init__(self, screenWidth, screenHeight, posFbLen, negFbLen):
+	def __init__(self, screenWidth, screenHeight, posFbLen, negFbLen, assets):
 		self.width = screenWidth
 		self.height = screenHeight
+		self.assets = assets
 		
 		self.aniClickGlowLen = 0.3
 		self.posFeedbackLen = posFbLen
 		self.negFeedbackLen = negFbLen
 		self.showArrowLen = 7.0
 		
-		self.showClickGlowAni = False       #show glow when clicking a place
-		self.aniClickGlowTime = 0.0
-		self.showPosFeedbackAni = False  #show positive feedback
-		self.posFeedbackTime = 0.0
-		self.showNegFeedbackAni = False  #show positive feedback
-		self.negFeedbackTime = 0.0
-		self.showArrowAni = False # show the place indicator arrow
-		self.arrowTime = 0.0
-		
 		self.showPlacePopupAni = False
-		self.placePopupTime = 0.0
 		self.finishPopup = False
+		self.popupFadeLen = 0.2
 		
 		self.posFeedbackColor = (0,69,89)
 		self.negFeedbackColor = (181,0,0)
 		
+		# only the running animations are ticked
+		self.tweens = TweenScheduler()
+		self.clickGlowAni = Tween(self.aniClickGlowLen, self.calcClickPlaceAni, self.endClickPlaceAni)       #show glow when clicking a place
+		self.posFeedbackAni = Tween(self.posFeedbackLen, self.calcPosFeedbackAni, self.endPosFeedbackAni)   #show positive feedback
+		self.negFeedbackAni = Tween(self.negFeedbackLen, self.calcNegFeedbackAni, self.endNegFeedbackAni)   #show negative feedback
+		self.arrowAni = Tween(self.showArrowLen, self.calcArrowAni, self.endArrowAni)                       # show the place indicator arrow
+		self.popupInAni = Tween(self.popupFadeLen, self.calcPopupFadeIn, self.endPopupFadeIn)
+		self.popupOutAni = Tween(2*self.popupFadeLen, self.calcPopupFadeOut, self.endPlacePopupAni)
+		self.changed = False # a property was changed by the last tick
+		
 		self.initGraphics()
 
 	def initGraphics(self):
+		# all animated sprites are in one batch, the place popup is drawn over the top bar
+		self.batch = pyglet.graphics.Batch()
+		self.overlayBatch = pyglet.graphics.Batch()
+
 		# the glow shown when a place is clicked
-		self.imgClickGlow = loadAndCenterImg('img/glow.png')
-		self.clickGlow = createSprite(self.imgClickGlow)
+		self.imgClickGlow = self.assets.image('glow')
+		self.clickGlow = createSprite(self.imgClickGlow, batch=self.batch, group=pyglet.graphics.OrderedGroup(0))
 
 		# popup showing the next trial place
-		self.imgPlacePopup = loadAndCenterImg('img/place_popup.png')
-		self.placePopup = createSprite(self.imgPlacePopup, x=self.width//2, y=self.height-50)
+		self.imgPlacePopup = self.assets.image('place_popup')
+		self.placePopup = createSprite(self.imgPlacePopup, x=self.width//2, y=self.height-50, batch=self.overlayBatch)
 		
 		# box containing feedback
-		self.imgFeedbackBox = loadAndCenterImg('img/feedback_box.png')
-		self.feedbackBox = createSprite(self.imgFeedbackBox)
+		self.imgFeedbackBox = self.assets.image('feedback_box')
+		self.feedbackBox = createSprite(self.imgFeedbackBox, batch=self.batch, group=pyglet.graphics.OrderedGroup(1))
 		self.feedbackBox.scale = 0.8
 		
 		#arrow used in  negative feedback and drill trials
-		self.imgArrow = loadAndCenterImg('img/arrow.png')
-		self.arrow = createSprite(self.imgArrow)
+		self.imgArrow = self.assets.image('arrow')
+		self.arrow = createSprite(self.imgArrow, batch=self.batch, group=pyglet.graphics.OrderedGroup(2))
 		self.arrow.scale = 0.6
 		
 		self.textPosFeedback = pyglet.text.Label('Right!', font_name=appFont,  font_size=18,  bold=True, x=0, y=0,  anchor_x='center', anchor_y='center')
@@ -974,42 +640,47 @@ class Animator(object):
 		self.textDrill.color = (0, 0, 0, 255)
 		self.textTrialPlace = pyglet.text.Label(' ', font_name=appFont,  bold=True, font_size=22,  x=self.width//2, y=self.height-60,  anchor_x='center', anchor_y='center')
 		
+	# sprites that are not shown are invisible, the labels are only drawn with their animation
 	def renderMapAnimations(self):
-		if self.showClickGlowAni:
-			self.clickGlow.draw()
+		self.batch.draw()
 		
-		if self.showPosFeedbackAni:
-			self.feedbackBox.draw()
+		if self.tweens.running(self.posFeedbackAni):
 			self.textPosFeedback.draw()
 			
-		if self.showNegFeedbackAni:
-			self.feedbackBox.draw()
-			self.arrow.draw()
+		if self.tweens.running(self.negFeedbackAni):
 			self.textNegFeedback.draw()
 			self.textNegFeedback2.draw()
-			
-		if self.showArrowAni:
-			self.arrow.draw()
 
 	def renderOverlayAnimations(self, trialType):
 		if self.showPlacePopupAni:
 			
 			if trialType == TRIAL:
-				self.placePopup.color = (255, 255, 255)
-				self.placePopup.draw()
+				self.set(self.placePopup, 'color', (255, 255, 255))
+				self.overlayBatch.draw()
 				self.textTrial.draw()
 			else:
-				self.placePopup.color = (150, 255, 165)
-				self.placePopup.draw()
+				self.set(self.placePopup, 'color', (150, 255, 165))
+				self.overlayBatch.draw()
 				self.textDrill.draw()
 			self.textTrialPlace.draw()
 			
 	def updateAnimations(self, dt):
-		self.calcClickPlaceAni(dt)
-		self.calcPosFeedbackAni(dt)
-		self.calcNegFeedbackAni(dt)
-		self.calcPlacePopupAni(dt)
-		self.calcArrowAni(dt)
+		self.changed = False
+		self.tweens.tick(dt)
+
+	# write a property of a sprite or label, if its value changed
+	def set(self, obj, name, value):
+		if setChanged(obj, name, value):
+			self.changed = True
+
+	# which animations are shown
+	def state(self):
+		return (self.tweens.running(self.clickGlowAni), self.tweens.running(self.posFeedbackAni), self.tweens.running(self.negFeedbackAni),
+		        self.tweens.running(self.arrowAni), self.showPlacePopupAni, self.finishPopup)
+
+	# true while an animation changes what is drawn every tick
+	def isAnimating(self):
+		return self.changed
 
 	## ANIMATIONS
 		
@@ -1019,61 +690,59 @@ class Animator(object):
 		self.clickGlow.scale = 0.2
 		self.clickGlow.opacity = 255
 		self.clickGlow.visible = True
-		self.showClickGlowAni = True
+		self.tweens.start(self.clickGlowAni)
 	
-	def calcClickPlaceAni(self, dt):
-		if self.showClickGlowAni:
-			self.aniClickGlowTime += dt
-			if self.aniClickGlowTime > self.aniClickGlowLen:
-				# animation is done
-				self.endClickPlaceAni()
-			else:
-				# continue animation
-				self.clickGlow.scale = 0.3 + (0.6*self.aniClickGlowTime)/self.aniClickGlowLen
-				self.clickGlow.opacity = 255 - int( (255*self.aniClickGlowTime)/self.aniClickGlowLen )	
+	def calcClickPlaceAni(self, time):
+		self.set(self.clickGlow, 'scale', 0.3 + (0.6*time)/self.aniClickGlowLen)
+		self.set(self.clickGlow, 'opacity', 255 - int( (255*time)/self.aniClickGlowLen ))
 	
 	def endClickPlaceAni(self):
+		self.tweens.stop(self.clickGlowAni)
 		self.clickGlow.visible = False
-		self.showClickGlowAni = False
-		self.aniClickGlowTime = 0.0
-
 
 	def startPlacePopupAni(self, placeName):
 		self.placePopup.visible = True
 		self.showPlacePopupAni = True
+		self.finishPopup = False
 		self.textTrialPlace.text = placeName
+		self.tweens.stop(self.popupOutAni)
+		self.tweens.start(self.popupInAni)
 	
-	def calcPlacePopupAni(self, dt):
-		fadeLen = 0.2
-		if self.showPlacePopupAni:
-
-			if self.finishPopup: # do fade out
-				if self.placePopupTime > fadeLen*2:
-					self.endPlacePopupAni()
-				else:
-					self.placePopupTime += dt
-					alpha =  max(0, 255 - int( (255*(self.placePopupTime-fadeLen)/fadeLen) ))
-					self.placePopup.opacity = alpha
-					self.textTrialPlace.color = (0, 0, 0, alpha)
-					self.textTrial.color = (0, 0, 0, alpha)
-					self.placePopup.scale = 0.9 + 0.2*((self.placePopupTime-fadeLen)/fadeLen)
-			
-			elif self.placePopupTime < fadeLen: #do fade in
-				self.placePopupTime += dt
-				alpha = min(255, int( (255*self.placePopupTime)/fadeLen))
-				self.placePopup.opacity = alpha
-				self.textTrialPlace.color = (0, 0, 0, alpha)
-				self.textTrial.color = (0, 0, 0, alpha)
-				self.placePopup.scale = 1.0 - 0.2*(self.placePopupTime/fadeLen)
+	def setPopupAlpha(self, alpha, scale):
+		self.set(self.placePopup, 'opacity', alpha)
+		self.set(self.textTrialPlace, 'color', (0, 0, 0, alpha))
+		self.set(self.textTrial, 'color', (0, 0, 0, alpha))
+		self.set(self.placePopup, 'scale', scale)
+
+	def calcPopupFadeIn(self, time):
+		fadeLen = self.popupFadeLen
+		self.setPopupAlpha(min(255, int( (255*time)/fadeLen)), 1.0 - 0.2*(time/fadeLen))
+
+	def endPopupFadeIn(self):
+		self.calcPopupFadeIn(self.popupFadeLen)
+
+	# the fade out starts where the fade in is
+	def calcPopupFadeOut(self, time):
+		fadeLen = self.popupFadeLen
+		alpha = max(0, 255 - int( (255*(time-fadeLen)/fadeLen) ))
+		self.setPopupAlpha(min(255, alpha), 0.9 + 0.2*((time-fadeLen)/fadeLen))
 	
 	def endPlacePopupAni(self):
+		self.tweens.stop(self.popupInAni)
+		self.tweens.stop(self.popupOutAni)
 		self.placePopup.visible = False
 		self.showPlacePopupAni = False
 		self.finishPopup = False
-		self.placePopupTime = 0.0
 	
 	def finishPlacePopup(self):
+		if self.finishPopup or not self.showPlacePopupAni:
+			return
 		self.finishPopup = True
+		time = self.popupFadeLen
+		if self.tweens.running(self.popupInAni):
+			time = self.popupInAni.time
+			self.tweens.stop(self.popupInAni)
+		self.tweens.start(self.popupOutAni, time)
 	
 	def startPosFeedbackAni(self, x, y):
 		#determine where to show the feedback
@@ -1083,33 +752,20 @@ class Animator(object):
 		(posR, posG, posB) = self.posFeedbackColor
 		self.feedbackBox.visible = True
 		self.textPosFeedback.color = (posR, posG, posB, 0)
-		self.showPosFeedbackAni = True
+		self.tweens.start(self.posFeedbackAni)
 		
-	def calcPosFeedbackAni(self, dt):
-		if self.showPosFeedbackAni:
-			#we're in the middle of the animation
-			self.posFeedbackTime += dt
-			if self.posFeedbackTime > self.posFeedbackLen:
-				self.endPosFeedbackAni()
-			else:
-				fadeLen = self.posFeedbackLen*0.2
-				(posR, posG, posB) = self.posFeedbackColor
-				feedbackAlpha = self.getFeedbackAlpha(self.posFeedbackTime, fadeLen, self.posFeedbackLen)
-				
-				self.textPosFeedback.color =  (posR, posG, posB, feedbackAlpha)
-				self.feedbackBox.opacity = feedbackAlpha
+	def calcPosFeedbackAni(self, time):
+		fadeLen = self.posFeedbackLen*0.2
+		(posR, posG, posB) = self.posFeedbackColor
+		feedbackAlpha = self.getFeedbackAlpha(time, fadeLen, self.posFeedbackLen)
+		
+		self.set(self.textPosFeedback, 'color', (posR, posG, posB, feedbackAlpha))
+		self.set(self.feedbackBox, 'opacity', feedbackAlpha)
 				
 	def endPosFeedbackAni(self):
-		self.showPosFeedbackAni = False
+		self.tweens.stop(self.posFeedbackAni)
 		self.feedbackBox.visible = False
-		self.posFeedbackTime = 0.0	
 
-	def calcFeedbackAni(self, positive, dt):	
-		if positive:
-			showFeedbackAni = self.showPosFeedbackAni
-		else:
-			showFeedbackAni = self.showNegFeedbackAni
-		
 	def startNegFeedbackAni(self, x, y):
 		#determine where to show the feedback
 		self.feedbackBox.set_position(x, y+100)
@@ -1123,49 +779,36 @@ class Animator(object):
 		self.arrow.visible = True
 		self.textNegFeedback.color = (posR, posG, posB, 0)
 		self.textNegFeedback2.color = (posR, posG, posB, 0)
-		self.showNegFeedbackAni = True
-
-	def calcNegFeedbackAni(self, dt):
-		if self.showNegFeedbackAni:
-			#we're in the middle of the animation
-			self.negFeedbackTime += dt
-			if self.negFeedbackTime > self.negFeedbackLen:
-				self.endNegFeedbackAni()
-			else:
-				fadeLen = self.negFeedbackLen*0.15
-				(negR, negG, negB) = self.negFeedbackColor
-				feedbackAlpha = self.getFeedbackAlpha(self.negFeedbackTime, fadeLen, self.negFeedbackLen)
-				
-				self.textNegFeedback.color = (negR, negG, negB, feedbackAlpha)
-				self.textNegFeedback2.color = (negR, negG, negB, feedbackAlpha)
-				self.feedbackBox.opacity = feedbackAlpha
-				self.arrow.opacity = feedbackAlpha
+		self.tweens.start(self.negFeedbackAni)
+
+	def calcNegFeedbackAni(self, time):
+		fadeLen = self.negFeedbackLen*0.15
+		(negR, negG, negB) = self.negFeedbackColor
+		feedbackAlpha = self.getFeedbackAlpha(time, fadeLen, self.negFeedbackLen)
+		
+		self.set(self.textNegFeedback, 'color', (negR, negG, negB, feedbackAlpha))
+		self.set(self.textNegFeedback2, 'color', (negR, negG, negB, feedbackAlpha))
+		self.set(self.feedbackBox, 'opacity', feedbackAlpha)
+		self.set(self.arrow, 'opacity', feedbackAlpha)
 		
 	def endNegFeedbackAni(self):		
-		self.showNegFeedbackAni = False
+		self.tweens.stop(self.negFeedbackAni)
 		self.feedbackBox.visible = False
 		self.arrow.visible = False
-		self.negFeedbackTime = 0.0
 
 	def startArrowAni(self, x, y):
-		self.showArrowAni = True
 		self.arrow.set_position(x, y+30)
 		self.arrow.visible = True
 		self.arrow.opacity = 0
+		self.tweens.start(self.arrowAni)
 
-	def calcArrowAni(self, dt):
-		if self.showArrowAni:
-			self.arrowTime  += dt
-			if self.arrowTime > self.showArrowLen:
-				self.endArrowAni()
-			else:
-				fadeLen = self.showArrowLen*0.10
-				self.arrow.opacity = min(255, int(255*(self.arrowTime/fadeLen)))
+	def calcArrowAni(self, time):
+		fadeLen = self.showArrowLen*0.10
+		self.set(self.arrow, 'opacity', min(255, int(255*(time/fadeLen))))
 
 	def endArrowAni(self):
-		self.showArrowAni = False
+		self.tweens.stop(self.arrowAni)
 		self.arrow.visible = False
-		self.arrowTime = 0.0
 		self.arrow.opacity = 0
 				
 	## MISC
@@ -1181,23 +824,28 @@ class Animator(object):
 
 #Draw and update the gui
 class Gui(object):
-	def __init__(self, screenWidth, screenHeight, mapPlaces, calibPlaces):
+	def __init__(self, screenWidth, screenHeight, mapPlaces, calibPlaces, assets):
 		self.width = screenWidth
 		self.height = screenHeight
-		
-		self.initGraphics()
-		self.loadPlaceMarkers(mapPlaces)
-		self.loadCalibMarkers(calibPlaces)
+		self.assets = assets
+		self.dirty = True # something changed since the last draw
+		
+		with startupTimer.phase('initGraphics'):
+			self.initGraphics()
+		with startupTimer.phase('loadPlaceMarkers'):
+			self.loadPlaceMarkers(mapPlaces)
+		with startupTimer.phase('loadCalibMarkers'):
+			self.loadCalibMarkers(calibPlaces)
 	
 	## SETUP
 	
 	def initGraphics(self):
 		#bar at the top of the screen
-		imgTopbar = pyglet.image.load('img/topbar.png')
-		self.texTopbar = imgTopbar.get_texture()
+		self.texTopbar = self.assets.texture('topbar')
 		
 		#get the map
-		self.imgMap = pyglet.image.load('img/map.png')	
+		with startupTimer.phase('map image'):
+			self.imgMap = self.assets.texture('map')
 		self.placeMarkers = [] #place marker sprites
 		self.placeRadii = []
 		self.placeMarkersBatch = pyglet.graphics.Batch() #improve rendering by batching
@@ -1209,25 +857,25 @@ class Gui(object):
 		self.calibRadii = []
 		self.calibMarkersBatch = pyglet.graphics.Batch()
 		
-		self.imgGrid = loadAndCenterImg('img/grid.png')		
-		self.grid = pyglet.image.TileableTexture.create_for_image(self.imgGrid)
-		self.gridWidth = self.width / self.imgGrid.width
-		self.gridHeight = self.height / self.imgGrid.height
+		self.grid = self.assets.tileable('grid')
+		self.gridWidth = self.width / self.grid.width
+		self.gridHeight = self.height / self.grid.height
+		
+		# the map, grid, shading, hint and top bar are vertex lists in batches. They are built
+		# here and only changed when their geometry changes, see setHintArea
+		self.buildOverlays()
 		
 		#setup place marker rendering
-		self.imgPlaceMarker = loadAndCenterImg('img/marker.png')
-		self.imgMarkerCorrect = loadAndCenterImg('img/marker_right.png')
+		self.imgPlaceMarker = self.assets.image('marker')
+		self.imgMarkerCorrect = self.assets.image('marker_right')
 		self.markerCorrect = createSprite(self.imgMarkerCorrect)
-		self.imgMarkerWrong = loadAndCenterImg('img/marker_wrong.png')
+		self.imgMarkerWrong = self.assets.image('marker_wrong')
 		self.markerWrong = createSprite(self.imgMarkerWrong)
-		self.imgPlaceRadius = loadAndCenterImg('img/radius.png')
-
-		# intro images
-		self.imgIntro1 = loadAndCenterImg('img/intro_click.png')
-		self.imgIntro2 = loadAndCenterImg('img/intro_arrow.png')
+		self.imgPlaceRadius = self.assets.image('radius')
 		
 		#setup text
-		self.textPercentCorrect = pyglet.text.Label(' ', font_name=appFont,  font_size=14,  x=self.width-10, y=self.height-10,  anchor_x='right', anchor_y='top')
+		self.textPercentCorrect = pyglet.text.Label(' ', font_name=appFont,  font_size=14,  x=self.width-10, y=self.height-10,  anchor_x='right', anchor_y='top',
+		                                            batch=self.guiBatch, group=pyglet.graphics.OrderedGroup(1))
 		self.textPercentCorrect.color = (0,0,0,255) #black
 
 		introText ='''<font face=%s size=20><b>Hello participant!</b> Welcome to <i>Adaptive Topographic Learning</i>. 
@@ -1238,15 +886,54 @@ class Gui(object):
 <br><br> After each question you will be given feedback (right or wrong). If you were wrong, the correct answer will be shown. You do not need to click it.
 <br><br>Before we begin, there is a short calibration session to get an idea about your average mouse movement. You will not be asked to find actual places, but simply need to click the marker with an arrow above it.
 <br><br><b>Please press the spacebar to start.</b></font>''' % appFont
-		self.textIntro = pyglet.text.HTMLLabel(introText, width=600, multiline=True,  x=self.width//2, y=self.height//2,  anchor_x='center', anchor_y='center')
+		with startupTimer.phase('intro text layout'):
+			self.textIntro = pyglet.text.HTMLLabel(introText, width=600, multiline=True,  x=self.width//2, y=self.height//2,  anchor_x='center', anchor_y='center',
+			                                       batch=self.introBatch, group=pyglet.graphics.OrderedGroup(2))
+		self.introImages = None
 		self.textIntro.color = (0,0,0,255)
 	   
-		endText ='''<font face=%s size=20><b>Thank you for participating!</b><br><br>
-						The results have been saved and you can now close this program.</font>''' % appFont
-						 
-		self.textEnd = pyglet.text.HTMLLabel(endText, width=600, multiline=True,  x=self.width//2, y=self.height//2,  anchor_x='center', anchor_y='center')
-		self.textEnd.color = (0,0,0,255)
+		# the end screen is only laid out when it is shown
+		self.textEnd = None
 		
+	def buildOverlays(self):
+		screen = ('v2i', (0,0, self.width,0, self.width,self.height, 0,self.height))
+		shade = ('c4f', (0.7, 0.7, 0.7, 0.9)*4)
+
+		# map with the grid on top
+		self.mapBatch = pyglet.graphics.Batch()
+		self.mapSprite = pyglet.sprite.Sprite(self.imgMap, batch=self.mapBatch, group=pyglet.graphics.OrderedGroup(0))
+		self.mapBatch.add(4, GL_QUADS, OverlayGroup(1, self.grid), screen,
+		                  ('t2f', (0,0, self.gridWidth,0, self.gridWidth,self.gridHeight, 0,self.gridHeight)), ('c4f', (1.0, 1.0, 1.0, 0.3)*4))
+
+		# grey shade over the map during calibration
+		self.calibBatch = pyglet.graphics.Batch()
+		self.calibBatch.add(4, GL_QUADS, OverlayGroup(0), screen, shade)
+
+		self.hintBatch = pyglet.graphics.Batch()
+		self.hintQuad = self.hintBatch.add(4, GL_QUADS, OverlayGroup(0), ('v2i/dynamic', (0,)*8), ('c4f', (0.1, 0.7, 0.7, 0.4)*4))
+		self.updateHintQuad()
+
+		# the top bar, the score label is added to the batch when it is created
+		self.guiBatch = pyglet.graphics.Batch()
+		(u1, v1, r1, u2, v2, r2, u3, v3, r3, u4, v4, r4) = self.texTopbar.tex_coords
+		(tx0, tx1, ty0, ty1) = (u1+0.1,u3-0.1, v1, v3)		
+		n = 20
+		self.guiBatch.add(4, GL_QUADS, OverlayGroup(0, self.texTopbar),
+		                  ('v2i', (-10,self.height-69+n, self.width+10,self.height-69+n, self.width+10,self.height+n, 0,self.height+n)),
+		                  ('t2f', (tx0,ty0,tx1,ty0,tx1,ty1,tx0,ty1)), ('c4f', (1.0, 1.0, 1.0, 1.0)*4))
+
+		# intro and end screen: the map under a shade, with their text and images on top
+		self.introBatch = pyglet.graphics.Batch()
+		self.endBatch = pyglet.graphics.Batch()
+		self.screenSprites = []
+		for batch in (self.introBatch, self.endBatch):
+			self.screenSprites.append(pyglet.sprite.Sprite(self.imgMap, batch=batch, group=pyglet.graphics.OrderedGroup(0)))
+			batch.add(4, GL_QUADS, OverlayGroup(1), screen, shade)
+
+	def updateHintQuad(self):
+		(minX, minY, maxX, maxY) = self.hintArea
+		self.hintQuad.vertices[:] = (minX,minY, maxX,minY, maxX,maxY, minX,maxY)
+
 	# Load the sprites of the placemarkers into a batch
 	def loadPlaceMarkers(self, mapPlaces):
 		for place in mapPlaces:
@@ -1261,15 +948,17 @@ class Gui(object):
 			self.calibRadii.append(newRadius)
 		
 	def createMarker(self, px, py, size, markerBatch):
-		newMarker = pyglet.sprite.Sprite(self.imgPlaceMarker, x=px, y=py, batch=markerBatch)
-		newMarker.scale = size
+		# marker and radius share the atlas, so they are drawn in the order they are created
 		newRadius = pyglet.sprite.Sprite(self.imgPlaceRadius, x=px, y=py, batch=markerBatch)
 		newRadius.scale = 0.65
 		newRadius.opacity = 180	
+		newMarker = pyglet.sprite.Sprite(self.imgPlaceMarker, x=px, y=py, batch=markerBatch)
+		newMarker.scale = size
 		return (newMarker, newRadius)
 			
 	def updateScoreFeedback(self, num, percentage):
 		self.textPercentCorrect.text = "Of the last %d places, you got %d%% right." % (num, percentage)
+		self.dirty = True
 	
 	def setHintArea(self, px, py):
 		# get 'box' p is in
@@ -1286,26 +975,16 @@ class Gui(object):
 		
 		self.hintArea = (pbx*sq-4*sq+xShift*sq, pby*sq-4*sq+yShift*sq, pbx*sq+4*sq+xShift*sq, pby*sq+4*sq+yShift*sq)
 		#print self.hintArea, px, py
+		self.updateHintQuad()
+		self.dirty = True
 		
 	## DRAWING
 	
 	def drawMap(self):
-		self.imgMap.blit(0, 0)
-		
-		glEnable(GL_TEXTURE_2D)
-		glBindTexture(GL_TEXTURE_2D, self.grid.id)
-		
-		glColor4f(1.0, 1.0, 1.0, 0.3)
-		pyglet.graphics.draw( 4, pyglet.gl.GL_QUADS, ('v2i',( 0,0, self.width,0, self.width,self.height, 0,self.height)),
-																		   ('t2f', (0,0, self.gridWidth,0, self.gridWidth,self.gridHeight, 0,self.gridHeight)))
-		glColor4f(1.0, 1.0, 1.0, 1.0)
-		glDisable(GL_TEXTURE_2D)
+		self.mapBatch.draw()
 	
 	def drawHintArea(self):
-		(minX, minY, maxX, maxY) = self.hintArea
-		glColor4f(0.1, 0.7, 0.7, 0.4)
-		pyglet.graphics.draw( 4, pyglet.gl.GL_QUADS, ('v2i',( minX,minY, maxX,minY, maxX,maxY, minX,maxY)) )
-		glColor4f(1.0, 1.0, 1.0, 1.0)		
+		self.hintBatch.draw()
 	
 	def drawMarkers(self):
 		self.placeMarkersBatch.draw()
@@ -1320,54 +999,38 @@ class Gui(object):
 		self.markerWrong.draw()	
 	
 	def drawCalibBackground(self):
-		glColor4f(0.7, 0.7, 0.7, 0.9)
-		pyglet.graphics.draw( 4, pyglet.gl.GL_QUADS, ('v2i',( 0,0, self.width,0, self.width,self.height, 0,self.height)) )
-		glColor4f(1.0, 1.0, 1.0, 1.0)	
+		self.calibBatch.draw()
 	
 	def drawGuiElements(self):
-
-		glEnable(GL_TEXTURE_2D)
-		
-		# draw the top bar
-		glBindTexture(GL_TEXTURE_2D, self.texTopbar.id)
-		(u1, v1, r1, u2, v2, r2, u3, v3, r3, u4, v4, r4) = self.texTopbar.tex_coords
-		(tx0, tx1, ty0, ty1) = (u1+0.1,u3-0.1, v1, v3)		
-		
-		#pyglet.graphics.draw( 3, pyglet.gl.GL_TRIANGLES, ('v2i', (10,10, 70,10, 70,70)), ('c3i', (0,255,0, 255,0,0,0,0,255)))#('t2f', (0.0,0.0, 0.0,1.0, 1.0,1.0)) )
-		n = 20
-		pyglet.graphics.draw( 4, pyglet.gl.GL_QUADS, ('v2i', (-10,self.height-69+n, self.width+10,self.height-69+n, self.width+10,self.height+n, 0,self.height+n)),
-		                                                                   ('t2f', (tx0,ty0,tx1,ty0,tx1,ty1,tx0,ty1)) )
-
-		glColor4f(1.0, 1.0, 1.0, 1.0)
-		glDisable(GL_TEXTURE_2D)
-		
-		self.textPercentCorrect.draw()		
+		self.guiBatch.draw()
 
 	def drawIntroScreen(self):
 		glClearColor(0.4, 0.4, 0.4, 1.0);
-		self.imgMap.blit(0, 0)	
-		
-		glColor4f(0.7, 0.7, 0.7, 0.9)
-		pyglet.graphics.draw( 4, pyglet.gl.GL_QUADS, ('v2i',( 0,0, self.width,0, self.width,self.height, 0,self.height)) )
-		glColor4f(1.0, 1.0, 1.0, 1.0)		
-		
-		self.textIntro.draw()
-		
-		self.imgIntro1.blit(1000, 510)
-		self.imgIntro2.blit(1000, 400)
+		if self.introImages is None:
+			self.introImages = [
+				pyglet.sprite.Sprite(self.assets.image('intro_click'), x=1000, y=510, batch=self.introBatch, group=pyglet.graphics.OrderedGroup(3)),
+				pyglet.sprite.Sprite(self.assets.image('intro_arrow'), x=1000, y=400, batch=self.introBatch, group=pyglet.graphics.OrderedGroup(3))]
+		self.introBatch.draw()
 		
 	def drawEndScreen(self):
 		glClearColor(0.4, 0.4, 0.4, 1.0);
-		self.imgMap.blit(0, 0)	
+		if self.textEnd is None:
+			self.createEndText()
+		self.endBatch.draw()
 		
-		glColor4f(0.7, 0.7, 0.7, 0.9)
-		pyglet.graphics.draw( 4, pyglet.gl.GL_QUADS, ('v2i',( 0,0, self.width,0, self.width,self.height, 0,self.height)) )
-		self.textEnd.draw()	
+	def createEndText(self):
+		endText ='''<font face=%s size=20><b>Thank you for participating!</b><br><br>
+						The results have been saved and you can now close this program.</font>''' % appFont
+						 
+		self.textEnd = pyglet.text.HTMLLabel(endText, width=600, multiline=True,  x=self.width//2, y=self.height//2,  anchor_x='center', anchor_y='center',
+		                                     batch=self.endBatch, group=pyglet.graphics.OrderedGroup(2))
+		self.textEnd.color = (0,0,0,255)
 		
 	## UPDATING
 
 	def setClickedMarker(self, correct, placeIdx, px, py, size):
 		self.placeMarkers[placeIdx].visible = False
+		self.dirty = True
 
 		if correct:
 			self.changeMarker(self.markerCorrect, px, py, size)
@@ -1381,19 +1044,62 @@ class Gui(object):
 		
 	def unsetClickedMarker(self, correct, placeIdx):
 		self.placeMarkers[placeIdx].visible = True
+		self.dirty = True
 		if correct:
 			self.markerCorrect.visible = False
 		else:
 			self.markerWrong.visible = False
 
+learnerStoreFile = os.path.join('results', 'learners.db')
+
+# The experimenter confirms that the learner id belongs to this subject before their memory is
+# loaded into the session, so a reused id does not mix two participants. A new id needs nothing.
+def confirmLearner(learner):
+	from learnerstore import LearnerStore
+	store = LearnerStore(learnerStoreFile)
+	try:
+		studied = store.numPlaces(learner)
+	finally:
+		store.close()
+	if studied == 0:
+		return True
+	answer = raw_input('Learner %s studied %d places in earlier sessions. Continue their memory? [y/N] ' % (learner, studied))
+	return answer.strip().lower() in ('y', 'yes')
+
 # Run program
 if __name__ == '__main__':
+	args = sys.argv[1:]
+	if '--startup-times' in args:
+		# print where start-up time went
+		startupTimer.verbose = True
+		args.remove('--startup-times')
+	if '--redraw-on-change' in args:
+		# only redraw when something on screen changed
+		pyglet.app.event_loop = RedrawEventLoop()
+		args.remove('--redraw-on-change')
+	server = None
+	for arg in list(args):
+		if arg.startswith('--server='):
+			# let a session service make the decisions
+			from sessions import connect
+			server = connect(arg[len('--server='):])
+			args.remove(arg)
+	learner = None
+	for arg in list(args):
+		if arg.startswith('--learner='):
+			# keep the memory of this learner across sessions, see learnerstore.py
+			learner = arg[len('--learner='):]
+			args.remove(arg)
+
 	spacingFirst = True
-	if len(sys.argv) > 1:
-		if sys.argv[1] == 'A':
+	if len(args) > 0:
+		if args[0] == 'A':
 			spacingFirst = False
 
-	subjectname = raw_input('Please type you name and press Enter: ')
-	window = App(subjectname, spacingFirst, 1194, 760, caption='Adaptive Topographic Learning', vsync=False)
+	with startupTimer.paused():
+		subjectname = raw_input('Please type you name and press Enter: ')
+		if learner is not None and server is None and not confirmLearner(learner):
+			sys.exit('Not continuing learner %s, start again with another --learner id' % learner)
+	window = App(subjectname, spacingFirst, 1194, 760, caption='Adaptive Topographic Learning', vsync=False, server=server, learner=learner)
 	pyglet.clock.schedule_interval(window.update, updateFreq)
 	pyglet.app.run()
@@ -0,0 +1,117 @@
+# Copyright Menno Nijboer, 2015
+
+# Recording of the mouse path of every trial. Every motion event is stored as (time, x, y) in
+# a preallocated ring buffer, so the input path does not allocate. When a trial ends its part of
+# the buffer is appended to results/<prefix>_paths.bin.
+#
+# The file starts with the magic 'TOPOPTH1' and holds a record per trial: a header (kind,
+# trial index, start time, number of samples, number of samples dropped because the ring
+# buffer overflowed; struct '<iidII') followed by the times (float64, seconds since the start
+# of the recording), x and y (int16) of the samples, each as a little endian array.
+
+from __future__ import division
+
+import os
+import struct
+import timeit
+
+import numpy as np
+
+magic = b'TOPOPTH1'
+recordHeader = struct.Struct('<iidII')
+
+# kinds of trial
+TRIALPATH = 0
+CALIBPATH = 1
+
+class TrajectoryRecorder(object):
+	def __init__(self, capacity=1 << 16, clock=timeit.default_timer):
+		self.clock = clock
+		self.start = clock()
+		self.capacity = capacity
+		self.times = np.zeros(capacity, dtype='<f8')
+		self.xs = np.zeros(capacity, dtype='<i2')
+		self.ys = np.zeros(capacity, dtype='<i2')
+		self.count = 0       # samples recorded since the start
+		self.trialFirst = 0  # first sample of the current trial
+		self.trialStart = 0.0
+
+	def add(self, x, y):
+		i = self.count % self.capacity
+		self.times[i] = self.clock() - self.start
+		self.xs[i] = x
+		self.ys[i] = y
+		self.count += 1
+
+	def beginTrial(self):
+		self.trialFirst = self.count
+		self.trialStart = self.clock() - self.start
+
+	# the samples since beginTrial, as copies: (times, xs, ys, dropped)
+	def trialSamples(self):
+		first = max(self.trialFirst, self.count - self.capacity)
+		dropped = first - self.trialFirst
+		idx = np.arange(first, self.count) % self.capacity
+		return (self.times[idx], self.xs[idx], self.ys[idx], dropped)
+
+# Appends the paths of trials to a _paths.bin file. As with the TrialLogWriter of results.py the
+# file is flushed (and synced to disk) every batchSize trials and when it is closed, not on the
+# frame of every click.
+class PathWriter(object):
+	def __init__(self, filename, batchSize=5):
+		self.filename = filename
+		self.batchSize = batchSize
+		self.pending = 0
+		self.file = open(filename, 'wb')
+		self.file.write(magic)
+		self.flush()
+
+	def write(self, kind, trial, recorder):
+		(times, xs, ys, dropped) = recorder.trialSamples()
+		self.file.write(recordHeader.pack(kind, trial, recorder.trialStart, len(times), dropped))
+		self.file.write(times.tobytes() + xs.tobytes() + ys.tobytes())
+		self.pending += 1
+		if self.pending >= self.batchSize:
+			self.flush()
+
+	def flush(self):
+		self.file.flush()
+		os.fsync(self.file.fileno())
+		self.pending = 0
+
+	def close(self):
+		if not self.file.closed:
+			self.flush()
+			self.file.close()
+
+# The path of one trial
+class TrialPath(object):
+	def __init__(self, kind, trial, start, times, xs, ys, dropped):
+		self.kind = kind
+		self.trial = trial
+		self.start = start
+		self.times = times
+		self.xs = xs
+		self.ys = ys
+		self.dropped = dropped
+
+# all paths of a _paths.bin file, a record cut off by a crash is ignored
+def readPaths(filename):
+	f = open(filename, 'rb')
+	data = f.read()
+	f.close()
+	if data[:len(magic)] != magic:
+		raise ValueError('%s is not a mouse path file' % filename)
+	paths = []
+	pos = len(magic)
+	while pos + recordHeader.size <= len(data):
+		(kind, trial, start, n, dropped) = recordHeader.unpack_from(data, pos)
+		pos += recordHeader.size
+		if pos + 12*n > len(data):
+			break
+		times = np.frombuffer(data, dtype='<f8', count=n, offset=pos)
+		xs = np.frombuffer(data, dtype='<i2', count=n, offset=pos + 8*n)
+		ys = np.frombuffer(data, dtype='<i2', count=n, offset=pos + 10*n)
+		paths.append(TrialPath(kind, trial, start, times, xs, ys, dropped))
+		pos += 12*n
+	return paths
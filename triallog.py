@@ -0,0 +1,122 @@
+# Copyright Menno Nijboer, 2015
+
+from __future__ import division
+
+import numpy as np
+
+# column types in order of promotion: a column starts with the type of the first value it gets,
+# and is widened when a value does not fit (an int column becomes float when a float arrives).
+# Values read back have the same python type as the values that went in.
+def columnType(value):
+	if isinstance(value, (bool, np.bool_)):
+		return np.bool_
+	if isinstance(value, (int, np.integer)):
+		return np.int64
+	return np.float64
+
+promotion = [np.bool_, np.int64, np.float64]
+
+# Completed trials stored as one typed array per field instead of a TrialResult object per
+# trial. Supports len(), iteration, indexing (log[-1] gives an accessor with the attributes of
+# a TrialResult) and slicing (log[2:] gives a TrialLog sharing the arrays of this one).
+class TrialLog(object):
+	fields = ['type', 'condition', 'placeIndex', 'placeName', 'result', 'hintUsed', 'RT', 'avgVelocity', 'distanceTraveled', 'avgSpeed', 'shortestPath', 'timeStamp']
+
+	def __init__(self, capacity=64):
+		self.length = 0
+		self.capacity = capacity
+		self.columns = {}
+		# place names are stored once, the placeName column holds their ids
+		self.names = []
+		self.nameIds = {}
+		self.isView = False
+
+	# same arguments as the TrialResult constructor
+	def append(self, type, condition, placeIdx, placeName, result, hintUsed, rt, velocity, distance, shortest, timestamp):
+		if self.isView:
+			raise TypeError('cannot append to a slice of a TrialLog')
+		if rt > 0:
+			avgSpeed = distance / rt
+		else:
+			avgSpeed = 1000
+		nameId = self.nameIds.get(placeName)
+		if nameId is None:
+			nameId = len(self.names)
+			self.names.append(placeName)
+			self.nameIds[placeName] = nameId
+
+		if self.length == self.capacity:
+			self.capacity *= 2
+			for name in self.columns:
+				old = self.columns[name]
+				self.columns[name] = np.zeros(self.capacity, dtype=old.dtype)
+				self.columns[name][:self.length] = old[:self.length]
+
+		values = (type, condition, placeIdx, nameId, result, hintUsed, rt, velocity, distance, avgSpeed, shortest, timestamp)
+		for (name, value) in zip(self.fields, values):
+			self.store(name, value)
+		self.length += 1
+
+	def store(self, name, value):
+		col = self.columns.get(name)
+		valueType = columnType(value)
+		if col is None:
+			col = self.columns[name] = np.zeros(self.capacity, dtype=valueType)
+		elif promotion.index(valueType) > promotion.index(col.dtype.type):
+			col = self.columns[name] = col.astype(valueType)
+		col[self.length] = value
+
+	def __len__(self):
+		return self.length
+
+	def __iter__(self):
+		for i in range(self.length):
+			yield TrialView(self, i)
+
+	def __getitem__(self, key):
+		if isinstance(key, slice):
+			view = TrialLog.__new__(TrialLog)
+			(start, stop, step) = key.indices(self.length)
+			view.length = len(range(start, stop, step))
+			view.capacity = view.length
+			view.columns = dict((name, col[:self.length][key]) for (name, col) in self.columns.items())
+			view.names = self.names
+			view.nameIds = self.nameIds
+			view.isView = True
+			return view
+		if key < 0:
+			key += self.length
+		if key < 0 or key >= self.length:
+			raise IndexError('trial index out of range')
+		return TrialView(self, key)
+
+	# the values of a field as a numpy array (a view, do not modify it). A field without trials
+	# gives an empty array, a name that is not a field raises KeyError.
+	def column(self, name):
+		col = self.columns.get(name)
+		if col is None:
+			if name not in self.fields:
+				raise KeyError('no field %r in a TrialLog' % (name,))
+			return np.zeros(0)
+		return col[:self.length]
+
+	def placeNames(self):
+		return [self.names[i] for i in self.column('placeName')]
+
+	def value(self, name, i):
+		if name == 'placeName':
+			return self.names[self.columns[name][i]]
+		return self.columns[name][i].item()
+
+# A single trial of a TrialLog, with the attributes of a TrialResult
+class TrialView(object):
+	__slots__ = ('log', 'index')
+
+	def __init__(self, log, index):
+		self.log = log
+		self.index = index
+
+	def __getattr__(self, name):
+		if name in TrialLog.fields:
+			return self.log.value(name, self.index)
+		raise AttributeError(name)
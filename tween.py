@@ -0,0 +1,54 @@
+# Copyright Menno Nijboer, 2015
+
+from __future__ import division
+
+# An animation of a given length. Every tick its time advances by dt and update(time) is
+# called, until the time passes the length: then the tween stops and end() is called.
+class Tween(object):
+	def __init__(self, length, update, end=None):
+		self.length = length
+		self.update = update
+		self.end = end
+		self.time = 0.0
+
+# Ticks the running tweens only, so animations that are not shown cost nothing
+class TweenScheduler(object):
+	def __init__(self):
+		self.active = []
+
+	# (re)start a tween, optionally part way through
+	def start(self, tween, time=0.0):
+		tween.time = time
+		if tween not in self.active:
+			self.active.append(tween)
+
+	def stop(self, tween):
+		if tween in self.active:
+			self.active.remove(tween)
+
+	def running(self, tween):
+		return tween in self.active
+
+	def tick(self, dt):
+		for tween in list(self.active):
+			tween.time += dt
+			if tween.time > tween.length:
+				self.active.remove(tween)
+				if tween.end is not None:
+					tween.end()
+			else:
+				tween.update(tween.time)
+
+	def __len__(self):
+		return len(self.active)
+
+# Set an attribute only when its value changes: every write to a sprite or label property
+# makes pyglet update its vertices. Returns whether the value was written.
+def setChanged(obj, name, value):
+	current = getattr(obj, name)
+	if isinstance(current, list):
+		current = tuple(current)
+	if current == value:
+		return False
+	setattr(obj, name, value)
+	return True